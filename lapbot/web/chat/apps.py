@@ -1,23 +1,121 @@
+from pathlib import Path
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import find_commands
+from django.db import DatabaseError
 import os
+import sys
+import threading
+
+# Lệnh manage.py cần catalog lúc khởi động: server và các lệnh của app chat (bench / check...),
+# trừ những lệnh tự tạo / đọc catalog. Các lệnh khác (migrate, test, collectstatic...) bỏ qua bước nạp catalog.
+SERVING_COMMANDS = {'runserver', 'shell'}
+NO_CATALOG_COMMANDS = {'make_catalog_fixture'}
+
+
+def serves_chat():
+    """False khi process là một lệnh manage.py không phục vụ chat (không cần nạp catalog, snapshot...)."""
+    if os.path.basename(sys.argv[0]) not in ('manage.py', 'django-admin', '__main__.py') or len(sys.argv) < 2:
+        return True  # uvicorn / gunicorn / script tự gọi django.setup()
+    command = sys.argv[1]
+    chat_commands = set(find_commands(Path(__file__).parent / 'management')) - NO_CATALOG_COMMANDS
+    return command in SERVING_COMMANDS or command in chat_commands
+
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
 
     def ready(self):
+        serving = serves_chat()
+        if serving:
+            try:
+                self.load_catalog()
+            except DatabaseError as e:
+                # Database mới chưa có laptop_info (vd trước make_catalog_fixture): vẫn khởi động,
+                # các tính năng cần catalog chạy lại được sau khi nạp catalog và khởi động lại
+                from . import catalog_index, name_index
+                catalog_index.catalog = name_index.index = None
+                print(f"Chat catalog unavailable, starting without it: {e}")
+        else:
+            print(f"Skip loading chat catalog for `{sys.argv[1]}`.")
+
         # Import service ở đây để đảm bảo model được tải khi server khởi động
+        # (model joblib chỉ thực sự được đọc ở lần dùng đầu tiên)
         from . import predictor_service
-        predictor_service.default_imputation_values = predictor_service.calculate_default_values()
         predictor_service.predictor = predictor_service.PricePredictor(predictor_service.default_imputation_values)
-        print("Importing predictor service to load ML model...")
+
+        # Giá dự đoán cho toàn catalog (deal score): chỉ đọc, tính lại bằng lệnh refresh_price_catalog
+        if serving and settings.CHAT_PRICE_CATALOG:
+            from . import price_catalog
+            price_catalog.load_at_startup()
 
         from . import intent_classifier
-        intent_classifier.classifier = intent_classifier.IntentClassifier()
+        intent_classifier.classifier = intent_classifier.IntentClassifier(
+            cache_size=settings.CHAT_INTENT_CACHE_SIZE,
+            batch_window=settings.CHAT_INTENT_BATCH_WINDOW_MS / 1000,
+            max_batch=settings.CHAT_INTENT_BATCH_MAX,
+        )
+
+        if serving and settings.CHAT_PRELOAD_MODELS:
+            # Tải model ở thread nền: worker nhận request ngay, request đầu tiên ít phải chờ hơn
+            threading.Thread(target=lambda: (predictor_service.predictor.model, intent_classifier.classifier.model),
+                             name='chat-model-preload', daemon=True).start()
 
         from . import llms_service
-        llms_service.llms = llms_service.get_llm_service('gemini-2.5-flash')
+        model_aliases = [alias.strip() for alias in settings.CHAT_LLM_MODEL.split(',') if alias.strip()]
+        if len(model_aliases) > 1:
+            llms_service.llms = llms_service.get_llm_router(
+                model_aliases,
+                routes=llms_service.parse_routes(settings.CHAT_LLM_ROUTES),
+                hedge_quantile=settings.CHAT_LLM_HEDGE_QUANTILE,
+                hedge_delay=settings.CHAT_LLM_HEDGE_DELAY,
+                window=settings.CHAT_LLM_STATS_WINDOW,
+                failure_threshold=settings.CHAT_LLM_BREAKER_FAILURES,
+                cooldown=settings.CHAT_LLM_BREAKER_COOLDOWN,
+            )
+        else:
+            llms_service.llms = llms_service.get_llm_service(model_aliases[0])
+        if settings.CHAT_LLM_CACHE_SIZE > 0:
+            backend = caches[settings.CHAT_LLM_CACHE_ALIAS] if settings.CHAT_LLM_CACHE_ALIAS else None
+            llms_service.llms = llms_service.CachedLLMService(llms_service.llms, max_size=settings.CHAT_LLM_CACHE_SIZE,
+                                                              ttl=settings.CHAT_LLM_CACHE_TTL, backend=backend)
         print("Connect to LLMs...")
 
-        from . import database_schema
-        database_schema.get_database_schema_and_choices()
\ No newline at end of file
+        from . import single_flight
+        if settings.CHAT_SINGLE_FLIGHT:
+            backend = caches[settings.CHAT_SINGLE_FLIGHT_ALIAS] if settings.CHAT_SINGLE_FLIGHT_ALIAS else None
+            single_flight.coalescer = single_flight.SingleFlight(backend=backend, wait_timeout=settings.CHAT_SINGLE_FLIGHT_WAIT,
+                                                                 result_ttl=settings.CHAT_SINGLE_FLIGHT_RESULT_TTL)
+
+        from . import rendering
+        if settings.CHAT_RENDER_CACHE_ALIAS:
+            rendering.fragments = rendering.FragmentCache(caches[settings.CHAT_RENDER_CACHE_ALIAS],
+                                                          ttl=settings.CHAT_RENDER_CACHE_TTL)
+
+        from . import serialization
+        serialization.encoder = serialization.get_encoder(settings.CHAT_JSON_ENCODER)
+
+        # form_predict truy vấn database lúc import nếu chưa có choices. Import sẵn ở đây (context sync),
+        # nếu không lần import đầu tiên dưới ASGI sẽ nằm trong event loop và bị Django chặn.
+        if serving:
+            from . import form_predict
+
+    def load_catalog(self):
+        from . import catalog_index
+        rows = None
+        if settings.CHAT_CATALOG_INDEX:
+            rows = catalog_index.refresh().rows
+
+        # Giá trị mặc định, schema context và choices: đọc từ snapshot nếu version của catalog không đổi
+        # (version là một query aggregate, các dòng chỉ được dùng lại khi phải build snapshot)
+        from . import startup_snapshot
+        snapshot = startup_snapshot.load_or_build(rows)
+        if rows is not None:
+            catalog_index.catalog.checksum = snapshot['checksum']
+
+        # Tìm laptop theo tên (không cần LLM), dựng từ catalog index nếu có
+        if settings.CHAT_NAME_INDEX:
+            from . import name_index
+            name_index.refresh(catalog_index.catalog)
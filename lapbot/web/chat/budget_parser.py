@@ -0,0 +1,262 @@
+import re
+import threading
+from .text_utils import fold
+
+# ==============================================================================
+# TRÍCH XUẤT NGÂN SÁCH BẰNG LUẬT
+# Với intent ngân sách, LLM (SYSTEM_CONTENT_EXTRACT_BUDGET) chỉ dùng để đọc ra
+# {"budget_min", "budget_max"} từ những câu như "tầm 15tr", "dưới 20 triệu",
+# "từ 10 đến 15 củ". parse_budget() đọc các dạng phổ biến bằng regex và trả về kèm
+# độ tự tin (0 -> 1); chỉ khi độ tự tin thấp (không có số tiền, nhiều số tiền rời rạc,
+# số tiền kiểu trả góp / bù thêm...) mới cần gọi LLM.
+# Kết quả theo đúng quy ước của prompt:
+# - một con số: budget_min = budget_max
+# - chỉ có giới hạn trên: budget_min = None; chỉ có giới hạn dưới: budget_max = None
+# ==============================================================================
+
+MILLION = 1_000_000
+
+# Đơn vị cho thấy con số không phải tiền ("14 inch", "16gb", "2 năm")
+OTHER_UNITS = r'''(?:inch|in|gb|tb|mb|hz|kg|g|cm|mm|nam|thang|tuoi|core|nhan|luong|w|mah|%|"|')'''
+
+# Văn bản đã bỏ dấu (xem fold), nên các từ khóa cũng viết không dấu
+AMOUNT_PATTERN = re.compile(r'''
+    (?<![\w.,])
+    (?P<number>\d+(?:[.,]\d+)*)
+    (?:\s*(?:
+        (?P<million>trieu|tr|cu)
+        (?:
+            \s*(?P<half>ruoi)\b                                                # "15 triệu rưỡi"
+            | \s*(?P<part>\d{1,3})\s*(?:(?P<hundreds>tram)|nghin|ngan|k)\b     # "15 triệu 5 trăm", "15tr 500k"
+            | \s*(?P<tail>\d{1,3})(?![\d.,]|\s*(?:trieu|tr|cu|ty|ti|m|vnd|dong|d)\b)  # "15tr5", "20 triệu 5"
+        )?
+        | (?<=\d)(?P<short_million>m)
+        | (?P<billion>ty|ti)
+        | (?P<thousand>k|nghin|ngan)
+        | (?P<dong>vnd|dong|d)
+    ))?
+    (?!\w|[.,]\d)
+    (?!\s*''' + OTHER_UNITS + r''')
+''', re.VERBOSE)
+
+# Phần lẻ đứng ngay sau "triệu" mà AMOUNT_PATTERN không đọc được ("15 triệu 1234", "15tr rưỡi nữa"):
+# số tiền đọc ra có thể sai, nên để LLM quyết định
+LEFTOVER_PATTERN = re.compile(r'^\s*(?:ruoi\b|\d(?![\d.,]*\s*' + OTHER_UNITS + r'))')
+
+# Hai số tiền nối với nhau thành một khoảng ("10 - 15tr", "từ 10 đến 15 củ")
+RANGE_JOINER = re.compile(r'^\s*(?:-|–|~|den|toi|cho den|va)\s*$')
+
+UPPER_CUES = ['duoi', 'khong qua', 'ko qua', 'k qua', 'khong vuot qua', 'toi da', 'max', 'nho hon', 'it hon',
+              'chua toi', 'chua den', 'khong hon', '<', '<=']
+LOWER_CUES = ['tren', 'hon', 'tu', 'toi thieu', 'it nhat', 'lon hon', 'min', '>', '>=']
+APPROX_CUES = ['tam', 'khoang', 'tren duoi', 'co', 'quanh', 'loanh quanh', 'xap xi', 'chung', 'gia', 'ngan sach', 'budget',
+               'muc', 'tien', '~']
+UPPER_SUFFIXES = ['do lai', 'tro lai', 'tro xuong', 'do xuong', 'don lai']
+LOWER_SUFFIXES = ['tro len', 'do len']
+
+# Số tiền không phải ngân sách mua máy: trả góp, bù thêm, chênh lệch, lương...
+AMBIGUOUS_WORDS = re.compile(r'\b(?:tra gop|moi thang|1 thang|/thang|bu them|bu|them|chenh|tang|giam|luong|'
+                             r'tra truoc|coc|khong phai|hay|hoac|so voi|len doi|thu cu)\b')
+
+# Số tiền hợp lý cho một chiếc laptop
+MIN_PLAUSIBLE = 1 * MILLION
+MAX_PLAUSIBLE = 500 * MILLION
+
+PREFIX_WINDOW = 25
+SUFFIX_WINDOW = 12
+# Số không có đơn vị chỉ được tính khi từ khóa đứng ngay trước ("tầm 15", "giá: 15")
+BARE_CUE_DISTANCE = 3
+
+
+def cue_pattern(words):
+    return re.compile(r'(?:^|(?<=[\s\d(]))(?:' + '|'.join(re.escape(word) for word in words) + r')(?=$|[\s\d:=])')
+
+
+UPPER_PATTERN = cue_pattern(UPPER_CUES)
+LOWER_PATTERN = cue_pattern(LOWER_CUES)
+APPROX_PATTERN = cue_pattern(APPROX_CUES)
+UPPER_SUFFIX_PATTERN = re.compile(r'^\s*(?:' + '|'.join(UPPER_SUFFIXES) + r')\b')
+LOWER_SUFFIX_PATTERN = re.compile(r'^\s*(?:' + '|'.join(LOWER_SUFFIXES) + r')\b')
+
+
+def to_float(number, decimal):
+    """
+    '12.000.000' -> 12000000; '15.5' / '15,5' -> 15.5.
+    Một dấu phân cách là dấu thập phân nếu đơn vị cho phép (triệu, tỷ) hoặc phía sau không đúng 3 chữ số.
+    """
+    parts = re.split('[.,]', number)
+    if len(parts) == 2 and (decimal or len(parts[1]) != 3):
+        return float(f'{parts[0]}.{parts[1]}')
+    return float(''.join(parts))
+
+
+def read_amount(match):
+    """Giá trị (VND) và có đơn vị rõ ràng hay không, None nếu không phải số tiền."""
+    number = match.group('number')
+    if match.group('short_million'):
+        return to_float(number, decimal=True) * MILLION, True
+    if match.group('million'):
+        value = to_float(number, decimal=True) * MILLION
+        tail = match.group('tail')
+        if tail: # "15tr5" = "15 triệu 5" = 15.5 triệu
+            value += int(tail) / 10 ** len(tail) * MILLION
+        elif match.group('half'): # "15 triệu rưỡi" = 15.5 triệu
+            value += MILLION / 2
+        elif match.group('part'): # "15 triệu 5 trăm" = "15 triệu 500 nghìn" = 15.5 triệu
+            value += int(match.group('part')) * (100_000 if match.group('hundreds') else 1000)
+        return value, True
+    if match.group('billion'):
+        return to_float(number, decimal=True) * 1000 * MILLION, True
+    if match.group('thousand'):
+        return to_float(number, decimal=False) * 1000, True
+    if match.group('dong'):
+        return to_float(number, decimal=False), True
+
+    # Số không có đơn vị: "tầm 15" hiểu là triệu, "12.000.000" là VND, còn lại (vd "4060") bỏ qua
+    value = to_float(number, decimal=False)
+    if value < 1000:
+        return value * MILLION, False
+    if value >= 100_000:
+        return value, False
+    return None
+
+
+def last_cue(text):
+    """
+    Loại giới hạn của từ khóa gần số tiền nhất trong đoạn text phía trước.
+    Hai từ khóa cùng kết thúc một chỗ thì lấy từ dài hơn ("nhỏ hơn" chứ không phải "hơn").
+    Trả về (loại, số ký tự từ từ khóa tới số tiền), hoặc (None, None).
+    """
+    found = []
+    for kind, pattern in (('upper', UPPER_PATTERN), ('lower', LOWER_PATTERN), ('approx', APPROX_PATTERN)):
+        for cue in pattern.finditer(text):
+            found.append((cue.end(), -cue.start(), kind))
+    if not found:
+        return None, None
+    end, _, kind = max(found)
+    return kind, len(text) - end
+
+
+def bound_kind(text, mention):
+    """'upper' / 'lower' / 'approx' / None cho một số tiền đơn lẻ, xét cả hậu tố ("20tr đổ lại")."""
+    suffix = text[mention['end']:mention['end'] + SUFFIX_WINDOW]
+    if UPPER_SUFFIX_PATTERN.match(suffix):
+        return 'upper'
+    if LOWER_SUFFIX_PATTERN.match(suffix):
+        return 'lower'
+    return mention['cue']
+
+
+def parse_budget(message):
+    """
+    Trả về {'budget_min', 'budget_max', 'confidence'}; budget_* là None khi không đọc được.
+    """
+    text = fold(message)
+    result = {'budget_min': None, 'budget_max': None, 'confidence': 0.0}
+
+    # Các số tiền trong câu, kèm từ khóa phía trước
+    mentions = []
+    previous_end = 0
+    for match in AMOUNT_PATTERN.finditer(text):
+        amount = read_amount(match)
+        if amount is None:
+            continue
+        prefix = text[max(previous_end, match.start() - PREFIX_WINDOW):match.start()]
+        cue, distance = last_cue(prefix)
+        if not amount[1] and cue is not None and distance > BARE_CUE_DISTANCE:
+            cue = None
+        mentions.append({
+            'value': amount[0], 'explicit': amount[1], 'cue': cue,
+            'start': match.start(), 'end': match.end(),
+            'leftover': bool(match.group('million')) and bool(LEFTOVER_PATTERN.match(text[match.end():])),
+        })
+        previous_end = match.end()
+
+    # Số không đơn vị chỉ được tính khi có từ khóa ngân sách (vd "tầm 15"), hoặc nằm trong một khoảng
+    groups = []
+    for mention in mentions:
+        if groups and RANGE_JOINER.match(text[groups[-1][-1]['end']:mention['start']]) and len(groups[-1]) == 1:
+            groups[-1].append(mention)
+        else:
+            groups.append([mention])
+    groups = [group for group in groups
+              if len(group) == 2 or group[0]['explicit'] or group[0]['cue'] is not None]
+
+    kinds = [bound_kind(text, group[0]) if len(group) == 1 else None for group in groups]
+    if len(groups) == 2 and sorted(kinds, key=str) == ['lower', 'upper']:
+        # "trên 15 triệu dưới 20 triệu": một cận dưới và một cận trên
+        bounds = {kind: group[0]['value'] for kind, group in zip(kinds, groups)}
+        budget_min, budget_max = bounds['lower'], bounds['upper']
+        confidence = 0.9 if budget_min <= budget_max else 0.3
+    elif len(groups) != 1:
+        # Không có số tiền, hoặc nhiều số tiền rời rạc ("15tr hay 20tr") -> để LLM quyết định
+        result['confidence'] = 0.0 if not groups else 0.3
+        return result
+    elif len(groups[0]) == 2:
+        low, high = groups[0]
+        # "từ 10 đến 15 củ": số đầu dùng đơn vị của số sau
+        if not low['explicit'] and high['explicit'] and low['value'] >= MILLION and high['value'] >= 1000 * MILLION:
+            low['value'] *= 1000
+        budget_min, budget_max = sorted((low['value'], high['value']))
+        confidence = 0.95 if (low['explicit'] or high['explicit']) else 0.85
+    else:
+        mention, kind = groups[0][0], kinds[0]
+        value = mention['value']
+        budget_min, budget_max = {
+            'upper': (None, value),
+            'lower': (value, None),
+        }.get(kind, (value, value))
+        confidence = (0.95 if kind else 0.85) if mention['explicit'] else 0.85
+
+    values = [value for value in (budget_min, budget_max) if value is not None]
+    if any(value < MIN_PLAUSIBLE or value > MAX_PLAUSIBLE for value in values):
+        confidence = min(confidence, 0.3)
+    if AMBIGUOUS_WORDS.search(text) or any(mention['leftover'] for group in groups for mention in group):
+        confidence = min(confidence, 0.4)
+
+    result.update({
+        'budget_min': int(budget_min) if budget_min is not None else None,
+        'budget_max': int(budget_max) if budget_max is not None else None,
+        'confidence': confidence,
+    })
+    return result
+
+
+class BypassMetrics:
+    """Đếm số lần bỏ qua LLM và ước lượng thời gian tiết kiệm được."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bypassed = 0
+        self.parse_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+    def record(self, parse_seconds, llm_seconds=None):
+        with self._lock:
+            self.requests += 1
+            self.parse_seconds += parse_seconds
+            if llm_seconds is None:
+                self.bypassed += 1
+            else:
+                self.llm_calls += 1
+                self.llm_seconds += llm_seconds
+
+    def stats(self):
+        with self._lock:
+            mean_llm = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            mean_parse = self.parse_seconds / self.requests if self.requests else 0.0
+            return {
+                'requests': self.requests,
+                'bypassed': self.bypassed,
+                'bypass_rate': round(self.bypassed / self.requests, 4) if self.requests else 0.0,
+                'llm_calls': self.llm_calls,
+                'mean_llm_ms': round(mean_llm * 1000, 3),
+                'mean_parse_ms': round(mean_parse * 1000, 3),
+                # Mỗi lần bypass tiết kiệm khoảng một lần gọi LLM (theo thời gian trung bình đo được)
+                'estimated_saved_ms': round(self.bypassed * max(mean_llm - mean_parse, 0) * 1000, 1),
+            }
+
+
+metrics = BypassMetrics()
@@ -0,0 +1,204 @@
+import math
+import numpy as np
+from django.db import models
+from django.db.models import F
+from .models import LaptopInfo
+from .database_schema import NUMERIC_LOOKUPS, CATEGORICAL_LOOKUPS
+
+# ==============================================================================
+# INDEX CATALOG DẠNG CỘT TRONG BỘ NHỚ
+# Bảng laptop_info chỉ vài nghìn dòng, nên mỗi process giữ một snapshot dạng cột
+# và lọc bằng mask NumPy thay vì gửi query tới database cho mỗi lần gợi ý.
+# - Cột số (FloatField / IntegerField): mảng float64, NULL -> NaN (mọi phép so sánh với NaN
+#   đều False, giống NULL trong SQL).
+# - Cột chuỗi (CharField): mã hóa từ điển, mảng mã int32 + danh sách giá trị, NULL -> -1.
+# - Thứ tự dòng do chính database sắp xếp (CATALOG_ORDERING) lúc build, nên kết quả lọc
+#   luôn trùng thứ tự với queryset có cùng ordering.
+# Snapshot không tự cập nhật: gọi refresh() (hoặc khởi động lại server) khi catalog thay đổi.
+# ==============================================================================
+
+# Giá tăng dần, NULL xếp cuối (mặc định của Postgres), product_id để thứ tự ổn định khi trùng giá
+CATALOG_ORDERING = (F('discounted_price').asc(nulls_last=True), 'product_id')
+
+
+class UnsupportedLookup(ValueError):
+    """Field hoặc lookup mà index không xử lý được, nơi gọi nên quay về ORM."""
+
+
+class CatalogIndex:
+    def __init__(self, rows, fields):
+        """
+        :param rows: list dict (kết quả .values()) đã sắp xếp theo CATALOG_ORDERING.
+        :param fields: list model field tương ứng với các key của rows.
+        """
+        self.rows = rows
+        self.fields = {field.name: field for field in fields}
+        self.numeric = {}
+        self.categorical = {}
+        self._projections = {}
+        self._upper = {} # field -> các giá trị đã viết hoa, cho iexact / icontains / istartswith / iendswith
+        self._positions = None # product_id -> vị trí dòng, tạo ở lần lookup đầu tiên
+        self._checksum = None
+
+        for field in fields:
+            values = [row[field.name] for row in rows]
+            if isinstance(field, (models.FloatField, models.IntegerField)):
+                self.numeric[field.name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            else:
+                categories = sorted({v for v in values if v is not None})
+                codes = {value: code for code, value in enumerate(categories)}
+                self.categorical[field.name] = (
+                    np.array([-1 if v is None else codes[v] for v in values], dtype=np.int32),
+                    categories,
+                    codes,
+                )
+
+    @classmethod
+    def from_database(cls):
+        fields = [field for field in LaptopInfo._meta.concrete_fields]
+        rows = list(LaptopInfo.objects.order_by(*CATALOG_ORDERING).values(*[field.name for field in fields]))
+        print(f"Built in-memory catalog index with {len(rows)} laptops.")
+        return cls(rows, fields)
+
+    @property
+    def checksum(self):
+        """Version của catalog (xem startup_snapshot.catalog_version), query ở lần dùng đầu tiên nếu chưa được gán."""
+        if self._checksum is None:
+            from .startup_snapshot import catalog_version
+            self._checksum = catalog_version()
+        return self._checksum
+
+    @checksum.setter
+    def checksum(self, value):
+        self._checksum = value
+
+    def __len__(self):
+        return len(self.rows)
+
+    # --------------------------------------------------------------------------
+    # Chuyển giá trị giống cách ORM làm (Field.get_prep_value), để lỗi kiểu dữ liệu
+    # cũng giống hệt khi chạy query thật
+    # --------------------------------------------------------------------------
+    def _prep(self, field, lookup, value):
+        if isinstance(field, models.IntegerField) and lookup in ('gte', 'lt') and isinstance(value, float):
+            # Django làm tròn lên với gte / lt trên IntegerField (IntegerFieldFloatRounding)
+            value = math.ceil(value)
+        return field.get_prep_value(value)
+
+    def _numeric_mask(self, name, lookup, value):
+        column = self.numeric[name]
+        field = self.fields[name]
+
+        if lookup == 'isnull':
+            return np.isnan(column) if value else ~np.isnan(column)
+        if lookup == 'in':
+            values = [self._prep(field, lookup, v) for v in value if v is not None]
+            return np.isin(column, np.array(values, dtype=np.float64))
+        if lookup == 'range':
+            low, high = (self._prep(field, lookup, v) for v in value)
+            return (column >= low) & (column <= high)
+
+        value = self._prep(field, lookup, value)
+        if lookup == 'exact':
+            return column == value
+        if lookup == 'gt':
+            return column > value
+        if lookup == 'gte':
+            return column >= value
+        if lookup == 'lt':
+            return column < value
+        return column <= value
+
+    def _categorical_mask(self, name, lookup, value):
+        codes, categories, code_of = self.categorical[name]
+        field = self.fields[name]
+
+        if lookup == 'isnull':
+            return codes == -1 if value else codes != -1
+        if lookup == 'exact':
+            code = code_of.get(self._prep(field, lookup, value))
+            return codes == code if code is not None else np.zeros(len(codes), dtype=bool)
+        if lookup == 'in':
+            values = {self._prep(field, lookup, v) for v in value if v is not None}
+            # Bảng tra theo mã (nhanh hơn np.isin), phần tử cuối cho NULL (-1)
+            wanted = np.zeros(len(categories) + 1, dtype=bool)
+            wanted[[code_of[v] for v in values if v in code_of]] = True
+            return wanted[codes]
+
+        # Đánh giá điều kiện một lần trên từ điển rồi tra theo mã; phần tử cuối cho NULL (-1)
+        needle = str(self._prep(field, lookup, value)).upper()
+        if name not in self._upper:
+            self._upper[name] = [category.upper() for category in categories]
+        upper = self._upper[name]
+        if lookup == 'iexact':
+            matches = [category == needle for category in upper]
+        elif lookup == 'istartswith':
+            matches = [category.startswith(needle) for category in upper]
+        elif lookup == 'iendswith':
+            matches = [category.endswith(needle) for category in upper]
+        else:
+            matches = [needle in category for category in upper]
+        return np.array(matches + [False], dtype=bool)[codes]
+
+    def mask(self, filters):
+        """Tính mask boolean cho một dict filter kiểu Django (vd {'ram_storage__gte': 16})."""
+        result = np.ones(len(self.rows), dtype=bool)
+
+        for key, value in filters.items():
+            name, _, lookup = key.partition('__')
+            lookup = lookup or 'exact'
+
+            if value is None and lookup == 'exact':
+                # field=None trong ORM tương đương field__isnull=True
+                lookup, value = 'isnull', True
+            if lookup == 'isnull' and not isinstance(value, bool):
+                raise ValueError('The QuerySet value for an isnull lookup must be True or False.')
+
+            if name in self.numeric and lookup in NUMERIC_LOOKUPS:
+                result &= self._numeric_mask(name, lookup, value)
+            elif name in self.categorical and lookup in CATEGORICAL_LOOKUPS:
+                result &= self._categorical_mask(name, lookup, value)
+            else:
+                raise UnsupportedLookup(f"Catalog index không hỗ trợ '{key}'")
+
+        return result
+
+    def projection(self, fields):
+        """Các dòng chỉ gồm `fields`, tính một lần cho mỗi bộ field."""
+        fields = tuple(fields)
+        if fields not in self._projections:
+            self._projections[fields] = [{field: row[field] for field in fields} for row in self.rows]
+        return self._projections[fields]
+
+    def select(self, mask, fields):
+        """
+        Các dòng (chỉ gồm `fields`) thỏa mask, theo thứ tự CATALOG_ORDERING.
+        Dict trả về dùng chung với index (không copy hàng trăm dòng mỗi lần lọc):
+        nơi gọi không được sửa tại chỗ, copy những dòng cần sửa (vd trang kết quả, xem rank_page).
+        """
+        projection = self.projection(fields)
+        return [projection[idx] for idx in np.flatnonzero(mask).tolist()]
+
+    def lookup(self, product_ids, fields, mask=None):
+        """{product_id: dòng (chỉ gồm `fields`)} cho các product_id có trong catalog (và thỏa `mask` nếu có)."""
+        if self._positions is None:
+            self._positions = {row['product_id']: idx for idx, row in enumerate(self.rows)}
+        projection = self.projection(fields)
+        positions = ((product_id, self._positions[product_id]) for product_id in product_ids
+                     if product_id in self._positions)
+        return {product_id: projection[position].copy() for product_id, position in positions
+                if mask is None or mask[position]}
+
+    def values(self, filters, fields):
+        """Tương đương LaptopInfo.objects.filter(**filters).values(*fields).order_by(*CATALOG_ORDERING)."""
+        return self.select(self.mask(filters), fields)
+
+
+# Instance dùng chung, được gán trong ChatConfig.ready() (None = luôn query database)
+catalog = None
+
+
+def refresh():
+    global catalog
+    catalog = CatalogIndex.from_database()
+    return catalog
@@ -0,0 +1,133 @@
+import operator
+from collections import Counter
+from .models import LaptopInfo
+
+# ==============================================================================
+# THỐNG KÊ CATALOG TRONG MỘT LẦN DUYỆT
+# Giá trị mặc định để impute (mean / mode) và schema cho LLM (min / max / giá trị phân biệt)
+# trước đây cần khoảng 30 query riêng lẻ. CatalogStats duyệt các dòng đúng một lần và giữ
+# bảng đếm giá trị (Counter) cho từng cột; mọi thống kê đều suy ra từ bảng đếm này.
+# Khi catalog thay đổi, refresh() chỉ trừ / cộng các dòng bị thêm, xóa hoặc sửa.
+# ==============================================================================
+
+STREAM_CHUNK_SIZE = 2000
+
+STAT_FIELDS = [field.name for field in LaptopInfo._meta.concrete_fields if field.name != 'product_id']
+
+
+def stream_rows():
+    """Đọc toàn bộ catalog bằng một query, theo từng chunk."""
+    return LaptopInfo.objects.values('product_id', *STAT_FIELDS).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+
+class CatalogStats:
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.counts = {field: Counter() for field in self.fields}  # cột -> {giá trị khác NULL: số dòng}
+        self._rows = {}  # product_id -> tuple giá trị, để refresh biết dòng nào đã đổi
+
+    @classmethod
+    def from_rows(cls, rows, fields=None):
+        """Build từ các dòng dạng dict (vd từ catalog index), không query database."""
+        stats = cls(fields or STAT_FIELDS)
+        getter = operator.itemgetter(*stats.fields)
+        stats._rows = {row['product_id']: getter(row) for row in rows}
+
+        # Đếm theo cột (Counter trên cả cột nhanh hơn nhiều so với cộng từng ô)
+        for field, column in zip(stats.fields, zip(*stats._rows.values())):
+            counter = Counter(column)
+            counter.pop(None, None)
+            stats.counts[field] = counter
+        return stats
+
+    @classmethod
+    def from_database(cls):
+        """Build bằng MỘT query, đọc dần theo chunk thay vì giữ cả queryset trong bộ nhớ."""
+        return cls.from_rows(stream_rows())
+
+    def _add(self, product_id, values):
+        self._rows[product_id] = values
+        for field, value in zip(self.fields, values):
+            if value is not None:
+                self.counts[field][value] += 1
+
+    def _remove(self, product_id):
+        values = self._rows.pop(product_id)
+        for field, value in zip(self.fields, values):
+            if value is not None:
+                counter = self.counts[field]
+                counter[value] -= 1
+                if not counter[value]:
+                    del counter[value]
+
+    def refresh(self, rows):
+        """
+        Cập nhật theo catalog mới: chỉ xử lý các dòng bị thêm, xóa hoặc thay đổi.
+        Trả về số dòng đã thay đổi.
+        """
+        getter = operator.itemgetter(*self.fields)
+        new_rows = {row['product_id']: getter(row) for row in rows}
+        removed = set()
+
+        # Dòng bị xóa hoặc bị sửa: trừ giá trị cũ
+        for product_id in list(self._rows):
+            if new_rows.get(product_id) != self._rows[product_id]:
+                self._remove(product_id)
+                removed.add(product_id)
+
+        # Dòng mới hoặc bị sửa: cộng giá trị mới
+        added = 0
+        for product_id, values in new_rows.items():
+            if product_id not in self._rows:
+                self._add(product_id, values)
+                added += product_id not in removed
+
+        return len(removed) + added
+
+    def __len__(self):
+        return len(self._rows)
+
+    def mean(self, field):
+        counter = self.counts[field]
+        total = sum(counter.values())
+        if not total:
+            return None
+        return sum(value * count for value, count in counter.items()) / total
+
+    def mode(self, field):
+        """Giá trị xuất hiện nhiều nhất (bằng nhau thì lấy giá trị nhỏ nhất, để kết quả ổn định)."""
+        counter = self.counts[field]
+        if not counter:
+            return None
+        return min(counter.items(), key=lambda item: (-item[1], item[0]))[0]
+
+    def minimum(self, field):
+        return min(self.counts[field], default=None)
+
+    def maximum(self, field):
+        return max(self.counts[field], default=None)
+
+    def distinct(self, field):
+        """Các giá trị phân biệt, bỏ NULL và chuỗi rỗng, đã sắp xếp."""
+        return sorted(value for value in self.counts[field] if value != '')
+
+
+# Instance dùng chung: chỉ được build khi cần tính lại dữ liệu khởi động (xem startup_snapshot)
+stats = None
+
+
+def build(rows=None):
+    """
+    Thống kê từ các dòng có sẵn (nếu có), hoặc từ một query duy nhất.
+    Nếu đã có thống kê từ trước thì chỉ cập nhật các dòng thay đổi.
+    """
+    global stats
+    rows = rows if rows is not None else stream_rows()
+
+    if stats is not None:
+        changed = stats.refresh(rows)
+        print(f"Refreshed catalog stats ({changed} rows changed).")
+    else:
+        stats = CatalogStats.from_rows(rows)
+        print(f"Computed catalog stats over {len(stats)} laptops in one pass.")
+    return stats
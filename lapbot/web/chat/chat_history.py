@@ -0,0 +1,136 @@
+from django.conf import settings
+from . import catalog_index
+from .chat_service import SUGGESTED_LAPTOP_FIELDS, change_usage_alias
+from .models import ChatMessage, LaptopInfo
+
+# ==============================================================================
+# LỊCH SỬ CHAT
+# Mỗi lượt hỏi đáp là một dòng ChatMessage thay vì cả payload nằm trong session:
+# - ai_response chỉ giữ metadata của từng nhóm (persona, giá, tổng số, cursor "Xem thêm"...),
+#   list laptop gợi ý được thay bằng product_ids.
+# - Mỗi session giữ tối đa CHAT_HISTORY_MAX_MESSAGES lượt gần nhất.
+# - Trang chat chỉ hiển thị CHAT_HISTORY_PAGE_SIZE lượt cuối, các lượt cũ hơn tải thêm theo trang
+#   (HTML được cache theo từng lượt, xem chat.rendering).
+# Laptop được lấy lại từ catalog lúc hiển thị (một lần lookup cho cả trang), nên giá là giá hiện tại
+# và laptop đã bị xóa khỏi catalog sẽ không còn hiển thị.
+# ==============================================================================
+
+
+def compact_block(block):
+    """Một nhóm gợi ý: thay suggested_laptops bằng product_ids."""
+    if not isinstance(block, dict) or 'suggested_laptops' not in block:
+        return block
+    compacted = {key: value for key, value in block.items() if key != 'suggested_laptops'}
+    compacted['product_ids'] = [laptop['product_id'] for laptop in block['suggested_laptops']]
+    return compacted
+
+
+def compact(ai_response):
+    """ai_response của chat_service (một nhóm, list persona hoặc chuỗi) -> dạng lưu trữ."""
+    if isinstance(ai_response, list):
+        return [compact_block(block) for block in ai_response]
+    return compact_block(ai_response)
+
+
+def blocks(ai_response):
+    if isinstance(ai_response, list):
+        return [block for block in ai_response if isinstance(block, dict)]
+    return [ai_response] if isinstance(ai_response, dict) else []
+
+
+def fetch_laptops(product_ids):
+    """{product_id: laptop (SUGGESTED_LAPTOP_FIELDS)}; catalog index nếu có, nếu không thì một query."""
+    if catalog_index.catalog is not None:
+        return catalog_index.catalog.lookup(product_ids, SUGGESTED_LAPTOP_FIELDS)
+    return {laptop['product_id']: laptop
+            for laptop in LaptopInfo.objects.filter(pk__in=product_ids).values(*SUGGESTED_LAPTOP_FIELDS)}
+
+
+def expand_block(block, laptops):
+    if not isinstance(block, dict) or 'product_ids' not in block:
+        return block
+    expanded = {key: value for key, value in block.items() if key != 'product_ids'}
+    # Bản sao cho từng nhóm: change_usage_alias sửa dict, một laptop có thể nằm trong nhiều nhóm
+    expanded['suggested_laptops'] = change_usage_alias([dict(laptops[product_id]) for product_id in block['product_ids']
+                                                        if product_id in laptops])
+    return expanded
+
+
+def expand(messages):
+    """Dựng lại suggested_laptops cho list ChatMessage, trả về list dict như lúc hiển thị lần đầu."""
+    product_ids = {product_id for message in messages for block in blocks(message.ai_response)
+                   for product_id in block.get('product_ids', ())}
+    laptops = fetch_laptops(product_ids) if product_ids else {}
+
+    result = []
+    for message in messages:
+        ai_response = message.ai_response
+        ai_response = [expand_block(block, laptops) for block in ai_response] if isinstance(ai_response, list) \
+            else expand_block(ai_response, laptops)
+        result.append({
+            'id': message.id,
+            'user_message': message.user_message,
+            'intent_codes': message.intent_codes,
+            'intent_meanings': message.intent_meanings,
+            'ai_response': ai_response,
+        })
+    return result
+
+
+def build(session_key, response):
+    return ChatMessage(
+        session_id=session_key,
+        user_message=response['user_message'],
+        intent_codes=response['intent_codes'],
+        intent_meanings=response['intent_meanings'],
+        ai_response=compact(response.get('ai_response')),
+    )
+
+
+def session_messages(session_key):
+    return ChatMessage.objects.filter(session_id=session_key)
+
+
+def append(session_key, response):
+    """Lưu một lượt hỏi đáp ({'user_message', 'intent_codes', 'intent_meanings', 'ai_response'})."""
+    message = build(session_key, response)
+    message.save()
+    # Bỏ các lượt cũ vượt quá giới hạn: id của lượt cũ nhất còn giữ lại là mốc
+    limit = settings.CHAT_HISTORY_MAX_MESSAGES
+    if limit > 0:
+        stale = list(session_messages(session_key).order_by('-id').values_list('id', flat=True)[limit:limit + 1])
+        if stale:
+            session_messages(session_key).filter(id__lte=stale[0]).delete()
+    return message
+
+
+async def aappend(session_key, response):
+    message = build(session_key, response)
+    await message.asave()
+    limit = settings.CHAT_HISTORY_MAX_MESSAGES
+    if limit > 0:
+        stale = [message_id async for message_id in
+                 session_messages(session_key).order_by('-id').values_list('id', flat=True)[limit:limit + 1]]
+        if stale:
+            await session_messages(session_key).filter(id__lte=stale[0]).adelete()
+    return message
+
+
+def page(session_key, before=None, limit=None):
+    """
+    Các lượt hỏi đáp gần nhất (cũ -> mới) trước id `before`, tối đa `limit` lượt.
+    Trả về (list ChatMessage, id để tải trang cũ hơn hoặc None nếu hết); laptop lấy lại bằng expand().
+    """
+    limit = limit or settings.CHAT_HISTORY_PAGE_SIZE
+    messages = session_messages(session_key)
+    if before is not None:
+        messages = messages.filter(id__lt=before)
+    messages = list(messages.order_by('-id')[:limit + 1])
+
+    has_more = len(messages) > limit
+    messages = messages[:limit][::-1]
+    return messages, messages[0].id if has_more else None
+
+
+def clear(session_key):
+    session_messages(session_key).delete()
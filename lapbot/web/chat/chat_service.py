@@ -0,0 +1,807 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from django.conf import settings
+from django.db import close_old_connections
+from .models import LaptopInfo
+from .form_predict import LaptopPredictionFeaturesForm
+from .prompts import SYSTEM_CONTENT_USER_MESS_EXTRACT_AND_GEN_GROUP, SYSTEM_CONTENT_EXTRACT_BUDGET, SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE, PROMPT_TYPES
+from . import predictor_service, intent_classifier, llms_service, catalog_index, filter_compiler, ranking, budget_parser, persona_matcher, name_index, single_flight, instrumentation
+from .ranking import USAGE_KEYS
+from .llms_service import extract_json_from_string
+
+# ==============================================================================
+# SERVICE LAYER CHO CHAT
+# Các view gọi trực tiếp (in-process) thay vì POST vòng lại chính server qua HTTP.
+# Các endpoint HTTP (intent_detect, predict_price, send_message) chỉ là adapter mỏng
+# bọc quanh các service này.
+# Lưu ý: các singleton (classifier, predictor, llms) được gán trong ChatConfig.ready(),
+# nên luôn truy cập qua module lúc gọi, không import trực tiếp lúc load file.
+# Mỗi service có cặp phương thức sync / async (tiền tố `a`, vd detect / adetect):
+# bản async dùng cho các view chạy dưới ASGI, không giữ thread trong lúc chờ LLM hay DB.
+# ==============================================================================
+
+INTENT_TYPE = {
+    0: 'Ngân sách',
+    1: 'Nhu cầu sử dụng',
+    2: 'Thông số kỹ thuật'
+}
+
+SUGGESTED_LAPTOP_FIELDS = ('product_id', 'url_path', 'image', 'root_price', 'discounted_price', 'name',
+                           'laptop_sang_tao_noi_dung', 'do_hoa_ky_thuat', 'cao_cap_sang_trong',
+                           'hoc_tap_van_phong', 'mong_nhe', 'gaming')
+
+USAGE_KEYS_ALIAS = {
+    'laptop_sang_tao_noi_dung': 'Sáng tạo nội dung',
+    'do_hoa_ky_thuat': 'Đồ họa - Kỹ thuật',
+    'cao_cap_sang_trong': 'Cao cấp - Sang trọng',
+    'hoc_tap_van_phong': 'Học tập - Văn phòng',
+    'mong_nhe': 'Mỏng nhẹ',
+    'gaming': 'Gaming'
+}
+
+BUDGET_SINGLE_PRICE_RANGE = 2000000 # 2tr
+BUDGET_OPEN_PRICE_RANGE = 10000000 # 10tr
+PERSONA_PRICE_RANGE = 5000000 # 5tr
+
+# Executor dùng chung cho việc xử lý song song các persona (giới hạn số thread).
+# Task đang chạy không dừng được từ bên ngoài (Future.cancel() chỉ bỏ được task còn trong hàng đợi):
+# task quá deadline tự dừng ở bước kiểm tra kế tiếp (check_deadline), còn bước đang chạy dở
+# (một lần gọi model, một query) vẫn giữ thread tới khi xong. CHAT_PERSONA_SPARE_WORKERS thread dự phòng
+# để các task bị bỏ rơi đó không làm request mới phải xếp hàng (và hết deadline sớm hơn).
+persona_executor = ThreadPoolExecutor(max_workers=settings.CHAT_PERSONA_MAX_WORKERS + settings.CHAT_PERSONA_SPARE_WORKERS,
+                                      thread_name_prefix='chat-persona')
+
+
+class PredictionInputError(ValueError):
+    """Dữ liệu `prediction_profile` không qua được LaptopPredictionFeaturesForm."""
+
+    def __init__(self, errors):
+        super().__init__(f'Invalid prediction profile: {errors}')
+        self.errors = errors
+
+
+class DeadlineExceeded(TimeoutError):
+    """Request đã hết thời gian chờ kết quả của task: dừng trước bước tiếp theo thay vì chạy vô ích."""
+
+
+def check_deadline(deadline):
+    """`deadline` theo time.monotonic(), None = không giới hạn."""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded()
+
+
+def change_usage_alias(suggested_laptops):
+    """Đổi các cột nhu cầu (vd mong_nhe) thành list tên hiển thị (vd Mỏng nhẹ)."""
+    for idx, laptop in enumerate(suggested_laptops):
+        suggested_laptops[idx]['usage_needs'] = [USAGE_KEYS_ALIAS[key] for key in USAGE_KEYS if laptop.get(key, 0) == 1]
+
+        # Xóa các key cũ để làm sạch output
+        for key_to_remove in USAGE_KEYS:
+            suggested_laptops[idx].pop(key_to_remove, None) # .pop(key, None) sẽ không báo lỗi nếu key không tồn tại
+
+    return suggested_laptops
+
+
+def submit_to_executor(func, *args, deadline=None):
+    """
+    Đưa func vào persona_executor. Connection DB mở trong thread worker được
+    trả lại sau mỗi task, giống cách Django làm khi kết thúc một request.
+    Task nằm trong hàng đợi tới quá `deadline` thì không chạy nữa.
+    """
+    def task():
+        try:
+            check_deadline(deadline)
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return persona_executor.submit(task)
+
+
+def llm_timer(system_prompt):
+    llms = llms_service.llms
+    return instrumentation.llm_call(PROMPT_TYPES.get(system_prompt, 'other'),
+                                    getattr(llms, 'model_alias', llms.model_name))
+
+
+def parse_llm_json(response):
+    with instrumentation.stage('json_extract'):
+        return json.loads(extract_json_from_string(response))
+
+
+def invoke_llm_json(system_prompt, user_message):
+    """Gọi LLM và parse kết quả về dict/list."""
+    with llm_timer(system_prompt):
+        response = llms_service.llms.invoke(system_prompt, user_message)
+    return parse_llm_json(response)
+
+
+async def ainvoke_llm_json(system_prompt, user_message):
+    with llm_timer(system_prompt):
+        response = await llms_service.llms.ainvoke(system_prompt, user_message)
+    return parse_llm_json(response)
+
+
+class RuleFirstExtractor:
+    """
+    Trích xuất tiêu chí của tin nhắn: thử bộ parse cục bộ trước, chỉ hỏi LLM (`system_prompt`)
+    khi kết quả parse không đủ tự tin. extract / aextract chỉ khác nhau ở lần gọi LLM.
+    :param parse: hàm user_message -> dict (vd budget_parser.parse_budget).
+    :param is_confident: hàm dict -> bool, đọc ngưỡng từ settings lúc gọi.
+    :param source: module chứa `metrics` (đọc lúc gọi, các bench có thể thay metrics).
+    """
+
+    def __init__(self, parse, is_confident, source, system_prompt):
+        self.parse = parse
+        self.is_confident = is_confident
+        self.source = source
+        self.system_prompt = system_prompt
+
+    def parse_locally(self, user_message):
+        """(kết quả parse nếu đủ tự tin, ngược lại None; thời gian parse)."""
+        start = time.perf_counter()
+        parsed = self.parse(user_message)
+        parse_seconds = time.perf_counter() - start
+        if self.is_confident(parsed):
+            self.source.metrics.record(parse_seconds)
+            return parsed, parse_seconds
+        return None, parse_seconds
+
+    def record_llm(self, parse_seconds, start):
+        self.source.metrics.record(parse_seconds, time.perf_counter() - start)
+
+    def extract(self, user_message):
+        parsed, parse_seconds = self.parse_locally(user_message)
+        if parsed is not None:
+            return parsed
+
+        start = time.perf_counter()
+        response = invoke_llm_json(self.system_prompt, user_message)
+        self.record_llm(parse_seconds, start)
+        return response
+
+    async def aextract(self, user_message):
+        parsed, parse_seconds = self.parse_locally(user_message)
+        if parsed is not None:
+            return parsed
+
+        start = time.perf_counter()
+        response = await ainvoke_llm_json(self.system_prompt, user_message)
+        self.record_llm(parse_seconds, start)
+        return response
+
+
+# {'budget_min', 'budget_max'} của tin nhắn: budget_parser nếu đủ tự tin, ngược lại SYSTEM_CONTENT_EXTRACT_BUDGET
+budget_extractor = RuleFirstExtractor(
+    budget_parser.parse_budget,
+    lambda parsed: parsed['confidence'] >= settings.CHAT_BUDGET_PARSER_MIN_CONFIDENCE,
+    budget_parser, SYSTEM_CONTENT_EXTRACT_BUDGET,
+)
+# {'persona', 'filters'} của tin nhắn: persona_matcher nếu khớp rõ một persona,
+# ngược lại SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE
+usage_extractor = RuleFirstExtractor(
+    persona_matcher.match_persona,
+    lambda matched: bool(matched['persona']) and matched['confidence'] >= settings.CHAT_PERSONA_MATCHER_MIN_CONFIDENCE,
+    persona_matcher, SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE,
+)
+extract_budget, aextract_budget = budget_extractor.extract, budget_extractor.aextract
+extract_usage, aextract_usage = usage_extractor.extract, usage_extractor.aextract
+
+
+def build_budget_filters(response):
+    """Chuyển {'budget_min', 'budget_max'} của LLM thành filter theo discounted_price."""
+    min_price = response['budget_min']
+    max_price = response['budget_max']
+
+    filters = {
+        'discounted_price__gte': min_price,
+        'discounted_price__lte': max_price
+    }
+
+    if min_price == max_price:
+        filters['discounted_price__gte'] = min_price - BUDGET_SINGLE_PRICE_RANGE
+        filters['discounted_price__lte'] = max_price + BUDGET_SINGLE_PRICE_RANGE
+    if not min_price:
+        filters['discounted_price__gte'] = max_price - BUDGET_OPEN_PRICE_RANGE
+    if not max_price:
+        filters['discounted_price__lte'] = min_price + BUDGET_OPEN_PRICE_RANGE
+
+    return filters
+
+
+def named_constraints(user_message):
+    """
+    Điều kiện đi kèm tin nhắn gọi tên máy ("Asus TUF gaming dưới 25 triệu"), đọc bằng các bộ parse cục bộ
+    (không gọi LLM): dict filter để lọc kết quả tìm theo tên ({} nếu không có điều kiện nào).
+    Trả về None nếu bộ parse thấy điều kiện nhưng không đủ tự tin: nhường cho pipeline intent + LLM.
+    - Ngân sách: chỉ các cận người dùng nói ra ("dưới 25 triệu" -> <= 25tr), "tầm 20tr" -> khoảng quanh giá.
+    - Nhu cầu: chỉ các cột nhu cầu của persona (gaming = 1...), không kèm cấu hình gợi ý của persona.
+    """
+    filters = {}
+    budget = budget_extractor.parse(user_message)
+    if budget_extractor.is_confident(budget):
+        if budget['budget_min'] == budget['budget_max']:
+            filters.update(build_budget_filters(budget))
+        else:
+            if budget['budget_min'] is not None:
+                filters['discounted_price__gte'] = budget['budget_min']
+            if budget['budget_max'] is not None:
+                filters['discounted_price__lte'] = budget['budget_max']
+    elif budget['confidence'] > 0:
+        return None
+
+    usage = usage_extractor.parse(user_message)
+    if usage_extractor.is_confident(usage):
+        filters.update(dict.fromkeys(ranking.wanted_usage(usage['filters']), 1))
+    elif usage['persona']:
+        return None
+    return filters
+
+
+def parse_usage_response(response):
+    persona = response.get("persona", None)
+    filters = response.get("filters", {})
+
+    if (not persona) or (not filters):
+        raise ValueError('Không tìm được persona, hoặc không có giá trị filters.')
+
+    return persona, filters
+
+
+def apply_persona_price(filters, predict_price):
+    # Nếu có giá dự đoán hợp lệ, thêm điều kiện lọc theo giá
+    if predict_price is not None:
+        filters['discounted_price__gte'] = max(predict_price - PERSONA_PRICE_RANGE, 0) # Đảm bảo giá không bị âm
+        filters['discounted_price__lte'] = predict_price + PERSONA_PRICE_RANGE
+
+    return filters
+
+
+def valid_persona_items(response):
+    return [item for item in response if item.get("persona") and item.get("filters")]
+
+
+def filter_timeout_result(item, predict_price):
+    """Kết quả trả về cho persona không lọc kịp trước deadline."""
+    print(f"Lọc laptop cho persona '{item['persona']}' vượt quá {settings.CHAT_FILTER_DEADLINE}s.")
+    return persona_result(item, predict_price, empty_page())
+
+
+def empty_page():
+    return {'suggested_laptops': [], 'total_laptops': 0, 'next_cursor': None}
+
+
+def budget_target_price(filters):
+    """Giá mục tiêu cho nhánh ngân sách: giữa khoảng giá."""
+    return (filters['discounted_price__gte'] + filters['discounted_price__lte']) / 2
+
+
+# ------------------------------------------------------------------------------
+# Dựng kết quả từng nhánh (dùng chung cho bản sync / async, các bản này chỉ khác ở phần I/O)
+# ------------------------------------------------------------------------------
+def budget_result(filters, page):
+    return {
+        'min_price': filters['discounted_price__gte'],
+        'max_price': filters['discounted_price__lte'],
+        **page
+    }
+
+
+def usage_result(persona, page):
+    return {
+        'persona': persona,
+        **page
+    }
+
+
+def persona_request(item, predict_price):
+    """(filters, usage_keys) cho một persona: lọc quanh giá dự đoán, ưu tiên nhu cầu trong profile."""
+    filters = apply_persona_price(dict(item.get("filters") or {}), predict_price)
+    return filters, ranking.wanted_usage(filters, item.get('prediction_profile') or {})
+
+
+def persona_result(item, predict_price, page):
+    return {
+        'persona': item['persona'],
+        'general_price': predict_price,
+        **page
+    }
+
+
+def pricing_timeout_result(items):
+    print(f"Dự đoán giá vượt quá {settings.CHAT_PRICING_DEADLINE}s, bỏ qua điều kiện giá.")
+    return [None] * len(items)
+
+
+def intent_payload(user_message, intent):
+    """Phần intent của kết quả: {'intent_codes', 'intent_meanings', 'user_message'}."""
+    return {
+        'intent_codes': [one_intent['intent_code'] for one_intent in intent],
+        'intent_meanings': [one_intent['intent_meaning'] for one_intent in intent],
+        'user_message': user_message
+    }
+
+
+# ==============================================================================
+# 1. INTENT SERVICE
+# ==============================================================================
+class IntentService:
+    """Phân loại intent của tin nhắn người dùng bằng IntentClassifier."""
+
+    def detect(self, user_message):
+        """
+        Trả về list intent dạng [{'intent_code': 0, 'intent_meaning': 'Ngân sách', 'confidence': 0.93}, ...]
+        Tin nhắn rỗng / chỉ có khoảng trắng không có intent nào (không đưa vào model).
+        """
+        if self.is_empty(user_message):
+            return []
+        with instrumentation.stage('intent'):
+            return self.to_intents(intent_classifier.classifier.classify_many([user_message])[0])
+
+    async def adetect(self, user_message):
+        # Model sklearn chạy ở thread gom batch, event loop chỉ chờ Future
+        if self.is_empty(user_message):
+            return []
+        with instrumentation.stage('intent'):
+            return self.to_intents((await intent_classifier.classifier.aclassify_many([user_message]))[0])
+
+    def is_empty(self, user_message):
+        return user_message is None or not intent_classifier.normalize(user_message)
+
+    def to_intents(self, result):
+        return [
+            {'intent_code': idx, 'intent_meaning': INTENT_TYPE[idx], 'confidence': result['probabilities'][idx]}
+            for idx, label in enumerate(result['labels']) if label == 1
+        ]
+
+
+# ==============================================================================
+# 2. PRICING SERVICE
+# ==============================================================================
+class PricingService:
+    """Validate `prediction_profile` và dự đoán giá bằng PricePredictor."""
+
+    def clean(self, profile):
+        form = LaptopPredictionFeaturesForm(profile)
+
+        if not form.is_valid():
+            raise PredictionInputError(form.errors)
+
+        return form.cleaned_data
+
+    def predict(self, profile):
+        """
+        Trả về tuple (cleaned_data, predict_price).
+        """
+        cleaned_data = self.clean(profile)
+        with instrumentation.stage('predict'):
+            predict_result = predictor_service.predictor.predict(cleaned_data)
+
+        # PricePredictor trả về chuỗi khi có lỗi
+        if isinstance(predict_result, str):
+            raise RuntimeError(predict_result)
+
+        return cleaned_data, float(predict_result['predict_price'])
+
+    def predict_many(self, profiles, deadline=None):
+        """
+        Validate toàn bộ profile rồi dự đoán giá trong MỘT lần gọi model.
+        Trả về list tuple (cleaned_data, predict_price) theo đúng thứ tự đầu vào.
+        Raise DeadlineExceeded nếu đã quá `deadline` trước khi gọi model.
+        """
+        cleaned_profiles = []
+        errors = {}
+        for idx, profile in enumerate(profiles):
+            try:
+                cleaned_profiles.append(self.clean(profile))
+            except PredictionInputError as e:
+                errors[idx] = e.errors
+
+        if errors:
+            raise PredictionInputError(errors)
+
+        check_deadline(deadline)
+        with instrumentation.stage('predict'):
+            predict_results = predictor_service.predictor.predict_many(cleaned_profiles)
+
+        if isinstance(predict_results, str):
+            raise RuntimeError(predict_results)
+
+        return [
+            (cleaned_data, float(result['predict_price']))
+            for cleaned_data, result in zip(cleaned_profiles, predict_results)
+        ]
+
+    async def apredict_many(self, profiles, deadline=None):
+        # Hủy coroutine không dừng được thread, thread tự kiểm tra `deadline`
+        return await asyncio.to_thread(self.predict_many, profiles, deadline)
+
+
+# ==============================================================================
+# 3. RECOMMENDATION SERVICE
+# ==============================================================================
+class RecommendationService:
+    """Gọi LLM để trích xuất tiêu chí, lọc LaptopInfo và dựng `ai_response`."""
+
+    def __init__(self, pricing):
+        self.pricing = pricing
+
+    def laptop_queryset(self, compiled):
+        return LaptopInfo.objects.filter(compiled.q)\
+                                 .values(*SUGGESTED_LAPTOP_FIELDS)\
+                                 .order_by(*catalog_index.CATALOG_ORDERING)
+
+    def indexed_laptops(self, compiled):
+        """Lọc trên catalog index trong bộ nhớ; trả về None nếu phải query database."""
+        if catalog_index.catalog is None:
+            return None
+        try:
+            with instrumentation.stage('filter_index'):
+                return catalog_index.catalog.select(compiled.mask(catalog_index.catalog), SUGGESTED_LAPTOP_FIELDS)
+        except catalog_index.UnsupportedLookup as e:
+            print(f"{e}, chuyển sang query database.")
+            return None
+
+    def rank_page(self, candidates, compiled, target_price, usage_keys, offset):
+        """Giữ một trang top-k theo điểm, kèm cursor cho trang tiếp theo (None nếu hết)."""
+        if usage_keys is None:
+            usage_keys = ranking.wanted_usage(compiled.filters)
+        page_size = settings.CHAT_SUGGESTION_PAGE_SIZE
+        # Trang này và cursor của trang sau dùng cùng một bộ deal score
+        deals_version, deals = ranking.current_deals()
+        # Copy trang kết quả: dòng của catalog index dùng chung giữa các request
+        page = [laptop.copy() for laptop in ranking.top_k(candidates, page_size, target_price, usage_keys, offset, deals)]
+        next_offset = offset + len(page)
+
+        return {
+            'suggested_laptops': change_usage_alias(page), # Thay đổi lại tên từ vd mong_nhe sang Mỏng nhẹ
+            'total_laptops': len(candidates),
+            'next_cursor': ranking.make_cursor(compiled.filters, target_price, usage_keys, next_offset, deals_version)
+                           if next_offset < len(candidates) else None,
+        }
+
+    def compile_and_index(self, filters):
+        """(CompiledFilter, laptop lọc trên catalog index hoặc None nếu phải query database)."""
+        # Kiểm tra / sửa filters của LLM, bỏ các clause không hợp lệ thay vì để cả query lỗi
+        compiled = filter_compiler.compile_filters(filters)
+        return compiled, self.indexed_laptops(compiled)
+
+    def filter_failed(self, persona, error):
+        # Bắt các lỗi có thể xảy ra do filter không hợp lệ (quá deadline thì không ai còn chờ kết quả)
+        if not isinstance(error, DeadlineExceeded):
+            print(f"Lỗi khi thực thi filter cho persona '{persona}': {error}")
+        return empty_page()
+
+    def suggest_laptops(self, filters, persona=None, target_price=None, usage_keys=None, offset=0, deadline=None):
+        """
+        Lọc laptop theo filters rồi xếp hạng, trả về một trang:
+        {'suggested_laptops', 'total_laptops', 'next_cursor'}.
+        Quá `deadline` thì không query database nữa (không ai còn chờ kết quả).
+        """
+        try:
+            compiled, candidates = self.compile_and_index(filters)
+            if candidates is None:
+                check_deadline(deadline)
+                with instrumentation.stage('filter_orm'):
+                    candidates = list(self.laptop_queryset(compiled))
+            return self.rank_page(candidates, compiled, target_price, usage_keys, offset)
+        except Exception as e:
+            return self.filter_failed(persona, e)
+
+    async def asuggest_laptops(self, filters, persona=None, target_price=None, usage_keys=None, offset=0):
+        try:
+            # Index trong bộ nhớ chỉ tốn vài chục µs, chạy thẳng trên event loop
+            compiled, candidates = self.compile_and_index(filters)
+            if candidates is None:
+                # Async ORM: không giữ thread trong lúc chờ database
+                with instrumentation.stage('filter_orm'):
+                    candidates = [laptop async for laptop in self.laptop_queryset(compiled)]
+            return self.rank_page(candidates, compiled, target_price, usage_keys, offset)
+        except Exception as e:
+            return self.filter_failed(persona, e)
+
+    def load_more(self, cursor):
+        """
+        Trang tiếp theo của một nhóm gợi ý. Raise signing.BadSignature nếu cursor không hợp lệ,
+        ranking.StaleCursor nếu price catalog đã được tính lại từ lúc tạo cursor (thứ tự đã đổi).
+        """
+        filters, target_price, usage_keys, offset = ranking.read_cursor(cursor, ranking.current_deals()[0])
+        return self.suggest_laptops(filters, 'load_more', target_price, usage_keys, offset)
+
+    def match_name(self, user_message):
+        """
+        (kết quả khớp tên từ name index {'query', 'product_ids', 'total'}, CompiledFilter của điều kiện đi kèm),
+        None nếu tin nhắn không gọi tên máy hoặc có điều kiện phải hỏi LLM (xem named_constraints).
+        """
+        if name_index.index is None:
+            return None
+        with instrumentation.stage('name_index'):
+            matched = name_index.index.match(user_message)
+            if matched is None:
+                return None
+            constraints = named_constraints(user_message)
+        if constraints is None:
+            return None
+        return matched, filter_compiler.compile_filters(constraints)
+
+    def indexed_named(self, product_ids, compiled):
+        """Laptop trong `product_ids` thỏa điều kiện, lấy từ catalog index; None nếu phải query database."""
+        if catalog_index.catalog is None:
+            return None
+        try:
+            return catalog_index.catalog.lookup(product_ids, SUGGESTED_LAPTOP_FIELDS,
+                                                mask=compiled.mask(catalog_index.catalog))
+        except catalog_index.UnsupportedLookup:
+            return None
+
+    def named_queryset(self, product_ids, compiled):
+        return LaptopInfo.objects.filter(compiled.q, pk__in=product_ids).values(*SUGGESTED_LAPTOP_FIELDS)
+
+    def named_result(self, matched, laptops):
+        """Trang kết quả tìm theo tên, None nếu không laptop nào thỏa điều kiện (nhường cho pipeline intent)."""
+        # Giữ thứ tự theo điểm khớp tên
+        product_ids = [product_id for product_id in matched['product_ids'] if product_id in laptops]
+        if not product_ids:
+            return None
+        return {
+            'named_query': matched['query'],
+            'suggested_laptops': change_usage_alias([laptops[product_id]
+                                                     for product_id in product_ids[:settings.CHAT_SUGGESTION_PAGE_SIZE]]),
+            'total_laptops': len(product_ids),
+            'next_cursor': None,
+        }
+
+    def recommend_by_name(self, user_message):
+        """
+        Tin nhắn gọi tên máy cụ thể ("Dell XPS 13"): trả lời thẳng từ name index, không cần LLM.
+        Điều kiện ngân sách / nhu cầu trong tin nhắn được áp lên kết quả (xem named_constraints).
+        Trả về {'named_query', 'suggested_laptops', 'total_laptops', 'next_cursor'} hoặc None.
+        """
+        found = self.match_name(user_message)
+        if found is None:
+            return None
+        matched, compiled = found
+
+        laptops = self.indexed_named(matched['product_ids'], compiled)
+        if laptops is None:
+            laptops = {laptop['product_id']: laptop for laptop in self.named_queryset(matched['product_ids'], compiled)}
+        return self.named_result(matched, laptops)
+
+    async def arecommend_by_name(self, user_message):
+        # Tra name index / catalog index chỉ tốn vài chục µs, chạy thẳng trên event loop
+        found = self.match_name(user_message)
+        if found is None:
+            return None
+        matched, compiled = found
+
+        laptops = self.indexed_named(matched['product_ids'], compiled)
+        if laptops is None:
+            # Không có catalog index: async ORM (ORM sync bị Django chặn trong event loop)
+            laptops = {laptop['product_id']: laptop async for laptop in self.named_queryset(matched['product_ids'], compiled)}
+        return self.named_result(matched, laptops)
+
+    def recommend_by_budget(self, user_message):
+        filters = build_budget_filters(extract_budget(user_message))
+        return budget_result(filters, self.suggest_laptops(filters, 'budget', budget_target_price(filters)))
+
+    async def arecommend_by_budget(self, user_message):
+        filters = build_budget_filters(await aextract_budget(user_message))
+        return budget_result(filters, await self.asuggest_laptops(filters, 'budget', budget_target_price(filters)))
+
+    def recommend_by_usage(self, user_message):
+        persona, filters = parse_usage_response(extract_usage(user_message))
+        return usage_result(persona, self.suggest_laptops(filters, persona))
+
+    async def arecommend_by_usage(self, user_message):
+        persona, filters = parse_usage_response(await aextract_usage(user_message))
+        return usage_result(persona, await self.asuggest_laptops(filters, persona))
+
+    def recommend_persona(self, item, predict_price, deadline=None):
+        """Xử lý một persona: lọc quanh giá dự đoán -> xếp hạng -> đổi alias."""
+        filters, usage_keys = persona_request(item, predict_price)
+        return persona_result(item, predict_price, self.suggest_laptops(filters, item['persona'], predict_price,
+                                                                        usage_keys, deadline=deadline))
+
+    async def arecommend_persona(self, item, predict_price):
+        filters, usage_keys = persona_request(item, predict_price)
+        return persona_result(item, predict_price, await self.asuggest_laptops(filters, item['persona'], predict_price,
+                                                                              usage_keys))
+
+    def predict_persona_prices(self, items):
+        """
+        Dự đoán giá cho tất cả persona trong một lần gọi model, có deadline.
+        Quá deadline thì trả về None cho mọi persona (lọc không kèm điều kiện giá).
+        """
+        deadline = time.monotonic() + settings.CHAT_PRICING_DEADLINE
+        future = submit_to_executor(self.pricing.predict_many, [item['prediction_profile'] for item in items], deadline,
+                                    deadline=deadline)
+
+        try:
+            return [predict_price for _, predict_price in future.result(timeout=settings.CHAT_PRICING_DEADLINE)]
+        except FutureTimeoutError:
+            # Không hủy được task đang chạy: task tự dừng nếu chưa tới bước gọi model
+            return pricing_timeout_result(items)
+
+    async def apredict_persona_prices(self, items):
+        deadline = time.monotonic() + settings.CHAT_PRICING_DEADLINE
+        try:
+            predictions = await asyncio.wait_for(
+                self.pricing.apredict_many([item['prediction_profile'] for item in items], deadline),
+                timeout=settings.CHAT_PRICING_DEADLINE
+            )
+            return [predict_price for _, predict_price in predictions]
+        except asyncio.TimeoutError:
+            return pricing_timeout_result(items)
+
+    def prepare_personas(self, user_message):
+        """Gọi LLM tạo persona và dự đoán giá. Trả về (items, predict_prices)."""
+        items = valid_persona_items(invoke_llm_json(SYSTEM_CONTENT_USER_MESS_EXTRACT_AND_GEN_GROUP, user_message))
+
+        if not items:
+            return [], []
+
+        return items, self.predict_persona_prices(items)
+
+    async def aprepare_personas(self, user_message):
+        items = valid_persona_items(await ainvoke_llm_json(SYSTEM_CONTENT_USER_MESS_EXTRACT_AND_GEN_GROUP, user_message))
+
+        if not items:
+            return [], []
+
+        return items, await self.apredict_persona_prices(items)
+
+    def recommend_by_personas(self, user_message):
+        items, predict_prices = self.prepare_personas(user_message)
+
+        # Lọc database cho các persona song song, kết quả giữ đúng thứ tự persona ban đầu
+        deadline = time.monotonic() + settings.CHAT_FILTER_DEADLINE
+        futures = [
+            submit_to_executor(self.recommend_persona, item, predict_price, deadline, deadline=deadline)
+            for item, predict_price in zip(items, predict_prices)
+        ]
+
+        data_result = []
+        for item, predict_price, future in zip(items, predict_prices, futures):
+            try:
+                data_result.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            except FutureTimeoutError:
+                # Task tự dừng trước khi query database nếu chưa chạy tới đó (xem suggest_laptops)
+                data_result.append(filter_timeout_result(item, predict_price))
+
+        return data_result
+
+    async def aiter_personas(self, items, predict_prices):
+        """Sinh (index, kết quả) cho từng persona ngay khi persona đó lọc xong."""
+        async def recommend_with_deadline(index, item, predict_price):
+            try:
+                return index, await asyncio.wait_for(self.arecommend_persona(item, predict_price),
+                                                     timeout=settings.CHAT_FILTER_DEADLINE)
+            except asyncio.TimeoutError:
+                return index, filter_timeout_result(item, predict_price)
+
+        for next_done in asyncio.as_completed([
+            recommend_with_deadline(index, item, predict_price)
+            for index, (item, predict_price) in enumerate(zip(items, predict_prices))
+        ]):
+            yield await next_done
+
+    async def arecommend_by_personas(self, user_message):
+        items, predict_prices = await self.aprepare_personas(user_message)
+
+        # Đặt kết quả về đúng thứ tự persona ban đầu
+        data_result = [None] * len(items)
+        async for index, recommendation in self.aiter_personas(items, predict_prices):
+            data_result[index] = recommendation
+
+        return data_result
+
+    def is_persona_intent(self, intent_codes):
+        """Nhánh trả về list persona: 1 intent tech detail, hoặc 2 - 3 intent."""
+        return len(intent_codes) in (2, 3) or intent_codes == [2]
+
+    def route(self, intent_codes):
+        """Nhánh xử lý theo intent: 'budget', 'usage' hoặc 'personas'."""
+        if intent_codes == [0]:
+            return 'budget'
+        if intent_codes == [1]:
+            return 'usage'
+        if self.is_persona_intent(intent_codes):
+            return 'personas'
+        raise ValueError('Không xác định được intent cho tin nhắn.')
+
+    def recommend(self, user_message, intent_codes):
+        """
+        Câu trả lời theo từng intent :
+        - tin nhắn gọi tên máy cụ thể -> dict (named_query), với mọi intent
+        - 1 intent : budget -> dict, usage -> dict, detail -> list persona
+        - 2 hoặc 3 intent : list persona
+        """
+        if (named := self.recommend_by_name(user_message)) is not None:
+            return named
+        return getattr(self, f'recommend_by_{self.route(intent_codes)}')(user_message)
+
+    async def arecommend(self, user_message, intent_codes):
+        if (named := await self.arecommend_by_name(user_message)) is not None:
+            return named
+        return await getattr(self, f'arecommend_by_{self.route(intent_codes)}')(user_message)
+
+
+intent_service = IntentService()
+pricing_service = PricingService()
+recommendation_service = RecommendationService(pricing_service)
+
+
+def compute_message(user_message):
+    """
+    Toàn bộ pipeline cho một tin nhắn: intent -> LLM -> lọc/dự đoán giá.
+    Trả về dict giống phần `data` của endpoint send_message.
+    """
+    payload = intent_payload(user_message, intent_service.detect(user_message))
+    payload['ai_response'] = recommendation_service.recommend(user_message, payload['intent_codes'])
+    return payload
+
+
+async def acompute_message(user_message):
+    """Phiên bản async của compute_message."""
+    payload = intent_payload(user_message, await intent_service.adetect(user_message))
+    payload['ai_response'] = await recommendation_service.arecommend(user_message, payload['intent_codes'])
+    return payload
+
+
+def process_message(user_message):
+    """
+    compute_message, nhưng các request cùng câu hỏi (đã chuẩn hóa) đang chạy đồng thời
+    dùng chung một lần tính (xem single_flight). Kết quả dùng chung giữa các request:
+    caller chỉ được đọc `ai_response`, không sửa tại chỗ.
+    """
+    if single_flight.coalescer is None:
+        return compute_message(user_message)
+    result = single_flight.coalescer.do(user_message, lambda: compute_message(user_message))
+    # Giữ nguyên câu chữ người dùng gõ (các follower có thể khác hoa thường / khoảng trắng)
+    return {**result, 'user_message': user_message}
+
+
+async def aprocess_message(user_message):
+    """Phiên bản async của process_message, dùng cho các view chạy dưới ASGI."""
+    if single_flight.coalescer is None:
+        return await acompute_message(user_message)
+    result = await single_flight.coalescer.ado(user_message, lambda: acompute_message(user_message))
+    return {**result, 'user_message': user_message}
+
+
+async def acoalesce(stage, user_message, func):
+    """await func() qua single-flight với key (stage, câu hỏi đã chuẩn hóa), hoặc chạy thẳng nếu tắt."""
+    if single_flight.coalescer is None:
+        return await func()
+    return await single_flight.coalescer.ado(user_message, func, stage=stage)
+
+
+async def astream_message(user_message):
+    """
+    Giống aprocess_message nhưng sinh từng phần kết quả ngay khi có:
+    - ('intent', {...}) ngay sau khi classifier chạy xong
+    - nhánh persona: ('personas', số persona) rồi ('persona', (index, kết quả)) theo thứ tự hoàn thành
+    - nhánh budget / usage, hoặc tin nhắn gọi tên máy: ('response', ai_response)
+    Không gom được cả luồng như aprocess_message, nên từng bước (intent, LLM + dự đoán giá của persona,
+    câu trả lời budget / usage) được gom riêng; chỉ bước lọc từng persona (vài ms) là mỗi request tự chạy.
+    """
+    intent = await acoalesce('intent', user_message, lambda: intent_service.adetect(user_message))
+    payload = intent_payload(user_message, intent)
+    intent_codes = payload['intent_codes']
+    yield 'intent', payload
+
+    named = await recommendation_service.arecommend_by_name(user_message)
+    if named is not None:
+        yield 'response', named
+    elif recommendation_service.is_persona_intent(intent_codes):
+        items, predict_prices = await acoalesce('personas', user_message,
+                                                lambda: recommendation_service.aprepare_personas(user_message))
+        yield 'personas', len(items)
+
+        async for index, recommendation in recommendation_service.aiter_personas(items, predict_prices):
+            yield 'persona', (index, recommendation)
+    else:
+        yield 'response', await acoalesce('response', user_message,
+                                          lambda: recommendation_service.arecommend(user_message, intent_codes))
@@ -1,7 +1,6 @@
 import json
-from django.db import OperationalError
-from django.db.models import Min, Max, Avg, Count
-from .models import LaptopInfo
+from django.db import DatabaseError
+from . import catalog_stats
 
 # Phân chia categorical và numeric với toàn bộ columns
 ALL_CATEGORICAL_FEATURES = ['manufacturer', 'cpu_brand', 'material', 'os_version', 'laptop_color', 'vga_brand', 
@@ -22,10 +21,15 @@ PREDICT_NUMERIC_FEATURES = ['storage_max_support', 'storage_gb', 'display_width'
                             'ram_speed', 'cpu_speed', 'ram_storage', 'ram_slots', 'battery_capacity', 'display_height']
 PREDICT_BOTH_CATE_NUMERIC = [*PREDICT_CATEGORICAL_FEATURES, *PREDICT_CATEGORICAL_LABEL_FEATURES, *PREDICT_NUMERIC_FEATURES]
 
+# Các hậu tố (lookup) Django ORM được phép dùng trong filters, theo loại cột
+NUMERIC_LOOKUPS = {'exact', 'gt', 'gte', 'lt', 'lte', 'in', 'range', 'isnull'}
+CATEGORICAL_LOOKUPS = {'exact', 'iexact', 'in', 'icontains', 'istartswith', 'iendswith', 'isnull'}
+
 DATABASE_SCHEMA_CONTEXT = ""
+CATEGORICAL_CHOICES = {} # feature -> list giá trị có trong database
 
-def get_database_schema_and_choices():
-    global DATABASE_SCHEMA_CONTEXT, ALL_CATEGORICAL_FEATURES, ALL_CATEGORICAL_LABEL_FEATURES, ALL_NUMERIC_FEATURES
+def get_database_schema_and_choices(stats=None):
+    global DATABASE_SCHEMA_CONTEXT, CATEGORICAL_CHOICES, ALL_CATEGORICAL_FEATURES, ALL_CATEGORICAL_LABEL_FEATURES, ALL_NUMERIC_FEATURES
 
     # --- Categorical Features ---
     # Các choices bây giờ được cung cấp bởi hàm get_distinct_choices
@@ -33,35 +37,25 @@ def get_database_schema_and_choices():
     schema_data = {"categorical": {}, "numerical": {}}
 
     try:
+        # Thống kê catalog dùng chung với PricePredictor (một lần duyệt database)
+        if stats is None:
+            stats = catalog_stats.build()
+
         # --- 1. Xử lý Categorical Features ---
         print("Generating schema for CATEGORICAL features...")
         for feature in ALL_CATEGORICAL_FEATURES:
             if feature in ALL_CATEGORICAL_LABEL_FEATURES:
                 values = [0, 1]
             else:
-                values = list(
-                    LaptopInfo.objects.values_list(feature, flat=True)
-                    .distinct()
-                    .exclude(**{f'{feature}__isnull': True})
-                    .exclude(**{f'{feature}__exact': ''})
-                )
+                values = stats.distinct(feature)
 
             schema_data['categorical'][feature] = values
         
-        # --- 2. Xử lý Numerical Features (Hiệu quả hơn) ---
+        # --- 2. Xử lý Numerical Features ---
         print("Generating schema for NUMERICAL features...")
-        # Xây dựng một dictionary các phép tính tổng hợp để chạy trong MỘT query duy nhất
-        aggregations = {}
-        for feature in ALL_NUMERIC_FEATURES:
-            aggregations[f'{feature}__min'] = Min(feature)
-            aggregations[f'{feature}__max'] = Max(feature)
-
-        # Thực thi một query duy nhất để lấy tất cả min/max
-        results = LaptopInfo.objects.aggregate(**aggregations)
-
         for feature in ALL_NUMERIC_FEATURES:
-            min_val = results.get(f'{feature}__min')
-            max_val = results.get(f'{feature}__max')
+            min_val = stats.minimum(feature)
+            max_val = stats.maximum(feature)
             schema_data['numerical'][feature] = {
                 'min': float(min_val) if min_val is not None else None,
                 'max': float(max_val) if max_val is not None else None
@@ -80,8 +74,9 @@ def get_database_schema_and_choices():
         
         # Gán kết quả vào biến toàn cục
         DATABASE_SCHEMA_CONTEXT = "\n".join(schema_string_parts)
+        CATEGORICAL_CHOICES = schema_data['categorical']
         print("Database schema context for LLM has been generated and cached.")
         
-    except OperationalError:
+    except DatabaseError:
         print("Warning: Could not connect to DB to generate schema. This is normal during first migration.")
         DATABASE_SCHEMA_CONTEXT = "Lỗi: Không thể tải schema từ cơ sở dữ liệu."
\ No newline at end of file
@@ -0,0 +1,115 @@
+import math
+import threading
+import numpy as np
+
+# ==============================================================================
+# MÃ HÓA FEATURE CHO MODEL GIÁ, KHÔNG QUA PANDAS
+# Pipeline best_model_xgb = ColumnTransformer(StandardScaler cho cột số, OneHotEncoder cho
+# cột phân loại) -> XGBRegressor. Gọi pipeline.predict() phải dựng DataFrame, căn cột và
+# chạy từng transformer cho mỗi request, trong khi phần tính toán thật sự chỉ là vài phép
+# trừ / chia và tra bảng.
+# FeatureEncoder đọc tham số đã fit của pipeline một lần, ghi thẳng vào buffer float32
+# (dùng lại theo từng thread) rồi gọi inplace_predict của booster.
+# Pipeline có cấu trúc khác (transformer khác, drop, infrequent...) thì from_pipeline()
+# raise UnsupportedPipeline và PricePredictor quay về đường pandas.
+# ==============================================================================
+
+
+class UnsupportedPipeline(ValueError):
+    pass
+
+
+class FeatureEncoder:
+    def __init__(self, numeric, categorical, n_features, booster, iteration_range=(0, 0)):
+        """
+        :param numeric: list (cột, vị trí trong vector, mean, scale) của các cột số.
+        :param categorical: list (cột, {giá trị: vị trí trong vector}) của các cột phân loại.
+        """
+        self.numeric = numeric
+        self.categorical = categorical
+        self.n_features = n_features
+        self.booster = booster
+        self.iteration_range = iteration_range
+        self._local = threading.local()
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        from sklearn.compose import ColumnTransformer
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        steps = getattr(pipeline, 'steps', None)
+        if not steps or len(steps) != 2 or not isinstance(steps[0][1], ColumnTransformer):
+            raise UnsupportedPipeline('pipeline phải gồm ColumnTransformer -> regressor')
+        preprocessor, regressor = steps[0][1], steps[1][1]
+        if not hasattr(regressor, 'get_booster'):
+            raise UnsupportedPipeline('regressor không phải model XGBoost')
+
+        numeric, categorical = [], []
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == 'remainder':
+                if transformer != 'drop':
+                    raise UnsupportedPipeline('remainder phải là drop')
+                continue
+
+            # Bỏ lớp Pipeline bọc ngoài (vd Pipeline([('scaler', StandardScaler())]))
+            if isinstance(transformer, Pipeline):
+                if len(transformer.steps) != 1:
+                    raise UnsupportedPipeline(f'transformer {name} có nhiều hơn một bước')
+                transformer = transformer.steps[0][1]
+
+            start = preprocessor.output_indices_[name].start
+            if isinstance(transformer, StandardScaler):
+                mean = transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+                scale = transformer.scale_ if transformer.with_std else np.ones(len(columns))
+                for offset, column in enumerate(columns):
+                    numeric.append((column, start + offset, float(mean[offset]), float(scale[offset])))
+            elif isinstance(transformer, OneHotEncoder):
+                if transformer.drop_idx_ is not None or getattr(transformer, 'infrequent_categories_', None):
+                    raise UnsupportedPipeline('OneHotEncoder dùng drop / infrequent chưa được hỗ trợ')
+                if transformer.handle_unknown not in ('ignore', 'infrequent_if_exist'):
+                    raise UnsupportedPipeline('OneHotEncoder phải dùng handle_unknown="ignore"')
+                for column, categories in zip(columns, transformer.categories_):
+                    lookup = {category.item() if hasattr(category, 'item') else category: start + idx
+                              for idx, category in enumerate(categories)}
+                    categorical.append((column, lookup))
+                    start += len(categories)
+            else:
+                raise UnsupportedPipeline(f'transformer {type(transformer).__name__} chưa được hỗ trợ')
+
+        n_features = sum(s.stop - s.start for s in preprocessor.output_indices_.values())
+        booster = regressor.get_booster()
+        if booster.num_features() != n_features:
+            raise UnsupportedPipeline('số feature của booster không khớp với preprocessor')
+
+        # Giống XGBRegressor.predict: chỉ dùng các cây tới best_iteration nếu có early stopping
+        best_iteration = getattr(regressor, 'best_iteration', None)
+        iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+        return cls(numeric, categorical, n_features, booster, iteration_range)
+
+    def buffer(self, size):
+        """Buffer float32 (size x n_features) dùng lại cho mỗi thread, chỉ cấp phát lại khi cần lớn hơn."""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < size:
+            buffer = self._local.buffer = np.empty((max(size, 8), self.n_features), dtype=np.float32)
+        return buffer[:size]
+
+    def encode(self, rows):
+        """Các dòng (dict đã impute) -> ma trận feature, giống preprocessor.transform()."""
+        matrix = self.buffer(len(rows))
+        matrix.fill(0)
+        for row_idx, row in enumerate(rows):
+            out = matrix[row_idx]
+            for column, position, mean, scale in self.numeric:
+                value = row.get(column)
+                # Giá trị thiếu -> NaN, XGBoost coi là missing giống đường pandas
+                out[position] = math.nan if value is None else (float(value) - mean) / scale
+            for column, lookup in self.categorical:
+                position = lookup.get(row.get(column))
+                if position is not None: # Giá trị lạ: để toàn 0 (handle_unknown='ignore')
+                    out[position] = 1.0
+        return matrix
+
+    def predict(self, rows):
+        matrix = self.encode(rows)
+        return self.booster.inplace_predict(matrix, iteration_range=self.iteration_range, missing=np.nan)
@@ -0,0 +1,219 @@
+import difflib
+import json
+import re
+from functools import lru_cache
+from django.db import models
+from django.db.models import Q
+from .models import LaptopInfo
+from . import database_schema
+
+# ==============================================================================
+# BIÊN DỊCH VÀ KIỂM TRA FILTERS DO LLM SINH RA
+# LLM có thể trả về field không tồn tại, hậu tố sai (vd `__contains` trên cột số),
+# hoặc giá trị sai kiểu / sai hoa thường ('NVIDIA' trong khi database lưu 'nvidia').
+# Trước đây một clause sai làm cả query lỗi và người dùng nhận danh sách rỗng.
+# compile_filters() sửa những gì sửa được, bỏ những clause còn lại, và trả về một
+# CompiledFilter dùng lại được (Q cho ORM, mask cho catalog index), cache theo dạng chuẩn.
+# ==============================================================================
+
+MODEL_FIELDS = {field.name: field for field in LaptopInfo._meta.concrete_fields}
+NUMERIC_FIELDS = {name for name, field in MODEL_FIELDS.items()
+                  if isinstance(field, (models.FloatField, models.IntegerField))}
+
+# Các hậu tố LLM hay dùng nhầm -> hậu tố hợp lệ
+LOOKUP_ALIASES = {
+    'eq': 'exact', 'equals': 'exact', 'is': 'exact',
+    'ge': 'gte', 'min': 'gte', 'from': 'gte',
+    'le': 'lte', 'max': 'lte', 'to': 'lte',
+    'between': 'range',
+    'contains': 'icontains', 'like': 'icontains',
+    # Chỉ bỏ phân biệt hoa thường, vẫn là tiền tố / hậu tố (không nới thành icontains)
+    'startswith': 'istartswith', 'endswith': 'iendswith',
+}
+
+# Lookup so khớp chuỗi (không cần khớp danh sách giá trị), chỉ nhận giá trị kiểu chuỗi
+TEXT_LOOKUPS = {'icontains', 'istartswith', 'iendswith'}
+
+# "15 triệu", "16GB", "2,5" -> số đầu tiên trong chuỗi
+NUMBER_PATTERN = re.compile(r'-?\d+(?:[.,]\d+)?')
+MILLION_PATTERN = re.compile(r'\d\s*(?:tr\b|triệu)', re.IGNORECASE)
+
+# Cột nhu cầu (gaming, mong_nhe, ...) lưu 0/1, LLM đôi khi trả về dạng chữ
+BOOLEAN_WORDS = {'true': 1, 'false': 0, 'yes': 1, 'no': 0, 'có': 1, 'không': 0}
+
+COMPILED_CACHE_SIZE = 512
+
+
+class CompiledFilter:
+    """Filters đã được kiểm tra. `issues` liệt kê các clause đã sửa hoặc bỏ."""
+
+    def __init__(self, filters, issues):
+        self.filters = filters
+        self.issues = issues
+        self.q = Q(**filters)
+        self._mask = None  # (catalog index, mask) của lần tính gần nhất
+
+    def mask(self, index):
+        """Mask trên catalog index, tính một lần cho mỗi snapshot của index."""
+        cached = self._mask
+        if cached is None or cached[0] is not index:
+            mask = index.mask(self.filters)
+            mask.flags.writeable = False
+            cached = self._mask = (index, mask)
+        return cached[1]
+
+    def __repr__(self):
+        return f'CompiledFilter({self.filters!r})'
+
+
+def to_number(value):
+    """Chuyển giá trị LLM trả về thành số, None nếu không chuyển được."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, str):
+        return None
+    if value.strip().lower() in BOOLEAN_WORDS:
+        return BOOLEAN_WORDS[value.strip().lower()]
+
+    match = NUMBER_PATTERN.search(value)
+    if not match:
+        return None
+    number = float(match.group().replace(',', '.'))
+    if MILLION_PATTERN.search(value):
+        number *= 1_000_000
+    return int(number) if number.is_integer() else number
+
+
+def to_choice(name, value, keep_unknown=True):
+    """
+    Đưa giá trị chuỗi về đúng một giá trị có trong database (không phân biệt hoa thường, gần đúng).
+    Giá trị không có trong catalog (vd manufacturer='xiaomi') được giữ nguyên: clause vẫn lọc và cho
+    kết quả rỗng, thay vì bị bỏ đi và trả về mọi laptop. `keep_unknown=False` (tên field do đoán gần đúng,
+    vd gpu_brand -> cpu_brand) thì trả về None: giá trị lạ cho thấy đã đoán sai field.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    choices = database_schema.CATEGORICAL_CHOICES.get(name)
+    if not choices or value in choices:
+        # Cột không có danh sách giá trị (vd name) thì giữ nguyên
+        return value
+
+    by_lower = {str(choice).lower(): choice for choice in choices}
+    if value.lower() in by_lower:
+        return by_lower[value.lower()]
+    close = difflib.get_close_matches(value.lower(), list(by_lower), n=1, cutoff=0.8)
+    if close:
+        return by_lower[close[0]]
+    return value if keep_unknown else None
+
+
+def normalize_field(name):
+    return name.strip().lower().replace(' ', '_')
+
+
+def resolve_field(name):
+    if name in MODEL_FIELDS:
+        return name
+    name = normalize_field(name)
+    if name in MODEL_FIELDS:
+        return name
+    close = difflib.get_close_matches(name, list(MODEL_FIELDS), n=1, cutoff=0.85)
+    return close[0] if close else None
+
+
+def compile_clause(key, value):
+    """
+    Trả về (key, value) đã sửa, hoặc (None, lý do) nếu phải bỏ clause.
+    """
+    raw_name, _, lookup = key.partition('__')
+    name = resolve_field(raw_name)
+    if name is None:
+        return None, 'field không tồn tại'
+
+    # Thông báo lỗi dùng đúng hậu tố LLM đã gửi, không phải hậu tố sau khi đổi alias
+    raw_lookup = lookup.lower() or 'exact'
+    lookup = LOOKUP_ALIASES.get(raw_lookup, raw_lookup)
+    numeric = name in NUMERIC_FIELDS
+    allowed = database_schema.NUMERIC_LOOKUPS if numeric else database_schema.CATEGORICAL_LOOKUPS
+
+    if numeric and lookup == 'iexact':
+        lookup = 'exact'
+    if lookup not in allowed:
+        return None, f'hậu tố `{raw_lookup}` không dùng được với cột {"số" if numeric else "phân loại"}'
+
+    if lookup == 'isnull':
+        if value in (True, False, 0, 1) or str(value).lower() in ('true', 'false'):
+            return f'{name}__isnull', str(value).lower() in ('true', '1')
+        return None, 'giá trị isnull phải là true/false'
+
+    # Danh sách với exact -> in, một giá trị với in -> list một phần tử
+    if isinstance(value, (list, tuple)) and lookup in ('exact', 'iexact'):
+        lookup = 'in'
+    if lookup == 'in' and not isinstance(value, (list, tuple)):
+        value = [value]
+
+    guessed = name != normalize_field(raw_name)
+    convert = to_number if numeric else (lambda v: to_choice(name, v, keep_unknown=not guessed))
+
+    if lookup == 'in':
+        values = [converted for converted in map(convert, value) if converted is not None]
+        if not values:
+            return None, 'không còn giá trị hợp lệ trong __in'
+        return f'{name}__in', list(dict.fromkeys(values))
+
+    if lookup == 'range':
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            return None, '__range cần đúng 2 giá trị'
+        low, high = map(to_number, value)
+        if low is None or high is None:
+            return None, 'giá trị __range không phải số'
+        return f'{name}__range', [min(low, high), max(low, high)]
+
+    if isinstance(value, (list, tuple, dict)):
+        return None, f'__{raw_lookup} không nhận list'
+
+    if lookup in TEXT_LOOKUPS:
+        # Không ép kiểu: True -> 'True' sẽ khớp sai chuỗi
+        if not isinstance(value, str):
+            return None, f'__{raw_lookup} cần giá trị chuỗi, nhận được {type(value).__name__}'
+        return (f'{name}__{lookup}', value.strip()) if value.strip() else (None, 'chuỗi rỗng')
+
+    converted = convert(value)
+    if converted is None:
+        return None, f'giá trị {value!r} không hợp lệ'
+    return (name if lookup == 'exact' else f'{name}__{lookup}'), converted
+
+
+def canonical_form(filters):
+    """Dạng chuẩn (chuỗi JSON, key đã sắp xếp) dùng làm key cache."""
+    return json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str)
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def _compile_canonical(canonical):
+    filters, issues = {}, []
+
+    for key, value in json.loads(canonical).items():
+        new_key, new_value = compile_clause(key, value)
+        if new_key is None:
+            issues.append(f"bỏ '{key}': {new_value}")
+            continue
+        if (new_key, new_value) != (key, value):
+            issues.append(f"sửa '{key}': {value!r} -> '{new_key}': {new_value!r}")
+        filters[new_key] = new_value
+
+    if issues:
+        print(f"Filter compiler: {'; '.join(issues)}")
+    return CompiledFilter(filters, issues)
+
+
+def compile_filters(filters):
+    """Kiểm tra, sửa và biên dịch một dict filters; kết quả được cache theo dạng chuẩn."""
+    if isinstance(filters, CompiledFilter):
+        return filters
+    if not isinstance(filters, dict):
+        raise TypeError(f'filters phải là dict, nhận được {type(filters).__name__}')
+    return _compile_canonical(canonical_form(filters))
@@ -1,6 +1,7 @@
 from django import forms
 from .models import LaptopInfo
-from django.db import OperationalError
+from django.db import DatabaseError
+from . import database_schema
 
 # ==============================================================================
 # BƯỚC 1: TẠO HÀM TIỆN ÍCH ĐỂ TRUY VẤN DATABASE
@@ -10,19 +11,23 @@ def get_distinct_choices(field_name):
     Truy vấn database để lấy các giá trị unique (duy nhất) cho một trường cụ thể,
     và định dạng chúng thành dạng `choices` cho Django Form.
     Hàm này được thiết kế để chỉ chạy một lần khi server khởi động.
+    Nếu database_schema đã có sẵn giá trị (tính lúc khởi động hoặc đọc từ startup snapshot)
+    thì dùng lại, không query.
     """
     try:
-        # Lấy danh sách các giá trị unique, loại bỏ các giá trị None hoặc rỗng
-        values = LaptopInfo.objects.values_list(field_name, flat=True)\
-                            .distinct()\
-                            .exclude(**{f'{field_name}__isnull': True})\
-                            .exclude(**{f'{field_name}__exact': ''})\
-                            .order_by(field_name)
+        values = database_schema.CATEGORICAL_CHOICES.get(field_name)
+        if values is None:
+            # Lấy danh sách các giá trị unique, loại bỏ các giá trị None hoặc rỗng
+            values = LaptopInfo.objects.values_list(field_name, flat=True)\
+                                .distinct()\
+                                .exclude(**{f'{field_name}__isnull': True})\
+                                .exclude(**{f'{field_name}__exact': ''})\
+                                .order_by(field_name)
         
         # Chuyển danh sách thành định dạng choices: [(value, label), ...]
         choices = [(value, str(value)) for value in values]
         
-    except OperationalError:
+    except DatabaseError:
         # Xảy ra nếu database chưa sẵn sàng khi Django khởi động (ví dụ: lần đầu chạy migrate)
         # Trả về một list trống để tránh crash server.
         print(f"Warning: Could not connect to DB to get choices for '{field_name}'.")
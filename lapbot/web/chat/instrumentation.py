@@ -0,0 +1,288 @@
+import bisect
+import contextvars
+import math
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+# ==============================================================================
+# ĐO THỜI GIAN TỪNG BƯỚC CỦA PIPELINE CHAT
+# Histogram nhẹ (không cần prometheus_client) cho:
+# - chat_stage_seconds{stage}: intent, json_extract, filter_index / filter_orm, predict,
+#   render, session_write
+# - chat_llm_seconds{prompt_type, model}: mỗi lần gọi LLM (kể cả khi trúng cache)
+# - chat_request_seconds{view}: toàn bộ request (xem chat.middleware.TraceMiddleware)
+# render() xuất theo định dạng text của Prometheus, kèm các bộ đếm có sẵn
+# (cache LLM, cache intent, cache HTML, single-flight, tỉ lệ bỏ qua LLM).
+# Mỗi request có một trace ID (ContextVar, được asgiref truyền qua sync_to_async / to_thread)
+# trả về trong header X-Trace-Id.
+# Khi load test có thể bật thêm đo bộ nhớ cấp phát theo stage (tracemalloc, tốn thời gian,
+# không bật trên production); số liệu là ước lượng vì các persona chạy song song trong nhiều thread.
+# ==============================================================================
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+TRACE_HEADER = 'X-Trace-Id'
+trace_id = contextvars.ContextVar('chat_trace_id', default=None)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {} # tuple giá trị label -> [số đếm từng bucket (+Inf ở cuối), tổng]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        """[(labels dạng dict, số đếm tích lũy theo bucket, tổng, số lần)]."""
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        result = []
+        for key, counts, total in sorted(series):
+            cumulative, running = [], 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            result.append((dict(zip(self.labelnames, key)), cumulative, total, running))
+        return result
+
+    def quantile(self, q, cumulative):
+        """Ước lượng quantile từ bucket (nội suy tuyến tính như histogram_quantile của Prometheus)."""
+        count = cumulative[-1]
+        if not count:
+            return 0.0
+        rank = q * count
+        index = bisect.bisect_left(cumulative, rank)
+        if index >= len(self.buckets):
+            return self.buckets[-1]
+        lower = self.buckets[index - 1] if index else 0.0
+        below = cumulative[index - 1] if index else 0
+        in_bucket = cumulative[index] - below
+        return lower + (self.buckets[index] - lower) * ((rank - below) / in_bucket if in_bucket else 0)
+
+    def summary(self):
+        """{label: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'}} cho benchmark / log."""
+        result = {}
+        for labels, cumulative, total, count in self.collect():
+            name = '/'.join(labels.values()) or self.name
+            result[name] = {
+                'count': count,
+                'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+                **{f'p{int(q * 100)}_ms': round(self.quantile(q, cumulative) * 1000, 3) for q in (0.5, 0.95, 0.99)},
+            }
+        return result
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, cumulative, total, count in self.collect():
+            pairs = list(labels.items())
+            for bound, value in zip(self.buckets + (math.inf,), cumulative):
+                lines.append(f'{self.name}_bucket{format_labels(pairs + [("le", format_value(bound))])} {value}')
+            lines.append(f'{self.name}_sum{format_labels(pairs)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(pairs)} {count}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+STAGE_SECONDS = Histogram('chat_stage_seconds', 'Thời gian từng bước của pipeline chat.', ('stage',))
+LLM_SECONDS = Histogram('chat_llm_seconds', 'Thời gian mỗi lần gọi LLM theo loại prompt và model.',
+                        ('prompt_type', 'model'))
+REQUEST_SECONDS = Histogram('chat_request_seconds', 'Thời gian xử lý request theo view.', ('view',))
+HISTOGRAMS = [STAGE_SECONDS, LLM_SECONDS, REQUEST_SECONDS]
+
+
+# stage -> [số lần, tổng byte cấp phát ròng, peak lớn nhất (byte)]
+ALLOCATIONS = {}
+_allocations_lock = threading.Lock()
+track_allocations = False
+
+
+def enable_allocation_tracking(enabled=True):
+    global track_allocations
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    track_allocations = enabled
+
+
+@contextmanager
+def allocation_stage(name):
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    try:
+        with STAGE_SECONDS.time(stage=name):
+            yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        with _allocations_lock:
+            entry = ALLOCATIONS.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += current - before
+            entry[2] = max(entry[2], peak - before)
+
+
+def allocation_summary():
+    """{stage: {'count', 'mean_net_kib', 'max_peak_kib'}}."""
+    with _allocations_lock:
+        return {name: {'count': count,
+                       'mean_net_kib': round(net / count / 1024, 2) if count else 0.0,
+                       'max_peak_kib': round(peak / 1024, 2)}
+                for name, (count, net, peak) in sorted(ALLOCATIONS.items())}
+
+
+def stage(name):
+    """with instrumentation.stage('intent'): ... (dùng được trong cả code sync lẫn async)."""
+    if track_allocations:
+        return allocation_stage(name)
+    return STAGE_SECONDS.time(stage=name)
+
+
+def llm_call(prompt_type, model):
+    return LLM_SECONDS.time(prompt_type=prompt_type, model=model)
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+    with _allocations_lock:
+        ALLOCATIONS.clear()
+
+
+def counter_lines(name, documentation, kind, samples):
+    """samples: [(labels dạng dict, giá trị)]."""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    lines += [f'{name}{format_labels(list(labels.items()))} {format_value(value)}' for labels, value in samples]
+    return lines
+
+
+def component_lines():
+    """Bộ đếm của các thành phần đã có sẵn stats() (đọc qua module lúc gọi, vì singleton gán trong ready())."""
+    from . import budget_parser, intent_classifier, llms_service, name_index, persona_matcher, rendering, single_flight
+
+    lines = []
+    llms = getattr(llms_service, 'llms', None)
+    if isinstance(llms, llms_service.CachedLLMService):
+        stats = llms.stats()
+        model = {'model': getattr(llms, 'model_alias', stats['model'])}
+        lines += counter_lines('chat_llm_cache_lookups_total', 'Số lần tra cache LLM theo kết quả.', 'counter', [
+            ({**model, 'result': 'hit'}, stats['hits']),
+            ({**model, 'result': 'shared_hit'}, stats['shared_hits']),
+            ({**model, 'result': 'miss'}, stats['misses']),
+        ])
+        lines += counter_lines('chat_llm_cache_uncacheable_total', 'Phản hồi LLM không parse được JSON.', 'counter',
+                               [(model, stats['uncacheable'])])
+        lines += counter_lines('chat_llm_cache_entries', 'Số phản hồi trong cache LLM của process.', 'gauge',
+                               [(model, stats['size'])])
+
+    router = getattr(llms, 'service', llms)
+    if isinstance(router, llms_service.RouterLLMService):
+        stats = router.stats()
+        providers = stats['providers']
+        lines += counter_lines('chat_llm_provider_calls_total', 'Số lần gọi từng provider LLM theo kết quả.', 'counter', [
+            sample for alias, provider in providers.items()
+            for sample in (({'model': alias, 'result': 'ok'}, provider['calls'] - provider['failures']),
+                           ({'model': alias, 'result': 'error'}, provider['failures']))
+        ])
+        lines += counter_lines('chat_llm_provider_hedges_total', 'Số request hedge gửi tới từng provider.', 'counter',
+                               [({'model': alias}, provider['hedges']) for alias, provider in providers.items()])
+        lines += counter_lines('chat_llm_provider_circuit_open', 'Circuit breaker của provider đang mở (1) hay không (0).',
+                               'gauge', [({'model': alias}, int(provider['state'] != 'closed'))
+                                         for alias, provider in providers.items()])
+        lines += counter_lines('chat_llm_provider_hedge_after_seconds', 'Thời gian chờ trước khi gửi hedge.', 'gauge',
+                               [({'model': alias}, provider['hedge_after_ms'] / 1000) for alias, provider in providers.items()])
+        lines += counter_lines('chat_llm_router_requests_total', 'Request qua router LLM theo kết quả.', 'counter', [
+            ({'result': 'hedged'}, stats['hedged_requests']),
+            ({'result': 'unavailable'}, stats['unavailable']),
+            ({'result': 'all'}, stats['requests']),
+        ])
+
+    classifier = getattr(intent_classifier, 'classifier', None)
+    if classifier is not None:
+        stats = classifier.stats()
+        lines += counter_lines('chat_intent_cache_lookups_total', 'Số lần tra cache intent theo kết quả.', 'counter',
+                               [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])])
+        lines += counter_lines('chat_intent_batches_total', 'Số lần gọi model intent (mỗi lần một batch).', 'counter',
+                               [({}, stats['batches'])])
+
+    coalescer = single_flight.coalescer
+    if coalescer is not None:
+        stats = coalescer.stats()
+        lines += counter_lines('chat_single_flight_requests_total', 'Request tự tính (leader) / dùng chung (follower).',
+                               'counter', [({'role': 'leader'}, stats['leaders']),
+                                           ({'role': 'follower'}, stats['followers'])])
+        lines += counter_lines('chat_single_flight_in_flight', 'Số lần tính đang chạy.', 'gauge',
+                               [({}, stats['in_flight'])])
+
+    if rendering.fragments is not None:
+        stats = rendering.fragments.stats()
+        lines += counter_lines('chat_render_cache_lookups_total', 'Số lần tra cache HTML của tin nhắn theo kết quả.',
+                               'counter', [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])])
+
+    if name_index.index is not None:
+        stats = name_index.index.stats()
+        lines += counter_lines('chat_name_index_lookups_total', 'Số lần tra tên laptop theo kết quả (hit = trả lời không cần LLM).',
+                               'counter', [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])])
+
+    bypass = []
+    for extractor, module in (('budget', budget_parser), ('usage', persona_matcher)):
+        stats = module.metrics.stats()
+        bypass += [({'extractor': extractor, 'path': 'rules'}, stats['bypassed']),
+                   ({'extractor': extractor, 'path': 'llm'}, stats['llm_calls'])]
+    lines += counter_lines('chat_extract_requests_total', 'Trích xuất tiêu chí bằng luật (bỏ qua LLM) hoặc bằng LLM.',
+                           'counter', bypass)
+    return lines
+
+
+def render():
+    """Toàn bộ metrics theo định dạng text của Prometheus (version 0.0.4)."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    lines += component_lines()
+    return '\n'.join(lines) + '\n'
@@ -1,32 +1,246 @@
+import asyncio
 import joblib
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+
+# ==============================================================================
+# PHÂN LOẠI INTENT: GOM BATCH + CACHE
+# Mỗi request gọi model một lần với một câu, nên phần overhead cố định của sklearn
+# (validate input, dựng ma trận TF-IDF...) lặp lại cho từng request.
+# - Gom batch: các câu hỏi đến gần nhau (trong BATCH_WINDOW) được gom vào MỘT lần gọi model
+#   bởi một thread nền; mỗi caller nhận kết quả qua Future.
+# - Cache LRU theo câu hỏi đã chuẩn hóa (NFC, chữ thường, gộp khoảng trắng).
+# - Xác suất từng nhãn: LinearSVC không có predict_proba, nên dùng sigmoid(decision_function).
+#   Đây là độ tự tin tương đối (chưa hiệu chỉnh), > 0.5 tương đương với nhãn = 1.
+# ==============================================================================
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize(text):
+    """Dạng chuẩn của câu hỏi, dùng làm key cache và làm input cho model."""
+    return WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFC', str(text))).strip().lower()
+
 
 class IntentClassifier:
-    def __init__(self):
-        self.model = None
-        self.load_model()
-    
+    def __init__(self, cache_size=1024, batch_window=0.002, max_batch=32):
+        """
+        :param cache_size: số câu hỏi giữ trong cache LRU (0 = tắt cache).
+        :param batch_window: thời gian (giây) chờ gom thêm câu hỏi sau câu đầu tiên (0 = không gom batch).
+        :param max_batch: số câu hỏi tối đa trong một lần gọi model.
+        """
+        # Model được tải ở lần dùng đầu tiên (xem property `model`), không tải lúc khởi động
+        self._model = None
+        self._model_loaded = False
+        self._model_lock = threading.Lock()
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict() # câu hỏi đã chuẩn hóa -> kết quả
+        self._cache_lock = threading.Lock()
+
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue() # (câu hỏi đã chuẩn hóa, Future)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_questions = 0
+
+    @property
+    def model(self):
+        if not self._model_loaded:
+            with self._model_lock:
+                if not self._model_loaded:
+                    self.load_model()
+                    self._model_loaded = True
+        return self._model
+
     def load_model(self):
         """Tải model từ file .joblib vào bộ nhớ."""
         model_path = 'chat/model/best_intent_classifier.joblib'
         try:
-            self.model = joblib.load(model_path)
+            self._model = joblib.load(model_path)
             print("ML Model loaded successfully!")
         except FileNotFoundError:
             print(f"Error: Model file not found at {model_path}")
-            self.model = None
-    
+            self._model = None
+
+    # ------------------------------------------------------------------
+    # Model
+    # ------------------------------------------------------------------
+    def predict_batch(self, questions):
+        """
+        Gọi model MỘT lần cho list câu hỏi (đã chuẩn hóa).
+        Trả về list dict {'labels': [0, 1, 0], 'probabilities': [0.31, 0.97, 0.16]}.
+        """
+        if self.model is None:
+            raise RuntimeError("Model is not loaded.")
+
+        # predict() của OneVsRest(LinearSVC) chính là decision_function > 0, nên chỉ cần gọi một lần
+        scores = np.atleast_2d(self.model.decision_function(questions))
+        probabilities = 1 / (1 + np.exp(-scores))
+        return [
+            {'labels': (row > 0).astype(int).tolist(), 'probabilities': np.round(proba, 4).tolist()}
+            for row, proba in zip(scores, probabilities)
+        ]
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+    def _get_cached(self, key):
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return result
+
+    def _set_cached(self, key, result):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Gom batch
+    # ------------------------------------------------------------------
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._collect, name='intent-batcher', daemon=True)
+                    self._worker.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Bỏ các request đã hủy (vd client async ngắt kết nối)
+        batch = [(key, future) for key, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        # Cùng một câu hỏi từ nhiều request chỉ được tính một lần
+        questions = list(dict.fromkeys(key for key, _ in batch))
+        try:
+            results = dict(zip(questions, self.predict_batch(questions)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.batched_questions += len(questions)
+        for key, result in results.items():
+            self._set_cached(key, result)
+        for key, future in batch:
+            future.set_result(results[key])
+
+    def _submit(self, keys):
+        """Đưa các câu hỏi chưa có trong cache vào hàng đợi, trả về {key: Future}."""
+        self._ensure_worker()
+        futures = {}
+        for key in keys:
+            futures[key] = Future()
+            self._queue.put((key, futures[key]))
+        return futures
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def _split(self, questions):
+        """Chuẩn hóa, lấy kết quả có sẵn trong cache; trả về (keys, results, các key còn thiếu)."""
+        keys = [normalize(question) for question in questions]
+        results, missing = {}, []
+        for key in dict.fromkeys(keys):
+            cached = self._get_cached(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                missing.append(key)
+        return keys, results, missing
+
+    def classify_many(self, questions):
+        """
+        Phân loại nhiều câu hỏi; kết quả theo đúng thứ tự đầu vào, dạng
+        {'labels': [0, 1, 0], 'probabilities': [...]}. Raise exception nếu model lỗi.
+        """
+        keys, results, missing = self._split(questions)
+        if missing:
+            if self.batch_window > 0:
+                futures = self._submit(missing)
+                results.update({key: future.result() for key, future in futures.items()})
+            else:
+                computed = dict(zip(missing, self.predict_batch(missing)))
+                for key, result in computed.items():
+                    self._set_cached(key, result)
+                results.update(computed)
+        return [results[key] for key in keys]
+
+    async def aclassify_many(self, questions):
+        """Như classify_many, nhưng chờ thread gom batch mà không chặn event loop."""
+        if self.batch_window <= 0:
+            return await asyncio.to_thread(self.classify_many, questions)
+
+        keys, results, missing = self._split(questions)
+        if missing:
+            futures = self._submit(missing)
+            for key, future in futures.items():
+                results[key] = await asyncio.wrap_future(future)
+        return [results[key] for key in keys]
+
     def classifier(self, input_question):
-        """Thực hiện phân loại intent câu hỏi"""
+        """Thực hiện phân loại intent câu hỏi, trả về nhãn dạng [0 1 0] hoặc chuỗi lỗi."""
 
         if self.model is None:
             return "Model is not loaded."
-        if not input_question:
+        if input_question is None or not normalize(input_question):
             return "No data to predict"
-        
+
         try:
-            result = self.model.predict([input_question])
-            return result[0]
+            return self.classify_many([input_question])[0]['labels']
 
         except Exception as e:
             return f"Error: {e}"
-    
+
+    def clear(self):
+        """Xóa cache và bộ đếm (vd giữa các lượt benchmark)."""
+        with self._cache_lock:
+            self._cache.clear()
+        self.hits = self.misses = self.batches = self.batched_questions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'cache_size': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'batches': self.batches,
+            'mean_batch_size': round(self.batched_questions / self.batches, 2) if self.batches else 0.0,
+        }
@@ -1,11 +1,38 @@
-from together import Together
-from google import genai
 import dotenv
 import os
 import abc  # Abstract Base Classes
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 dotenv.load_dotenv()
 
+
+def extract_json_from_string(text: str) -> str | None:
+    """
+    Trích xuất chuỗi JSON từ bên trong một khối mã Markdown.
+    """
+    # re.DOTALL cho phép `.` khớp với cả ký tự xuống dòng, tương đương [\s\S]
+    pattern = r"```(?:json)?\s*(.*?)\s*```"
+
+    match = re.search(pattern, text, re.DOTALL)
+
+    if match:
+        # group(1) là capturing group đầu tiên
+        return match.group(1).strip()
+
+    # Nếu không tìm thấy, trả về chuỗi gốc để thử parse
+    return text.strip()
+
+
 # ==============================================================================
 # 1. LỚP CƠ SỞ TRỪU TƯỢNG (BASE CLASS)
 # ==============================================================================
@@ -24,6 +51,7 @@ class BaseLLMService(abc.ABC):
         :param kwargs: Các tham số khác dành riêng cho từng dịch vụ.
         """
         self.model_name = model_name
+        self.model_alias = model_name # get_llm_service gán lại bằng alias (vd gemini-2.5-flash)
         self.temperature = temperature
         self.client = self._initialize_client(**kwargs)
 
@@ -46,6 +74,14 @@ class BaseLLMService(abc.ABC):
         """
         raise NotImplementedError
 
+    async def ainvoke(self, system_prompt: str, user_prompt: str) -> str:
+        """
+        Phiên bản bất đồng bộ của `invoke`, dùng cho các view async (ASGI).
+        Mặc định chạy `invoke` trong một thread riêng để không chặn event loop.
+        Lớp con nên ghi đè bằng client async của nhà cung cấp nếu có.
+        """
+        return await asyncio.to_thread(self.invoke, system_prompt, user_prompt)
+
     def _format_prompt(self, system_prompt: str, user_prompt: str) -> list:
         """
         Một hàm trợ giúp để định dạng prompt theo cấu trúc chung.
@@ -67,11 +103,17 @@ class TogetherLLMService(BaseLLMService):
     """Triển khai LLM Service cho TogetherAI."""
 
     def _initialize_client(self, **kwargs):
+        # Import SDK khi thật sự dùng provider này (import together / genai mất vài trăm ms lúc khởi động)
+        from together import Together, AsyncTogether
+
         api_key = os.getenv("TOGETHER_API_KEY")
 
         if not api_key:
             raise ValueError("TOGETHER_API_KEY không được tìm thấy trong biến môi trường.")
         
+        # Client async dùng cho ainvoke, chia sẻ cùng API key
+        self.async_client = AsyncTogether(api_key=api_key)
+
         return Together(api_key=api_key)
 
     def invoke(self, system_prompt: str, user_prompt: str) -> str:
@@ -90,12 +132,30 @@ class TogetherLLMService(BaseLLMService):
             print(f"Error calling TogetherAI API: {e}")
             return "Xin lỗi, đã có lỗi xảy ra khi kết nối đến dịch vụ AI. Vui lòng thử lại sau."
 
+    async def ainvoke(self, system_prompt: str, user_prompt: str) -> str:
+        messages = self._format_prompt(system_prompt, user_prompt)
+
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=self.temperature
+            )
+
+            return response.choices[0].message.content
+        
+        except Exception as e:
+            print(f"Error calling TogetherAI API: {e}")
+            return "Xin lỗi, đã có lỗi xảy ra khi kết nối đến dịch vụ AI. Vui lòng thử lại sau."
+
 
 # --- Dịch vụ cho Google Gemini ---
 class GeminiLLMService(BaseLLMService):
     """Triển khai LLM Service cho Google Gemini."""
 
     def _initialize_client(self, **kwargs):
+        from google import genai
+
         api_key = os.getenv("GOOGLE_API_KEY")
 
         if not api_key:
@@ -118,6 +178,22 @@ class GeminiLLMService(BaseLLMService):
             print(f"Error calling Gemini API: {e}")
             return "Lỗi khi kết nối đến Gemini."
 
+    async def ainvoke(self, system_prompt: str, user_prompt: str) -> str:
+        messages = self._format_prompt(system_prompt, user_prompt)
+
+        try:
+            # client.aio là phiên bản async của client Gemini
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name, 
+                contents=messages
+            )
+
+            return response.text
+        
+        except Exception as e: 
+            print(f"Error calling Gemini API: {e}")
+            return "Lỗi khi kết nối đến Gemini."
+
     def _format_prompt(self, system_prompt, user_prompt):
         return f'''
             System Prompt: \n{system_prompt}\n
@@ -125,12 +201,568 @@ class GeminiLLMService(BaseLLMService):
         '''
     
 
+# --- Dịch vụ giả lập (không cần mạng / API key) ---
+FAKE_RESPONSES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_llm_responses.json')
+
+
+def parse_latency(spec: str):
+    """
+    Phân phối độ trễ (giây) dạng chuỗi -> hàm sample(rng):
+    'fixed:0.8', 'uniform:0.3:1.2', 'normal:<trung bình>:<độ lệch>', 'lognormal:<trung vị>:<sigma>'.
+    """
+    kind, *params = spec.strip().split(':')
+    params = [float(param) for param in params]
+    samplers = {
+        'fixed': (1, lambda rng, value: value),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'normal': (2, lambda rng, mean, std: max(rng.gauss(mean, std), 0.0)),
+        'lognormal': (2, lambda rng, median, sigma: median * math.exp(rng.gauss(0.0, sigma))),
+    }
+    if kind not in samplers or len(params) != samplers[kind][0]:
+        raise ValueError(f"Phân phối độ trễ '{spec}' không hợp lệ. Các dạng hỗ trợ: fixed:s, uniform:a:b, "
+                         f"normal:mean:std, lognormal:median:sigma")
+    sample = samplers[kind][1]
+    return lambda rng: sample(rng, *params)
+
+
+def parse_latencies(spec: str) -> dict:
+    """
+    Độ trễ theo loại prompt: 'lognormal:0.8:0.4' (mọi loại) hoặc
+    'budget=fixed:0.3,group=lognormal:2:0.5,*=lognormal:0.8:0.4'. '*' là mặc định.
+    """
+    latencies = {}
+    for part in spec.split(','):
+        prompt_type, separator, distribution = part.partition('=')
+        if not separator:
+            prompt_type, distribution = '*', part
+        latencies[prompt_type.strip() or '*'] = parse_latency(distribution)
+    latencies.setdefault('*', parse_latency('fixed:0'))
+    return latencies
+
+
+class FakeLLMService(BaseLLMService):
+    """
+    LLM giả lập cho load test / benchmark offline: trả về JSON mẫu theo loại system prompt
+    (budget, usage, group) đọc từ file fixture, với độ trễ theo phân phối cấu hình được và tỉ lệ lỗi.
+    - Cùng một câu hỏi (đã chuẩn hóa) luôn nhận cùng một phản hồi mẫu, nên kết quả lặp lại được.
+    - Lỗi được trả về như provider thật: chuỗi thông báo lỗi (không phải JSON), không raise.
+    - Cấu hình qua tham số hoặc biến môi trường FAKE_LLM_LATENCY, FAKE_LLM_ERROR_RATE,
+      FAKE_LLM_SEED, FAKE_LLM_RESPONSES.
+    """
+
+    ERROR_MESSAGE = "Lỗi khi kết nối đến dịch vụ AI giả lập."
+
+    def _initialize_client(self, latency=None, error_rate=None, seed=None, responses=None, **kwargs):
+        # prompts đọc schema catalog lúc import, chỉ import khi thật sự dùng provider này
+        from .prompts import PROMPT_TYPES
+
+        self.prompt_types = PROMPT_TYPES
+        self.latencies = parse_latencies(latency if latency is not None else os.getenv('FAKE_LLM_LATENCY', 'fixed:0'))
+        self.error_rate = float(error_rate if error_rate is not None else os.getenv('FAKE_LLM_ERROR_RATE', '0'))
+        seed = seed if seed is not None else os.getenv('FAKE_LLM_SEED')
+        self.rng = random.Random(int(seed) if seed is not None else None)
+        self._rng_lock = threading.Lock()
+
+        if not isinstance(responses, dict):
+            with open(responses or os.getenv('FAKE_LLM_RESPONSES', FAKE_RESPONSES_PATH), encoding='utf-8') as file:
+                responses = json.load(file)
+        self.responses = responses
+
+        self.calls = 0
+        self.errors = 0
+        return None
+
+    def respond(self, system_prompt: str, user_prompt: str):
+        """(độ trễ, phản hồi) cho một lần gọi."""
+        prompt_type = self.prompt_types.get(system_prompt, 'other')
+        sample = self.latencies.get(prompt_type, self.latencies['*'])
+        with self._rng_lock:
+            delay = sample(self.rng)
+            failed = self.rng.random() < self.error_rate
+            self.calls += 1
+            self.errors += failed
+        if failed:
+            return delay, self.ERROR_MESSAGE
+
+        candidates = self.responses.get(prompt_type) or [{}]
+        normalized = CachedLLMService.normalize_message(user_prompt)
+        index = int.from_bytes(hashlib.sha256(normalized.encode()).digest()[:4], 'big') % len(candidates)
+        return delay, json.dumps(candidates[index], ensure_ascii=False)
+
+    def invoke(self, system_prompt: str, user_prompt: str) -> str:
+        delay, response = self.respond(system_prompt, user_prompt)
+        time.sleep(delay)
+        return response
+
+    async def ainvoke(self, system_prompt: str, user_prompt: str) -> str:
+        # Giống client async của provider thật: chờ trên event loop, không chiếm thread
+        delay, response = self.respond(system_prompt, user_prompt)
+        await asyncio.sleep(delay)
+        return response
+
+
 # ==============================================================================
-# 3. HÀM NHÀ MÁY (FACTORY FUNCTION)
+# 3. CACHE CHO PHẢN HỒI LLM
+# ==============================================================================
+class CachedLLMService(BaseLLMService):
+    """
+    Bọc một BaseLLMService bất kỳ và cache phản hồi của nó.
+    - Key: model + hash system prompt + câu hỏi đã chuẩn hóa (NFC, chữ thường, gộp khoảng trắng).
+    - Bộ nhớ trong process: LRU giới hạn `max_size` phần tử, mỗi phần tử hết hạn sau `ttl` giây.
+    - `backend` (tùy chọn): một Django cache (vd FileBasedCache, Redis) dùng chung giữa các worker,
+      được tra sau khi cache trong process bị miss. Nên dùng một alias riêng vì clear() xóa toàn bộ backend.
+    - Chỉ cache phản hồi parse được thành JSON; thông báo lỗi của provider không bao giờ bị cache.
+    """
+
+    def __init__(self, service: BaseLLMService, max_size: int = 1024, ttl: float = 3600, backend=None):
+        self.service = service
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()  # key -> (hết hạn lúc, phản hồi)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        super().__init__(model_name=service.model_name, temperature=service.temperature)
+        self.model_alias = service.model_alias
+
+    def _initialize_client(self, **kwargs):
+        return self.service.client
+
+    @staticmethod
+    def normalize_message(message: str) -> str:
+        return ' '.join(unicodedata.normalize('NFC', message).casefold().split())
+
+    def make_key(self, system_prompt: str, user_prompt: str) -> str:
+        system_hash = hashlib.sha256(system_prompt.encode()).hexdigest()
+        raw = f'{self.model_name}\x00{system_hash}\x00{self.normalize_message(user_prompt)}'
+        return 'llm:' + hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def is_cacheable(response) -> bool:
+        if not isinstance(response, str):
+            return False
+        try:
+            json.loads(extract_json_from_string(response))
+        except ValueError:
+            return False
+        return True
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def _set_local(self, key, response):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _record_shared(self, key, response):
+        # Hit ở cache dùng chung: đưa về cache trong process cho các lần sau
+        if response is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.shared_hits += 1
+        self._set_local(key, response)
+        return response
+
+    def _store(self, key, response):
+        """Trả về True nếu phản hồi hợp lệ để lưu (cả cache trong process lẫn backend)."""
+        if not self.is_cacheable(response):
+            with self._lock:
+                self.uncacheable += 1
+            return False
+        self._set_local(key, response)
+        return True
+
+    def invoke(self, system_prompt: str, user_prompt: str) -> str:
+        key = self.make_key(system_prompt, user_prompt)
+        response = self._get_local(key)
+        if response is not None:
+            return response
+
+        if self.backend is not None:
+            response = self._record_shared(key, self.backend.get(key))
+            if response is not None:
+                return response
+        else:
+            with self._lock:
+                self.misses += 1
+
+        response = self.service.invoke(system_prompt, user_prompt)
+        if self._store(key, response) and self.backend is not None:
+            self.backend.set(key, response, timeout=self.ttl)
+        return response
+
+    async def ainvoke(self, system_prompt: str, user_prompt: str) -> str:
+        key = self.make_key(system_prompt, user_prompt)
+        response = self._get_local(key)
+        if response is not None:
+            return response
+
+        if self.backend is not None:
+            response = self._record_shared(key, await self.backend.aget(key))
+            if response is not None:
+                return response
+        else:
+            with self._lock:
+                self.misses += 1
+
+        response = await self.service.ainvoke(system_prompt, user_prompt)
+        if self._store(key, response) and self.backend is not None:
+            await self.backend.aset(key, response, timeout=self.ttl)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'model': self.model_name,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'uncacheable': self.uncacheable,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+# ==============================================================================
+# 4. ĐỊNH TUYẾN GIỮA NHIỀU PROVIDER
+# ==============================================================================
+class ProviderStats:
+    """
+    Thống kê cuộn của một provider (`window` lần gọi gần nhất) kèm circuit breaker:
+    - Sau `failure_threshold` lần lỗi liên tiếp, breaker mở: provider bị bỏ qua trong `cooldown` giây.
+    - Hết cooldown, breaker nửa mở: cho đúng MỘT request thử; thành công thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    def __init__(self, window: int = 100, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.latencies = deque(maxlen=window)  # giây, các lần gọi thành công
+        self.outcomes = deque(maxlen=window)   # True = lỗi
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None  # time.monotonic() lúc breaker mở, None = đóng
+        self.probing = False   # đang có request thử khi breaker nửa mở
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.trips = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return 'open'
+            return 'half_open'
+
+    def acquire(self) -> bool:
+        """True nếu được gửi request tới provider này (breaker đóng, hoặc là request thử khi nửa mở)."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, latency: float, failed: bool):
+        with self._lock:
+            self.calls += 1
+            self.outcomes.append(failed)
+            if failed:
+                self.failures += 1
+                self.consecutive_failures += 1
+                if self.probing or (self.opened_at is None and self.consecutive_failures >= self.failure_threshold):
+                    self.opened_at = time.monotonic()
+                    self.trips += 1
+            else:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+                self.opened_at = None
+            self.probing = False
+
+    def hedged(self):
+        with self._lock:
+            self.hedges += 1
+
+    def won(self):
+        with self._lock:
+            self.wins += 1
+
+    def cancelled(self, elapsed: float):
+        """Request bị hủy vì provider khác trả lời trước: chỉ biết độ trễ >= elapsed, vẫn ghi lại
+        để p90 không bị lệch về phía các lần nhanh."""
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.probing = False
+
+    def quantile(self, q: float, min_samples: int = 1):
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < max(min_samples, 1):
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+def parse_routes(spec: str) -> dict:
+    """
+    Thứ tự provider theo loại prompt: 'budget=llama3-70b-instruct,gemini-2.5-flash;*=gemini-2.5-flash,...'.
+    '*' áp dụng cho các loại không khai báo; không khai báo gì thì xếp theo thống kê (xem RouterLLMService.order).
+    """
+    routes = {}
+    for part in spec.split(';'):
+        prompt_type, _, aliases = part.rpartition('=')
+        aliases = [alias.strip() for alias in aliases.split(',') if alias.strip()]
+        if aliases:
+            routes[prompt_type.strip() or '*'] = aliases
+    return routes
+
+
+class RouterLLMService(BaseLLMService):
+    """
+    Gửi mỗi lần gọi tới một trong nhiều provider:
+    - Thứ tự provider theo loại prompt (`routes`, xem parse_routes). Nếu không khai báo: provider có
+      tỉ lệ lỗi < 50% trước, trong đó provider có p50 thấp hơn trước.
+    - Hedging: provider đầu tiên chưa trả lời sau p`hedge_quantile` độ trễ của nó (hoặc `hedge_delay` khi
+      chưa đủ `min_samples` mẫu) thì gửi thêm request tới provider kế tiếp; lấy kết quả hợp lệ đến trước,
+      hủy request còn lại (bản async; bản sync để nó chạy xong ở thread nền).
+    - Lỗi (exception hoặc phản hồi không phải JSON) thì chuyển ngay sang provider kế tiếp.
+    - Circuit breaker cho từng provider (xem ProviderStats); provider đang mở breaker bị bỏ qua.
+    Các provider trả về thông báo lỗi thay vì raise, router cũng vậy: trả về thông báo lỗi cuối cùng.
+    """
+
+    UNAVAILABLE_MESSAGE = "Xin lỗi, các dịch vụ AI đang tạm thời gián đoạn. Vui lòng thử lại sau."
+
+    def __init__(self, services: list, routes: dict = None, hedge_quantile: float = 0.9, hedge_delay: float = 2.0,
+                 min_samples: int = 20, max_hedges: int = 1, window: int = 100, failure_threshold: int = 5,
+                 cooldown: float = 30.0, max_workers: int = 32):
+        self.services = {}
+        for service in services:
+            if service.model_alias in self.services:
+                raise ValueError(f"Provider '{service.model_alias}' bị khai báo hai lần.")
+            self.services[service.model_alias] = service
+        self.routes = routes or {}
+        for aliases in self.routes.values():
+            unknown = [alias for alias in aliases if alias not in self.services]
+            if unknown:
+                raise ValueError(f"Route dùng provider chưa khai báo: {unknown}. Các provider: {list(self.services)}")
+
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.provider_stats = {alias: ProviderStats(window, failure_threshold, cooldown) for alias in self.services}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-router')
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged_requests = 0
+        self.unavailable = 0
+
+        name = ','.join(self.services)
+        super().__init__(model_name=name)
+        self.model_alias = name
+
+    def _initialize_client(self, **kwargs):
+        from .prompts import PROMPT_TYPES
+
+        self.prompt_types = PROMPT_TYPES
+        return None
+
+    def order(self, system_prompt: str) -> list:
+        prompt_type = self.prompt_types.get(system_prompt, 'other')
+        route = self.routes.get(prompt_type) or self.routes.get('*')
+        if route:
+            return route
+        # sorted ổn định: provider chưa có số liệu giữ thứ tự khai báo (và được thử trước để có số liệu)
+        return sorted(self.services, key=lambda alias: (self.provider_stats[alias].error_rate() >= 0.5,
+                                                        self.provider_stats[alias].quantile(0.5) or 0.0))
+
+    def candidates(self, system_prompt: str):
+        """Provider theo thứ tự, bỏ qua provider đang mở breaker (chỉ kiểm tra khi thật sự gửi request)."""
+        for alias in self.order(system_prompt):
+            if self.provider_stats[alias].acquire():
+                yield alias
+
+    def hedge_after(self, alias: str) -> float:
+        latency = self.provider_stats[alias].quantile(self.hedge_quantile, self.min_samples)
+        return self.hedge_delay if latency is None else latency
+
+    def _record(self, alias: str, start: float, response):
+        failed = not CachedLLMService.is_cacheable(response)
+        self.provider_stats[alias].record(time.monotonic() - start, failed)
+        return alias, response, failed
+
+    def _call(self, alias: str, system_prompt: str, user_prompt: str):
+        start = time.monotonic()
+        try:
+            response = self.services[alias].invoke(system_prompt, user_prompt)
+        except Exception as e:
+            print(f"Error calling LLM provider {alias}: {e}")
+            response = None
+        return self._record(alias, start, response)
+
+    async def _acall(self, alias: str, system_prompt: str, user_prompt: str):
+        start = time.monotonic()
+        try:
+            response = await self.services[alias].ainvoke(system_prompt, user_prompt)
+        except asyncio.CancelledError:
+            self.provider_stats[alias].cancelled(time.monotonic() - start)
+            raise
+        except Exception as e:
+            print(f"Error calling LLM provider {alias}: {e}")
+            response = None
+        return self._record(alias, start, response)
+
+    def _finish(self, winner, hedges: int):
+        """winner: alias trả về kết quả hợp lệ, None nếu mọi provider đều lỗi / đang mở breaker."""
+        if winner is not None:
+            self.provider_stats[winner].won()
+        with self._lock:
+            self.requests += 1
+            self.hedged_requests += hedges > 0
+            self.unavailable += winner is None
+
+    def invoke(self, system_prompt: str, user_prompt: str) -> str:
+        candidates = self.candidates(system_prompt)
+        running = {}  # Future -> alias
+        response, hedges = None, 0
+
+        def launch():
+            alias = next(candidates, None)
+            if alias is not None:
+                running[self._executor.submit(self._call, alias, system_prompt, user_prompt)] = alias
+            return alias
+
+        launch()
+        while running:
+            timeout = None
+            if len(running) == 1 and hedges < self.max_hedges:
+                timeout = self.hedge_after(next(iter(running.values())))
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedges += 1
+                alias = launch()
+                if alias is not None:
+                    self.provider_stats[alias].hedged()
+                continue
+            for future in done:
+                del running[future]
+                alias, result, failed = future.result()
+                if not failed:
+                    self._finish(alias, hedges)
+                    return result
+                response = result if isinstance(result, str) else response
+            if not running:
+                launch()
+
+        self._finish(None, hedges)
+        return response or self.UNAVAILABLE_MESSAGE
+
+    async def ainvoke(self, system_prompt: str, user_prompt: str) -> str:
+        candidates = self.candidates(system_prompt)
+        running = {}  # Task -> alias
+        response, hedges = None, 0
+
+        def launch():
+            alias = next(candidates, None)
+            if alias is not None:
+                running[asyncio.ensure_future(self._acall(alias, system_prompt, user_prompt))] = alias
+            return alias
+
+        launch()
+        try:
+            while running:
+                timeout = None
+                if len(running) == 1 and hedges < self.max_hedges:
+                    timeout = self.hedge_after(next(iter(running.values())))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    alias = launch()
+                    if alias is not None:
+                        self.provider_stats[alias].hedged()
+                    continue
+                for task in done:
+                    del running[task]
+                    alias, result, failed = task.result()
+                    if not failed:
+                        self._finish(alias, hedges)
+                        return result
+                    response = result if isinstance(result, str) else response
+                if not running:
+                    launch()
+        finally:
+            # Request còn lại (thua hedge, hoặc caller bị hủy) không cần nữa
+            for task in running:
+                task.cancel()
+
+        self._finish(None, hedges)
+        return response or self.UNAVAILABLE_MESSAGE
+
+    def stats(self) -> dict:
+        providers = {}
+        for alias, stats in self.provider_stats.items():
+            p50, p90 = stats.quantile(0.5), stats.quantile(0.9)
+            providers[alias] = {
+                'state': stats.state(),
+                'calls': stats.calls,
+                'failures': stats.failures,
+                'error_rate': round(stats.error_rate(), 4),
+                'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+                'p90_ms': round(p90 * 1000, 1) if p90 is not None else None,
+                'hedge_after_ms': round(self.hedge_after(alias) * 1000, 1),
+                'trips': stats.trips,
+                'hedges': stats.hedges,
+                'wins': stats.wins,
+            }
+        return {
+            'model': self.model_name,
+            'requests': self.requests,
+            'hedged_requests': self.hedged_requests,
+            'unavailable': self.unavailable,
+            'providers': providers,
+        }
+
+
+# ==============================================================================
+# 5. HÀM NHÀ MÁY (FACTORY FUNCTION)
 # ==============================================================================
 _llm_services = {
     "together": TogetherLLMService,
     "gemini": GeminiLLMService,
+    "fake": FakeLLMService,
     # Thêm các dịch vụ khác ở đây
     # "openai": OpenAILLMService,
 }
@@ -139,6 +771,7 @@ _llm_models = {
     # Định nghĩa các model muốn sử dụng và chúng thuộc dịch vụ nào
     "llama3-70b-instruct": ("together", "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"),
     "gemini-2.5-flash": ("gemini", "gemini-2.5-flash-preview-05-20"),
+    "fake": ("fake", "fake"),
 }
 
 def get_llm_service(model_alias: str, **kwargs) -> BaseLLMService:
@@ -159,4 +792,11 @@ def get_llm_service(model_alias: str, **kwargs) -> BaseLLMService:
     ServiceClass = _llm_services[service_name]
 
     # Khởi tạo và trả về instance
-    return ServiceClass(model_name=model_name, **kwargs)
\ No newline at end of file
+    service = ServiceClass(model_name=model_name, **kwargs)
+    service.model_alias = model_alias
+    return service
+
+
+def get_llm_router(model_aliases: list, **options) -> RouterLLMService:
+    """RouterLLMService trên các alias trong _llm_models, vd ['gemini-2.5-flash', 'llama3-70b-instruct']."""
+    return RouterLLMService([get_llm_service(alias) for alias in model_aliases], **options)
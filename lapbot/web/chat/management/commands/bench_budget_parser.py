@@ -0,0 +1,39 @@
+import csv
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat import budget_parser, chat_service, llms_service
+from .bench_dispatch import CannedLLMService
+
+DEFAULT_CORPUS = settings.BASE_DIR.parent / 'data' / 'qa_data' / 'laptop_qa.csv'
+
+
+class Command(BaseCommand):
+    help = ('Đo tỉ lệ bỏ qua LLM của budget_parser và thời gian tiết kiệm được (LLM giả có độ trễ) '
+            'trên câu hỏi ngân sách thật. Độ đúng được kiểm tra trong chat.tests.BudgetParserTests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='CSV có cột question, intent_recommend_budget')
+        parser.add_argument('--llm-latency', type=float, default=0.8, help='Độ trễ giả lập (giây) mỗi lần gọi LLM')
+
+    def handle(self, *args, **options):
+        threshold = settings.CHAT_BUDGET_PARSER_MIN_CONFIDENCE
+
+        # Tỉ lệ bỏ qua LLM và thời gian tiết kiệm trên câu hỏi ngân sách thật
+        with open(options['corpus'], encoding='utf-8-sig') as file:
+            messages = [row['question'] for row in csv.DictReader(file) if row.get('intent_recommend_budget') == '1']
+
+        original_llms = llms_service.llms
+        llms_service.llms = CannedLLMService(latency=options['llm_latency'])
+        budget_parser.metrics = budget_parser.BypassMetrics()
+        try:
+            for message in messages:
+                chat_service.extract_budget(message)
+        finally:
+            llms_service.llms = original_llms
+
+        self.stdout.write(json.dumps({
+            'messages': len(messages),
+            'min_confidence': threshold,
+            **budget_parser.metrics.stats(),
+        }, indent=2))
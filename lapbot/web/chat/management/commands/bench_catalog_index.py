@@ -0,0 +1,58 @@
+import json
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from chat import catalog_index
+from chat.chat_service import SUGGESTED_LAPTOP_FIELDS
+from chat.models import LaptopInfo
+
+# Các filter có dạng giống LLM thường sinh ra, dùng để đo tốc độ
+LLM_FILTERS = [
+    {'discounted_price__gte': 15000000, 'discounted_price__lte': 20000000},
+    {'gaming': 1, 'vga_brand__in': ['nvidia', 'amd'], 'ram_storage__gte': 16},
+    {'cpu_threads__gte': 12, 'ram_storage__gte': 16, 'discounted_price__gte': 20000000, 'discounted_price__lte': 30000000},
+    {'hoc_tap_van_phong': 1, 'product_weight__lte': 1.5},
+    {'manufacturer': 'asus', 'cpu_model__icontains': 'i7'},
+]
+
+
+class Command(BaseCommand):
+    help = ('Đo tốc độ CatalogIndex so với ORM trên catalog hiện tại với các filter LLM hay sinh. '
+            'Tính đúng (giống hệt ORM) được kiểm tra trong chat.tests (python manage.py test chat).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def orm_values(self, filters):
+        return list(LaptopInfo.objects.filter(**filters).values(*SUGGESTED_LAPTOP_FIELDS)
+                    .order_by(*catalog_index.CATALOG_ORDERING))
+
+    def timeit(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+
+    def handle(self, *args, **options):
+        index = catalog_index.CatalogIndex.from_database()
+
+        benchmark = []
+        for filters in LLM_FILTERS:
+            orm_ms = self.timeit(lambda: self.orm_values(filters), options['repeat'])
+            index_ms = self.timeit(lambda: index.values(filters, SUGGESTED_LAPTOP_FIELDS), options['repeat'])
+            mask_ms = self.timeit(lambda: index.mask(filters), options['repeat'])
+            benchmark.append({
+                'filters': filters,
+                'rows': len(index.values(filters, SUGGESTED_LAPTOP_FIELDS)),
+                'orm_ms': round(orm_ms, 3),
+                'index_ms': round(index_ms, 3),
+                'mask_only_ms': round(mask_ms, 4),
+                'speedup': round(orm_ms / index_ms, 1),
+            })
+
+        self.stdout.write(json.dumps({
+            'catalog_rows': len(index),
+            'benchmark': benchmark,
+        }, indent=2, ensure_ascii=False))
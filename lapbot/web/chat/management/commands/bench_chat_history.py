@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from chat import chat_history, chat_service, llms_service, rendering
+from chat.models import ChatMessage
+from .bench_dispatch import DEFAULT_MESSAGES
+
+
+class Command(BaseCommand):
+    help = ('So sánh lịch sử chat dạng cũ (cả payload trong session) với ChatMessage: kích thước session, '
+            'kích thước lưu trữ mỗi lượt và thời gian render trang chat khi lịch sử dài (lần đầu và khi tải lại, '
+            'có cache HTML).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=50)
+
+    def timed_ms(self, func, repeat=3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return round((time.perf_counter() - start) * 1000 / repeat, 2)
+
+    def render_legacy(self, messages):
+        # Trang chat trước đây: render toàn bộ lịch sử trong session bằng component của từng lượt
+        fragments = [rendering.render_exchange(message) for message in messages]
+        return render_to_string('chat/index.html', {'chat_history': fragments})
+
+    def render_page(self, session_key):
+        messages, before = chat_history.page(session_key)
+        return render_to_string('chat/index.html', {'chat_history': rendering.render_history(messages),
+                                                    'history_before': before})
+
+    def handle(self, *args, **options):
+        original_llms = llms_service.llms
+        llms_service.llms = llms_service.get_llm_service('fake')
+        try:
+            questions = [f'{DEFAULT_MESSAGES[idx % len(DEFAULT_MESSAGES)]} {idx}' for idx in range(options['messages'])]
+
+            async def run():
+                return [await chat_service.acompute_message(question) for question in questions]
+
+            responses = asyncio.run(run())
+        finally:
+            llms_service.llms = original_llms
+
+        # Dạng cũ: list data_md_converted trong session, ghi lại toàn bộ sau mỗi tin nhắn
+        session = SessionStore()
+        legacy, legacy_writes = [], 0
+        for response in responses:
+            legacy.append(response)
+            legacy_writes += len(session.encode({'chat_history': legacy}))
+        legacy_session = len(session.encode({'chat_history': legacy}))
+
+        # ChatMessage: một dòng gọn mỗi lượt, session không đổi
+        session.create()
+        try:
+            start = time.perf_counter()
+            for response in responses:
+                chat_history.append(session.session_key, response)
+            append_ms = (time.perf_counter() - start) * 1000 / len(responses)
+            stored = [len(json.dumps(message.ai_response, ensure_ascii=False)) for message in
+                      ChatMessage.objects.filter(session_id=session.session_key)]
+
+            start = time.perf_counter()
+            chat_history.expand(chat_history.page(session.session_key)[0])
+            page_ms = (time.perf_counter() - start) * 1000
+
+            # Trang chat lúc cache HTML còn trống (lần đầu) và khi tải lại
+            if rendering.fragments is not None:
+                rendering.fragments.backend.clear()
+            cold_ms = self.timed_ms(lambda: self.render_page(session.session_key), repeat=1)
+            warm_ms = self.timed_ms(lambda: self.render_page(session.session_key), repeat=20)
+
+            report = {
+                'messages': len(responses),
+                'retained_messages': len(stored),
+                'legacy': {
+                    'session_bytes': legacy_session,
+                    'session_bytes_written_total': legacy_writes,
+                    'ai_response_bytes_per_message': round(sum(len(json.dumps(r['ai_response'], ensure_ascii=False))
+                                                               for r in responses) / len(responses)),
+                    'index_render_ms': self.timed_ms(lambda: self.render_legacy(legacy)),
+                },
+                'chat_message': {
+                    'session_bytes': len(session.encode(dict(session.items()))),
+                    'ai_response_bytes_per_message': round(sum(stored) / len(stored)),
+                    'append_ms': round(append_ms, 2),
+                    'page_load_ms': round(page_ms, 2),
+                    'index_render_ms': cold_ms,
+                    'index_reload_ms': warm_ms,
+                    'render_cache': rendering.fragments.stats() if rendering.fragments is not None else None,
+                    'page_size': settings.CHAT_HISTORY_PAGE_SIZE,
+                },
+            }
+        finally:
+            chat_history.clear(session.session_key)
+            session.delete()
+
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
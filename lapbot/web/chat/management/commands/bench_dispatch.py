@@ -0,0 +1,167 @@
+import contextvars
+import json
+import statistics
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.core.signals import request_started, request_finished
+from django.test import Client
+from chat import chat_service, llms_service
+
+DEFAULT_MESSAGES = [
+    'Mình cần laptop tầm 15 đến 20 triệu',
+    'Laptop chơi game tốt',
+    'Laptop RAM 16GB, SSD 512GB, card rời để lập trình và chơi game',
+]
+
+
+class CannedLLMService(llms_service.FakeLLMService):
+    """FakeLLMService với độ trễ cố định và không lỗi, để benchmark không phụ thuộc mạng / API key."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        super().__init__(model_name='canned', latency=f'fixed:{latency}', error_rate=0)
+
+
+class WorkerCounter:
+    """Đếm số request đồng thời (tương đương số worker slot) qua signal của Django."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def started(self, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.total += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def finished(self, **kwargs):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reset(self):
+        self.in_flight = self.peak = self.total = 0
+
+
+class LoopbackDispatch:
+    """
+    Tái hiện kiến trúc cũ: ai_message_html -> POST send_message -> POST intent_detect
+    và POST predict_price cho từng persona, đi qua toàn bộ stack HTTP của Django.
+    Cờ trong ContextVar (được asgiref truyền qua sync_to_async / async_to_sync)
+    ngăn adapter gọi lại chính nó.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._inside = contextvars.ContextVar('loopback_inside', default=frozenset())
+        self._originals = {}
+
+    async def _post(self, url, payload):
+        resp = await sync_to_async(self.client.post)(url, data=payload, content_type='application/json')
+        if resp.status_code != 200:
+            raise RuntimeError(f'{url} trả về {resp.status_code}')
+        return json.loads(resp.content)
+
+    def _loopback(self, name, original, url, to_payload, from_response):
+        async def wrapper(*args):
+            if name in self._inside.get():
+                return await original(*args)
+
+            token = self._inside.set(self._inside.get() | {name})
+            try:
+                return from_response(await self._post(url, to_payload(*args)))
+            finally:
+                self._inside.reset(token)
+
+        return wrapper
+
+    def __enter__(self):
+        self._originals = {
+            'aprocess_message': chat_service.aprocess_message,
+            'adetect': chat_service.intent_service.adetect,
+            'apredict_many': chat_service.pricing_service.apredict_many,
+        }
+        chat_service.aprocess_message = self._loopback(
+            'aprocess_message', self._originals['aprocess_message'], '/chat/send_message/',
+            lambda message: {'user_message': message}, lambda body: body['data'])
+        chat_service.intent_service.adetect = self._loopback(
+            'adetect', self._originals['adetect'], '/chat/intent_detect/',
+            lambda message: {'user_message': message}, lambda body: body['data'])
+
+        async def apredict_many(profiles, deadline=None):
+            # Kiến trúc cũ: mỗi persona một request predict_price riêng
+            results = []
+            for profile in profiles:
+                body = await self._post('/chat/predict_price/', {'data': profile})
+                results.append((body['data'], body['predict_price']))
+            return results
+
+        chat_service.pricing_service.apredict_many = apredict_many
+        return self
+
+    def __exit__(self, *exc):
+        chat_service.aprocess_message = self._originals['aprocess_message']
+        del chat_service.intent_service.adetect
+        del chat_service.pricing_service.apredict_many
+
+
+class Command(BaseCommand):
+    help = 'So sánh latency và số worker slot mỗi tin nhắn giữa HTTP loopback (cũ) và gọi service in-process.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--llm-latency', type=float, default=0.0,
+                            help='Độ trễ giả lập (giây) cho mỗi lần gọi LLM.')
+
+    def run_mode(self, client, counter, iterations):
+        latencies, peaks, totals = [], [], []
+
+        for _ in range(iterations):
+            for message in DEFAULT_MESSAGES:
+                # Xóa history để chi phí ghi session không tăng dần giữa các lần đo
+                client.post('/chat/delete_all_message/')
+                counter.reset()
+                start = time.perf_counter()
+                resp = client.post('/chat/ai_message_html/', data={'data': {'user_message': message}},
+                                   content_type='application/json')
+                latencies.append((time.perf_counter() - start) * 1000)
+                if resp.status_code != 200:
+                    raise RuntimeError(f'ai_message_html trả về {resp.status_code}: {resp.content[:200]}')
+                peaks.append(counter.peak)
+                totals.append(counter.total)
+
+        latencies.sort()
+        return {
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'peak_workers_per_message': max(peaks),
+            'requests_per_message': round(statistics.fmean(totals), 2),
+        }
+
+    def handle(self, *args, **options):
+        original_llms = llms_service.llms
+        llms_service.llms = CannedLLMService(latency=options['llm_latency'])
+
+        counter = WorkerCounter()
+        request_started.connect(counter.started)
+        request_finished.connect(counter.finished)
+        client = Client(HTTP_HOST='localhost')
+
+        try:
+            # Warm-up: load template, form choices, model
+            self.run_mode(client, counter, 1)
+
+            with LoopbackDispatch(client):
+                before = self.run_mode(client, counter, options['iterations'])
+            after = self.run_mode(client, counter, options['iterations'])
+        finally:
+            request_started.disconnect(counter.started)
+            request_finished.disconnect(counter.finished)
+            llms_service.llms = original_llms
+
+        self.stdout.write(json.dumps({'before_loopback': before, 'after_in_process': after}, indent=2))
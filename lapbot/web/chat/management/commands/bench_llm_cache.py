@@ -0,0 +1,61 @@
+import json
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from chat import llms_service
+from chat.prompts import SYSTEM_CONTENT_EXTRACT_BUDGET, SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE
+from .bench_dispatch import CannedLLMService
+
+# Các câu hỏi lặp lại với khác biệt nhỏ về chữ hoa / khoảng trắng, như người dùng thật gõ
+MESSAGES = [
+    (SYSTEM_CONTENT_EXTRACT_BUDGET, 'Laptop 15 triệu chơi game'),
+    (SYSTEM_CONTENT_EXTRACT_BUDGET, 'laptop 15 triệu  chơi game '),
+    (SYSTEM_CONTENT_EXTRACT_BUDGET, 'Mình cần laptop tầm 15 đến 20 triệu'),
+    (SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE, 'Laptop chơi game tốt'),
+    (SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE, 'LAPTOP CHƠI GAME TỐT'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Đo hit rate và latency của CachedLLMService khi các câu hỏi giống nhau lặp lại.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--llm-latency', type=float, default=0.05,
+                            help='Độ trễ giả lập (giây) cho mỗi lần gọi LLM thật.')
+        parser.add_argument('--shared', action='store_true',
+                            help='Dùng thêm cache dùng chung (alias CHAT_LLM_CACHE_ALIAS, mặc định "llm").')
+
+    def run(self, service, rounds):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for system_prompt, message in MESSAGES:
+                service.invoke(system_prompt, message)
+        return (time.perf_counter() - start) * 1000 / (rounds * len(MESSAGES))
+
+    def handle(self, *args, **options):
+        backend = None
+        if options['shared']:
+            backend = caches[settings.CHAT_LLM_CACHE_ALIAS or 'llm']
+            backend.clear()
+
+        canned = CannedLLMService(latency=options['llm_latency'])
+        uncached_ms = self.run(canned, 1)
+
+        cached = llms_service.CachedLLMService(canned, max_size=settings.CHAT_LLM_CACHE_SIZE,
+                                               ttl=settings.CHAT_LLM_CACHE_TTL, backend=backend)
+        cached_ms = self.run(cached, options['rounds'])
+
+        # Worker khác (process mới -> cache trong process rỗng) đọc từ backend dùng chung
+        shared_ms = None
+        if backend is not None:
+            shared_ms = self.run(llms_service.CachedLLMService(canned, backend=backend), 1)
+            backend.clear()
+
+        self.stdout.write(json.dumps({
+            'uncached_ms_per_call': round(uncached_ms, 3),
+            'cached_ms_per_call': round(cached_ms, 3),
+            'shared_ms_per_call': round(shared_ms, 3) if shared_ms is not None else None,
+            'stats': cached.stats(),
+        }, indent=2))
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.core.management.base import BaseCommand
+from chat import llms_service
+from chat.prompts import PROMPT_TYPES
+from .bench_dispatch import DEFAULT_MESSAGES
+
+PROMPTS = {kind: prompt for prompt, kind in PROMPT_TYPES.items()}
+
+
+def fake(alias, latency, error_rate=0.0, seed=0):
+    service = llms_service.FakeLLMService(model_name='fake', latency=latency, error_rate=error_rate, seed=seed)
+    service.model_alias = alias
+    return service
+
+
+def summary(latencies, responses):
+    return {
+        'requests': len(latencies),
+        'failed_responses': sum(not llms_service.CachedLLMService.is_cacheable(response) for response in responses),
+        **{f'p{q}_ms': round(float(np.percentile(latencies, q)) * 1000, 1) for q in (50, 90, 95, 99)},
+        'max_ms': round(max(latencies) * 1000, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = ('So sánh RouterLLMService với một provider duy nhất bằng các FakeLLMService: độ trễ đuôi khi '
+            'provider chính chậm thất thường (hedging), khi provider chính lỗi liên tục (circuit breaker), '
+            'và thứ tự provider theo loại prompt.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--primary-latency', default='lognormal:0.1:0.9', help='Provider chính: đuôi dài')
+        parser.add_argument('--secondary-latency', default='lognormal:0.15:0.3', help='Provider phụ: ổn định hơn')
+
+    def calls(self, count, kind='budget'):
+        return [(PROMPTS[kind], f'{DEFAULT_MESSAGES[idx % len(DEFAULT_MESSAGES)]} #{idx}') for idx in range(count)]
+
+    def run_async(self, service, calls, concurrency):
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def timed(prompt, message):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await service.ainvoke(prompt, message)
+                    return time.perf_counter() - start, response
+
+            return await asyncio.gather(*(timed(prompt, message) for prompt, message in calls))
+
+        results = asyncio.run(run())
+        return summary([latency for latency, _ in results], [response for _, response in results])
+
+    def run_sync(self, service, calls, concurrency):
+        def timed(call):
+            start = time.perf_counter()
+            response = service.invoke(*call)
+            return time.perf_counter() - start, response
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(timed, calls))
+        return summary([latency for latency, _ in results], [response for _, response in results])
+
+    def router(self, services, **options):
+        return llms_service.RouterLLMService(services, hedge_delay=0.5, min_samples=20, **options)
+
+    def handle(self, *args, **options):
+        count, concurrency = options['requests'], options['concurrency']
+        primary, secondary = options['primary_latency'], options['secondary_latency']
+        report = {}
+
+        # 1. Độ trễ đuôi: chỉ provider chính vs router (chính + phụ, hedge sau p90 của provider chính)
+        single = fake('primary', primary)
+        router = self.router([fake('primary', primary), fake('secondary', secondary, seed=1)],
+                             routes={'*': ['primary', 'secondary']})
+        self.run_async(router, self.calls(50), concurrency)  # làm nóng thống kê cuộn
+        warm_calls = {alias: service.calls for alias, service in router.services.items()}
+        report['tail_latency_async'] = {
+            'single': self.run_async(single, self.calls(count), concurrency),
+            'router': self.run_async(router, self.calls(count), concurrency),
+            'provider_calls_per_request': round(sum(service.calls - warm_calls[alias] for alias, service
+                                                    in router.services.items()) / count, 3),
+            'router_stats': router.stats(),
+        }
+
+        router = self.router([fake('primary', primary), fake('secondary', secondary, seed=1)],
+                             routes={'*': ['primary', 'secondary']})
+        self.run_sync(router, self.calls(50), concurrency)
+        report['tail_latency_sync'] = {
+            'single': self.run_sync(fake('primary', primary), self.calls(count), concurrency),
+            'router': self.run_sync(router, self.calls(count), concurrency),
+        }
+
+        # 2. Provider chính lỗi liên tục: breaker mở sau vài lỗi, sau đó chỉ còn request thử sau cooldown
+        failing = fake('primary', primary, error_rate=1.0)
+        router = self.router([failing, fake('secondary', secondary, seed=1)],
+                             routes={'*': ['primary', 'secondary']}, failure_threshold=5, cooldown=0.5)
+        start = time.perf_counter()
+        outage = self.run_async(router, self.calls(count), concurrency)
+        wall = time.perf_counter() - start
+        report['outage'] = {
+            'single': self.run_async(fake('primary', primary, error_rate=1.0), self.calls(count), concurrency),
+            'router': outage,
+            'wall_s': round(wall, 2),
+            'primary_calls': failing.calls,
+            'primary_state': router.stats()['providers']['primary'],
+        }
+
+        # 3. Thứ tự theo loại prompt: budget ưu tiên provider phụ, các loại khác ưu tiên provider chính
+        services = [fake('primary', 'fixed:0.01'), fake('secondary', 'fixed:0.01', seed=1)]
+        router = self.router(services, routes=llms_service.parse_routes('budget=secondary,primary;*=primary,secondary'))
+        for kind in ('budget', 'usage', 'group'):
+            self.run_async(router, self.calls(20, kind), concurrency)
+        report['routes'] = {alias: service.calls for alias, service in router.services.items()}
+
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
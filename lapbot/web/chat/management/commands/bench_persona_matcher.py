@@ -0,0 +1,42 @@
+import collections
+import csv
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat import chat_service, llms_service, persona_matcher
+from .bench_dispatch import CannedLLMService
+
+DEFAULT_CORPUS = settings.BASE_DIR.parent / 'data' / 'qa_data' / 'laptop_qa.csv'
+
+
+class Command(BaseCommand):
+    help = ('Đo tỉ lệ bỏ qua LLM của persona_matcher và thời gian tiết kiệm được (LLM giả có độ trễ) trên câu hỏi '
+            'nhu cầu sử dụng thật. Độ đúng được kiểm tra trong chat.tests.PersonaMatcherTests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='CSV có cột question, intent_recommend_usage')
+        parser.add_argument('--llm-latency', type=float, default=0.8, help='Độ trễ giả lập (giây) mỗi lần gọi LLM')
+
+    def handle(self, *args, **options):
+        threshold = settings.CHAT_PERSONA_MATCHER_MIN_CONFIDENCE
+
+        # Tỉ lệ bỏ qua LLM trên câu hỏi nhu cầu sử dụng thật
+        with open(options['corpus'], encoding='utf-8-sig') as file:
+            questions = [row['question'] for row in csv.DictReader(file) if row.get('intent_recommend_usage') == '1']
+
+        original_llms = llms_service.llms
+        llms_service.llms = CannedLLMService(latency=options['llm_latency'])
+        persona_matcher.metrics = persona_matcher.BypassMetrics()
+        personas = collections.Counter()
+        try:
+            for message in questions:
+                personas[chat_service.extract_usage(message)['persona']] += 1
+        finally:
+            llms_service.llms = original_llms
+
+        self.stdout.write(json.dumps({
+            'corpus_usage_questions': len(questions),
+            'min_confidence': threshold,
+            **persona_matcher.metrics.stats(),
+            'personas': dict(personas.most_common()),
+        }, indent=2, ensure_ascii=False))
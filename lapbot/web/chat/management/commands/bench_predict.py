@@ -0,0 +1,47 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from chat import predictor_service
+from chat.models import LaptopInfo
+
+
+class Command(BaseCommand):
+    help = 'So sánh N lần PricePredictor.predict với một lần PricePredictor.predict_many cho N profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 3, 4, 8, 32])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def timeit(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    def handle(self, *args, **options):
+        predictor = predictor_service.predictor
+        # Dùng các laptop thật trong catalog làm profile
+        catalog = list(LaptopInfo.objects.values(*predictor_service.PREDICT_FIELDS)[:max(options['sizes'])])
+
+        results = []
+        for size in options['sizes']:
+            profiles = [catalog[idx % len(catalog)] for idx in range(size)]
+
+            # Kết quả hai cách phải giống nhau
+            single = [predictor.predict(profile)['predict_price'] for profile in profiles]
+            batch = [row['predict_price'] for row in predictor.predict_many(profiles)]
+            if any(abs(a - b) > 1e-3 * max(abs(a), 1) for a, b in zip(single, batch)):
+                raise AssertionError(f'predict và predict_many lệch nhau với N={size}')
+
+            loop_ms = self.timeit(lambda: [predictor.predict(profile) for profile in profiles], options['repeat'])
+            batch_ms = self.timeit(lambda: predictor.predict_many(profiles), options['repeat'])
+            results.append({
+                'n_profiles': size,
+                'loop_predict_ms': round(loop_ms, 3),
+                'predict_many_ms': round(batch_ms, 3),
+                'speedup': round(loop_ms / batch_ms, 2),
+            })
+
+        self.stdout.write(json.dumps(results, indent=2))
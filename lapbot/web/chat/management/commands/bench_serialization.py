@@ -0,0 +1,113 @@
+import asyncio
+import gzip
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from chat import catalog_index, chat_service, llms_service, rendering, serialization
+from chat.chat_service import SUGGESTED_LAPTOP_FIELDS
+from chat.middleware import brotli
+from chat.models import LaptopInfo
+from .bench_dispatch import DEFAULT_MESSAGES
+
+
+def django_dumps(data):
+    # Như django.http.JsonResponse
+    return json.dumps(data, cls=serialization.DjangoJSONEncoder).encode()
+
+
+class Command(BaseCommand):
+    help = ('So sánh các cách encode JSON (JsonResponse của Django, json UTF-8, orjson nếu đã cài) và nén '
+            '(gzip, brotli nếu đã cài) trên các payload thật của chat: kết quả gợi ý theo persona, JSON chứa HTML '
+            'của ai_message_html và danh sách laptop lớn từ catalog.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--laptops', type=int, default=500, help='Số laptop trong payload danh sách lớn')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def timed_ms(self, func, repeat):
+        func()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return round((time.perf_counter() - start) * 1000 / repeat, 3), result
+
+    def payloads(self, count):
+        original_llms = llms_service.llms
+        llms_service.llms = llms_service.get_llm_service('fake')
+        try:
+            async def run():
+                return [await chat_service.acompute_message(question) for question in DEFAULT_MESSAGES]
+
+            responses = asyncio.run(run())
+        finally:
+            llms_service.llms = original_llms
+
+        product_ids = list(LaptopInfo.objects.values_list('product_id', flat=True)[:count])
+        if catalog_index.catalog is not None:
+            laptops = list(catalog_index.catalog.lookup(product_ids, SUGGESTED_LAPTOP_FIELDS).values())
+        else:
+            laptops = list(LaptopInfo.objects.filter(pk__in=product_ids).values(*SUGGESTED_LAPTOP_FIELDS))
+        return {
+            'persona_results': {'responses': [response['ai_response'] for response in responses]},
+            'ai_message_html': {'html': rendering.render_exchange(responses[0]),
+                                'ai_response': responses[0]['ai_response']},
+            'catalog_list': {'suggested_laptops': laptops},
+        }
+
+    def encoders(self):
+        encoders = {'django_json': django_dumps, 'json_compact': serialization.json_dumps,
+                    'json_utf8': lambda data: json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                                                         cls=serialization.DjangoJSONEncoder).encode()}
+        if serialization.orjson is not None:
+            encoders['orjson'] = serialization.orjson_dumps
+        return encoders
+
+    def compressors(self):
+        compressors = {'gzip': lambda content: gzip.compress(content, compresslevel=6)}
+        if brotli is not None:
+            compressors['brotli'] = lambda content: brotli.compress(content, quality=settings.CHAT_BROTLI_QUALITY)
+        return compressors
+
+    def end_to_end(self):
+        # Một request thật qua CompressionMiddleware (send_message trả về kết quả gợi ý dạng JSON)
+        client = Client()
+        report = {}
+        for accept in ('br', 'gzip', 'identity'):
+            response = client.post(reverse('chat:send_message'), data=json.dumps({'user_message': DEFAULT_MESSAGES[0]}),
+                                   content_type='application/json', HTTP_ACCEPT_ENCODING=accept)
+            report[accept] = {
+                'status': response.status_code,
+                'content_encoding': response.get('Content-Encoding'),
+                'bytes': len(response.content),
+            }
+        return report
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        report = {
+            'json_encoder': settings.CHAT_JSON_ENCODER,
+            'active_encoder': serialization.encoder.__name__,
+            'orjson': serialization.orjson is not None,
+            'brotli': brotli is not None,
+            'payloads': {},
+        }
+        for name, data in self.payloads(options['laptops']).items():
+            result = {}
+            for encoder_name, encoder in self.encoders().items():
+                encode_ms, content = self.timed_ms(lambda: encoder(data), repeat)
+                result[encoder_name] = {'encode_ms': encode_ms, 'bytes': len(content)}
+                for compressor_name, compress in self.compressors().items():
+                    compress_ms, compressed = self.timed_ms(lambda: compress(content), repeat)
+                    result[encoder_name][compressor_name] = {'compress_ms': compress_ms, 'bytes': len(compressed)}
+            report['payloads'][name] = result
+
+        llms_service.llms, original_llms = llms_service.get_llm_service('fake'), llms_service.llms
+        try:
+            report['end_to_end'] = self.end_to_end()
+        finally:
+            llms_service.llms = original_llms
+
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from chat import chat_service, llms_service, single_flight
+from .bench_dispatch import CannedLLMService, DEFAULT_MESSAGES
+
+
+def variants(message, count):
+    """Cùng một câu mẫu, khác hoa thường / khoảng trắng như khi nhiều người gõ lại."""
+    forms = [message, message.upper(), f'  {message}  ', message.lower(), message.replace(' ', '  ')]
+    return [forms[idx % len(forms)] for idx in range(count)]
+
+
+class Command(BaseCommand):
+    help = ('Bắn N request giống nhau cùng lúc vào aprocess_message (LLM giả có độ trễ), '
+            'so sánh số lần chạy pipeline / gọi LLM và latency khi có và không có single-flight, '
+            'và gom giữa hai "process" dùng chung một Django cache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--llm-latency', type=float, default=0.3)
+
+    async def burst(self, messages):
+        latencies = []
+
+        async def one(message):
+            start = time.perf_counter()
+            result = await chat_service.aprocess_message(message)
+            latencies.append(time.perf_counter() - start)
+            return result
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(message) for message in messages))
+        return results, {
+            'wall_ms': round((time.perf_counter() - start) * 1000, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 1),
+            'max_ms': round(max(latencies) * 1000, 1),
+        }
+
+    def run(self, coalescer, messages, latency):
+        single_flight.coalescer = coalescer
+        llms_service.llms = llm = CannedLLMService(latency=latency)
+        pipelines = 0
+        original = chat_service.acompute_message
+
+        async def counting(message):
+            nonlocal pipelines
+            pipelines += 1
+            return await original(message)
+
+        chat_service.acompute_message = counting
+        try:
+            results, timing = asyncio.run(self.burst(messages))
+        finally:
+            chat_service.acompute_message = original
+        return results, {'pipelines': pipelines, 'llm_calls': llm.calls, **timing}
+
+    def cross_process(self, message, count, latency):
+        """Hai SingleFlight dùng chung một cache, mô phỏng hai worker; mỗi worker nhận một nửa số request."""
+        backend = LocMemCache('bench-single-flight', {})
+        workers = [single_flight.SingleFlight(backend=backend, wait_timeout=10, result_ttl=5) for _ in range(2)]
+        llm = CannedLLMService(latency=latency)
+        llms_service.llms = llm
+
+        def one(idx):
+            return workers[idx % 2].do(message, lambda: chat_service.compute_message(message))
+
+        with ThreadPoolExecutor(count) as executor:
+            list(executor.map(one, range(count)))
+        return {'llm_calls': llm.calls, 'workers': [worker.stats() for worker in workers]}
+
+    def handle(self, *args, **options):
+        original_llms, original_coalescer = llms_service.llms, single_flight.coalescer
+        message = DEFAULT_MESSAGES[2]
+        messages = variants(message, options['requests'])
+        try:
+            # Warm-up (model, template, catalog index), rồi lấy kết quả lúc không tải làm chuẩn
+            self.run(None, messages[:1], 0)
+            (reference,), _ = self.run(None, messages[:1], 0)
+
+            def comparable(result):
+                # next_cursor được ký kèm thời điểm tạo, nên khác nhau giữa các lần tính
+                response = result['ai_response']
+                if isinstance(response, list):
+                    response = [{**item, 'next_cursor': None} if isinstance(item, dict) else item for item in response]
+                elif isinstance(response, dict):
+                    response = {**response, 'next_cursor': None}
+                return {**result, 'user_message': None, 'ai_response': response}
+
+            def degraded(results):
+                """Số request có kết quả khác lúc không tải (vd dự đoán giá quá deadline)."""
+                return sum(comparable(result) != comparable(reference) for result in results)
+
+            # Chạy bản có single-flight trước: các task dự đoán giá quá deadline của lần chạy
+            # không gom vẫn nằm trong persona_executor và sẽ làm chậm lần chạy sau
+            coalescer = single_flight.SingleFlight()
+            coalesced_results, coalesced = self.run(coalescer, messages, options['llm_latency'])
+            coalesced['degraded_results'] = degraded(coalesced_results)
+            coalesced.update(coalescer.stats())
+            baseline_results, baseline = self.run(None, messages, options['llm_latency'])
+            baseline['degraded_results'] = degraded(baseline_results)
+
+            shared = self.cross_process(message, 8, options['llm_latency'])
+        finally:
+            llms_service.llms, single_flight.coalescer = original_llms, original_coalescer
+
+        self.stdout.write(json.dumps({
+            'requests': len(messages),
+            'message': message,
+            'llm_latency_s': options['llm_latency'],
+            'without_single_flight': baseline,
+            'with_single_flight': coalesced,
+            'two_workers_shared_cache': shared,
+        }, indent=2, ensure_ascii=False))
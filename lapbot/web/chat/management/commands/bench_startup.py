@@ -0,0 +1,62 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat import startup_snapshot
+
+# Chạy trong process con: đo thời gian django.setup() (gồm ChatConfig.ready()) và số query
+SETUP_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+with CaptureQueriesContext(connection) as queries:
+    django.setup()
+setup_ms = (time.perf_counter() - start) * 1000
+
+# Request đầu tiên cần model phân loại intent (được tải lười)
+first = time.perf_counter()
+from chat import intent_classifier
+intent_classifier.classifier.classifier('laptop chơi game')
+first_intent_ms = (time.perf_counter() - first) * 1000
+print(json.dumps({'setup_ms': setup_ms, 'queries': len(queries), 'first_intent_ms': first_intent_ms}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Đo thời gian khởi động lạnh (django.setup() trong process mới) khi có và không có startup snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+
+    def run_setup(self, env):
+        output = subprocess.run([sys.executable, '-c', SETUP_SCRIPT], env=env, cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def measure(self, env, runs):
+        results = [self.run_setup(env) for _ in range(runs)]
+        return {
+            'setup_ms_median': round(statistics.median(r['setup_ms'] for r in results), 1),
+            'setup_queries': results[-1]['queries'],
+            'first_intent_ms_median': round(statistics.median(r['first_intent_ms'] for r in results), 1),
+        }
+
+    def handle(self, *args, **options):
+        path = startup_snapshot.snapshot_path() or Path(settings.BASE_DIR) / 'cache' / 'startup_snapshot.json'
+        env = {**os.environ, 'CHAT_STARTUP_SNAPSHOT': str(path)}
+
+        # Lần chạy đầu build file nếu chưa có / đã cũ
+        self.run_setup(env)
+        with_snapshot = self.measure(env, options['runs'])
+        without_snapshot = self.measure({**env, 'CHAT_STARTUP_SNAPSHOT': ''}, options['runs'])
+
+        self.stdout.write(json.dumps({
+            'with_snapshot': with_snapshot,
+            'without_snapshot': without_snapshot,
+        }, indent=2))
@@ -0,0 +1,22 @@
+import json
+from django.core.management.base import BaseCommand
+from chat import catalog_index, startup_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Tính lại snapshot khởi động (giá trị mặc định, schema, choices) từ database và ghi ra file.'
+
+    def handle(self, *args, **options):
+        if startup_snapshot.snapshot_path() is None:
+            self.stderr.write('CHAT_STARTUP_SNAPSHOT đang tắt, không có file để ghi.')
+            return
+
+        catalog = catalog_index.catalog
+        snapshot = startup_snapshot.load_or_build(catalog.rows if catalog is not None else None, rebuild=True)
+        self.stdout.write(json.dumps({
+            'path': str(startup_snapshot.snapshot_path()),
+            'version': snapshot['version'],
+            'checksum': snapshot['checksum'],
+            'default_imputation_values': len(snapshot['default_imputation_values']),
+            'categorical_choices': len(snapshot['categorical_choices']),
+        }, indent=2))
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from chat import llms_service
+from chat.prompts import PROMPT_TYPES
+from .bench_dispatch import DEFAULT_MESSAGES
+
+
+class Command(BaseCommand):
+    help = ('Đo độ trễ và tỉ lệ lỗi thực tế của FakeLLMService so với cấu hình. Phản hồi mẫu được kiểm tra '
+            'trong chat.tests.FakeLLMServiceTests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', default='budget=fixed:0.01,usage=uniform:0.005:0.015,*=lognormal:0.02:0.5')
+        parser.add_argument('--error-rate', type=float, default=0.1)
+        parser.add_argument('--calls', type=int, default=300)
+
+    def handle(self, *args, **options):
+        # Độ trễ theo loại prompt và tỉ lệ lỗi (đo qua ainvoke, chạy đồng thời trên event loop)
+        fake = llms_service.FakeLLMService(model_name='fake', latency=options['latency'],
+                                           error_rate=options['error_rate'], seed=0)
+        calls = [(prompt, f'{DEFAULT_MESSAGES[idx % len(DEFAULT_MESSAGES)]} #{idx}')
+                 for idx in range(options['calls']) for prompt in PROMPT_TYPES]
+
+        async def timed(prompt, message):
+            start = time.perf_counter()
+            response = await fake.ainvoke(prompt, message)
+            return PROMPT_TYPES[prompt], time.perf_counter() - start, response
+
+        async def run():
+            return await asyncio.gather(*(timed(prompt, message) for prompt, message in calls))
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        wall = time.perf_counter() - start
+
+        latency = {}
+        for kind in PROMPT_TYPES.values():
+            seconds = [elapsed for prompt_type, elapsed, _ in results if prompt_type == kind]
+            latency[kind] = {
+                'mean_ms': round(float(np.mean(seconds)) * 1000, 2),
+                'p50_ms': round(float(np.percentile(seconds, 50)) * 1000, 2),
+                'p95_ms': round(float(np.percentile(seconds, 95)) * 1000, 2),
+            }
+        errors = sum(response == fake.ERROR_MESSAGE for _, _, response in results)
+
+        self.stdout.write(json.dumps({
+            'calls': len(results),
+            'wall_ms': round(wall * 1000, 1),
+            'latency_spec': options['latency'],
+            'latency': latency,
+            'error_rate_configured': options['error_rate'],
+            'error_rate_observed': round(errors / len(results), 4),
+        }, indent=2, ensure_ascii=False))
@@ -0,0 +1,83 @@
+import json
+import random
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from chat import feature_encoder, predictor_service
+from chat.models import LaptopInfo
+
+# Giá trị lạ / thiếu để kiểm tra các trường hợp biên
+ODD_VALUES = [None, 'khong-co', 'NVIDIA', 0, 1]
+
+
+class Command(BaseCommand):
+    help = 'So sánh FeatureEncoder (inplace_predict) với pipeline sklearn trên toàn catalog và đo thời gian.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--random', type=int, default=2000, help='Số profile bị làm nhiễu ngẫu nhiên')
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def timeit(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return float(np.median(timings)) * 1e6
+
+    def handle(self, *args, **options):
+        predictor = predictor_service.predictor
+        pipeline = predictor.model
+        encoder = feature_encoder.FeatureEncoder.from_pipeline(pipeline)
+
+        # Profile: laptop thật trong catalog + bản làm nhiễu (thiếu cột, giá trị lạ, nhãn dạng chuỗi)
+        catalog = list(LaptopInfo.objects.values(*predictor_service.PREDICT_FIELDS))
+        rng = random.Random(options['seed'])
+        profiles = list(catalog)
+        for _ in range(options['random']):
+            profile = dict(rng.choice(catalog))
+            for field in rng.sample(predictor_service.PREDICT_FIELDS, rng.randint(1, 5)):
+                if field in predictor_service.PREDICT_LABEL_FIELDS:
+                    profile[field] = rng.choice(['0', '1', 0, 1, None])
+                elif field in predictor_service.default_imputation_values and rng.random() < 0.5:
+                    profile[field] = None
+                else:
+                    profile[field] = rng.choice(ODD_VALUES + [row[field] for row in rng.sample(catalog, 3)])
+            # Cột số chỉ nhận số hoặc None (giống form / LLM sau khi đã chuẩn hóa)
+            for column, *_ in encoder.numeric:
+                if profile.get(column) is not None and not isinstance(profile[column], (int, float)):
+                    profile[column] = None
+            profiles.append(profile)
+
+        rows = [predictor.impute(profile) for profile in profiles]
+        expected = np.asarray(predictor.pipeline_predict(rows), dtype=np.float64)
+        actual = np.asarray(encoder.predict(rows), dtype=np.float64)
+        max_diff = float(np.max(np.abs(expected - actual) / np.maximum(np.abs(expected), 1)))
+        if max_diff > 1e-6:
+            worst = int(np.argmax(np.abs(expected - actual)))
+            raise AssertionError(f'Encoder lệch pipeline {max_diff:.2e} với {rows[worst]}')
+
+        # Kết quả theo từng dòng phải giống khi dự đoán cả batch (buffer được dùng lại)
+        for row, value in zip(rows[:50], actual[:50]):
+            if abs(float(encoder.predict([row])[0]) - value) > 1e-3:
+                raise AssertionError('Kết quả một dòng khác kết quả batch')
+
+        benchmark = []
+        for size in options['sizes']:
+            batch = rows[:size]
+            pandas_us = self.timeit(lambda: predictor.pipeline_predict(batch), options['repeat'])
+            encoder_us = self.timeit(lambda: encoder.predict(batch), options['repeat'])
+            benchmark.append({
+                'n_profiles': size,
+                'pandas_pipeline_us': round(pandas_us, 1),
+                'feature_encoder_us': round(encoder_us, 1),
+                'speedup': round(pandas_us / encoder_us, 1),
+            })
+
+        self.stdout.write(json.dumps({
+            'profiles_checked': len(rows),
+            'max_relative_diff': max_diff,
+            'benchmark': benchmark,
+        }, indent=2))
@@ -0,0 +1,72 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.intent_classifier import IntentClassifier
+
+DEFAULT_CORPUS = settings.BASE_DIR.parent / 'data' / 'qa_data' / 'laptop_qa.csv'
+
+
+class Command(BaseCommand):
+    help = ('Đo N request đồng thời: gọi model từng câu (cách cũ) so với gom batch, và tỉ lệ cache hit. '
+            'Độ đúng của kết quả được kiểm tra trong chat.tests.IntentServiceTests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='CSV có cột question')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--window-ms', type=float, default=2)
+
+    def run_concurrent(self, classify, questions, concurrency):
+        latencies = []
+
+        def one(question):
+            start = time.perf_counter()
+            classify(question)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(one, questions))
+        elapsed = time.perf_counter() - start
+        return {
+            'throughput_rps': round(len(questions) / elapsed, 1),
+            'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+            'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 3),
+        }
+
+    def handle(self, *args, **options):
+        with open(options['corpus'], encoding='utf-8-sig') as file:
+            questions = [row['question'] for row in csv.DictReader(file) if row['question'].strip()]
+
+        model = IntentClassifier(cache_size=0, batch_window=0).model
+
+        # 1. Request đồng thời, mỗi request một câu khác nhau (cache tắt để chỉ đo gom batch)
+        distinct = [questions[idx % len(questions)] + f' #{idx}' for idx in range(options['requests'])]
+        batcher = IntentClassifier(cache_size=0, batch_window=options['window_ms'] / 1000)
+        batcher.model
+        per_request = self.run_concurrent(lambda question: model.predict([question]), distinct,
+                                          options['concurrency'])
+        batched = self.run_concurrent(lambda question: batcher.classify_many([question]), distinct,
+                                      options['concurrency'])
+        batched['mean_batch_size'] = batcher.stats()['mean_batch_size']
+
+        # 2. Câu hỏi lặp lại (khác hoa thường / khoảng trắng) được trả từ cache
+        cached = IntentClassifier(cache_size=1024, batch_window=options['window_ms'] / 1000)
+        cached.model
+        repeated = [(question.upper() if idx % 2 else f'  {question} ')
+                    for idx, question in enumerate(questions[:200] * 10)]
+        cached_run = self.run_concurrent(lambda question: cached.classify_many([question]), repeated,
+                                         options['concurrency'])
+        cached_run.update(cached.stats())
+
+        self.stdout.write(json.dumps({
+            'questions': len(questions),
+            'concurrency': options['concurrency'],
+            'per_request_predict': per_request,
+            'micro_batched': batched,
+            'repeated_with_cache': cached_run,
+        }, indent=2))
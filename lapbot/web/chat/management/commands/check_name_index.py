@@ -0,0 +1,53 @@
+import csv
+import json
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat import catalog_index, name_index
+
+DEFAULT_CORPUS = settings.BASE_DIR.parent / 'data' / 'qa_data' / 'laptop_qa.csv'
+
+
+class Command(BaseCommand):
+    help = ('Đo name index trên catalog hiện tại: thời gian dựng, tỉ lệ tìm lại laptop bằng chính tên của nó, '
+            'thời gian tra và tỉ lệ khớp trên câu hỏi thật. Các câu gọi tên máy mẫu được kiểm tra trong chat.tests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='CSV có cột question và các cột intent')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = name_index.NameIndex.from_catalog(catalog_index.catalog)
+        report = {'laptops': len(index), 'terms': len(index.vocabulary),
+                  'build_ms': round((time.perf_counter() - start) * 1000, 1)}
+        names = dict(zip(index.product_ids, (row['name'] for row in (catalog_index.catalog.rows if catalog_index.catalog
+                                                                     is not None else []))))
+
+        # 1. Gọi đúng tên đầy đủ của laptop thì laptop đó phải nằm trong kết quả
+        if names:
+            found = sum(1 for product_id, name in names.items()
+                        if (matched := index.match(name)) is not None and product_id in matched['product_ids'])
+            report['self_recall'] = round(found / len(names), 4)
+
+        # 2. Câu hỏi thật: thời gian tra và tỉ lệ khớp theo intent
+        with open(options['corpus'], encoding='utf-8-sig') as file:
+            rows = list(csv.DictReader(file))
+        latencies, hits, corpus_hits = [], {}, 0
+        for row in rows:
+            start = time.perf_counter()
+            matched = index.match(row['question'])
+            latencies.append(time.perf_counter() - start)
+            corpus_hits += matched is not None
+            for intent in ('intent_recommend_budget', 'intent_recommend_usage', 'intent_tech_detail'):
+                total, hit = hits.get(intent, (0, 0))
+                if row.get(intent) == '1':
+                    hits[intent] = (total + 1, hit + (matched is not None))
+        report['corpus'] = {
+            'questions': len(rows),
+            'hit_rate': round(corpus_hits / len(rows), 4),
+            'hit_rate_by_intent': {intent: round(hit / total, 4) for intent, (total, hit) in hits.items()},
+            **{f'p{q}_us': round(float(np.percentile(latencies, q)) * 1e6, 1) for q in (50, 90, 99)},
+        }
+
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,38 @@
+import json
+import random
+import time
+from django.core.management.base import BaseCommand
+from chat import catalog_index, predictor_service, price_catalog
+from chat.predictor_service import PREDICT_FIELDS
+from .bench_catalog_index import LLM_FILTERS
+
+
+class Command(BaseCommand):
+    help = ('Đo thời gian dự đoán giá cả catalog trong một lần gọi model so với từng laptop, và find_deals trên index. '
+            'Tính đúng (khớp dự đoán đơn lẻ, version, index == database) được kiểm tra trong chat.tests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        stats = price_catalog.refresh(force=True)
+        report = {'refresh': stats}
+
+        rows = price_catalog.catalog_rows()
+        sample = random.Random(options['seed']).sample(rows, min(options['samples'], len(rows)))
+        start = time.perf_counter()
+        for row in sample:
+            predictor_service.predictor.predict({field: row[field] for field in PREDICT_FIELDS})
+        single_ms = (time.perf_counter() - start) * 1000 / len(sample)
+        report['single_predict_ms_per_laptop'] = round(single_ms, 3)
+        report['batch_predict_ms_per_laptop'] = round(stats['predict_ms'] / stats['laptops'], 3)
+        report['single_predict_catalog_estimate_ms'] = round(single_ms * len(rows), 1)
+
+        if catalog_index.catalog is not None:
+            start = time.perf_counter()
+            for filters in LLM_FILTERS:
+                price_catalog.find_deals(filters)
+            report['find_deals_index_ms'] = round((time.perf_counter() - start) * 1000 / len(LLM_FILTERS), 3)
+
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
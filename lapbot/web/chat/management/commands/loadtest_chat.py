@@ -0,0 +1,279 @@
+import asyncio
+import csv
+import datetime
+import http.cookiejar
+import json
+import platform
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import django
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient
+from chat import catalog_index, instrumentation, intent_classifier, llms_service, single_flight, startup_snapshot
+
+DEFAULT_CORPUS = settings.BASE_DIR.parent / 'data' / 'qa_data' / 'laptop_qa.csv'
+
+# Endpoint -> body gửi lên (giống frontend)
+ENDPOINTS = {
+    'send_message': ('/chat/send_message/', lambda message: {'user_message': message}),
+    'ai_message_html': ('/chat/ai_message_html/', lambda message: {'data': {'user_message': message}}),
+}
+
+# Các setting ảnh hưởng tới kết quả, ghi kèm vào file kết quả để so sánh giữa các commit
+RECORDED_SETTINGS = ['CHAT_CATALOG_INDEX', 'CHAT_COMPILED_ENCODER', 'CHAT_INTENT_CACHE_SIZE',
+                     'CHAT_INTENT_BATCH_WINDOW_MS', 'CHAT_BUDGET_PARSER_MIN_CONFIDENCE',
+                     'CHAT_PERSONA_MATCHER_MIN_CONFIDENCE', 'CHAT_SINGLE_FLIGHT', 'CHAT_PERSONA_MAX_WORKERS',
+                     'CHAT_PERSONA_SPARE_WORKERS', 'CHAT_PRICING_DEADLINE', 'CHAT_FILTER_DEADLINE', 'CHAT_SUGGESTION_PAGE_SIZE']
+
+METRIC_LINE = re.compile(r'^(chat_(?:stage|llm)_seconds)_(sum|count)\{(.*)\} (\S+)$')
+
+
+def percentiles(latencies):
+    return {f'p{q}_ms': round(float(np.percentile(latencies, q)) * 1000, 2) for q in (50, 95, 99)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def scrape_metrics(base_url):
+    """{(tên histogram, labels): [tổng, số lần]} từ /chat/metrics/ của server."""
+    with urllib.request.urlopen(f'{base_url}/chat/metrics/', timeout=10) as response:
+        text = response.read().decode('utf-8')
+    samples = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            name, kind, labels, value = match.groups()
+            samples.setdefault((name, labels), [0.0, 0])[kind == 'count'] = float(value)
+    return samples
+
+
+class Command(BaseCommand):
+    help = ('Load test đầu cuối cho chat: gửi một tập câu hỏi tiếng Việt thật (laptop_qa.csv) tới send_message / '
+            'ai_message_html với N client đồng thời, LLM giả lập (FakeLLMService). Báo cáo throughput, '
+            'p50/p95/p99, thời gian và bộ nhớ cấp phát theo stage; ghi kết quả ra JSON để so sánh giữa các commit. '
+            'Catalog: database đang cấu hình, vd DB_SQLITE_PATH=<fixture tạo bởi make_catalog_fixture>.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='CSV có cột question')
+        parser.add_argument('--messages', type=int, default=200, help='Số tin nhắn mỗi endpoint')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=8, help='Số client (session) gửi đồng thời')
+        parser.add_argument('--endpoints', default='send_message,ai_message_html')
+        parser.add_argument('--warmup', type=int, default=5, help='Số tin nhắn chạy trước (không tính) mỗi endpoint')
+        parser.add_argument('--llm-latency', default='lognormal:0.3:0.4',
+                            help='Phân phối độ trễ LLM giả lập (xem llms_service.parse_latencies)')
+        parser.add_argument('--llm-error-rate', type=float, default=0.0)
+        parser.add_argument('--llm-cache', action='store_true', help='Bọc LLM giả lập bằng CachedLLMService')
+        parser.add_argument('--allocations', action='store_true',
+                            help='Đo thêm bộ nhớ cấp phát theo stage (tracemalloc, chậm hơn nhiều)')
+        parser.add_argument('--base-url', default='',
+                            help='Gửi tới server đang chạy (vd http://127.0.0.1:8000) thay vì test client; '
+                                 'server cần chạy với CHAT_LLM_MODEL=fake')
+        parser.add_argument('--output', default='', help='File JSON kết quả (mặc định cache/loadtest/<commit>-<thời gian>.json)')
+        parser.add_argument('--compare', default='', help='File JSON kết quả trước đó để so sánh')
+
+    def corpus(self, options):
+        with open(options['corpus'], encoding='utf-8-sig') as file:
+            questions = [row['question'].strip() for row in csv.DictReader(file) if row['question'].strip()]
+        rng = random.Random(options['seed'])
+        count = options['messages'] + options['warmup']
+        return rng.sample(questions, count) if count <= len(questions) else rng.choices(questions, k=count)
+
+    # --- Chạy trong process (AsyncClient, đi qua toàn bộ middleware + view async) -------------
+
+    async def run_in_process(self, endpoint, messages, concurrency):
+        url, payload = ENDPOINTS[endpoint]
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+        latencies, statuses = [], {}
+
+        async def client_loop():
+            client = AsyncClient(HTTP_HOST='localhost')
+            while not queue.empty():
+                message = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post(url, data=payload(message), content_type='application/json')
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        return time.perf_counter() - start, latencies, statuses
+
+    # --- Chạy qua HTTP tới server thật ------------------------------------------------------
+
+    def run_http(self, base_url, endpoint, messages, concurrency):
+        url, payload = ENDPOINTS[endpoint]
+        lock = threading.Lock()
+        pending = list(reversed(messages))
+        latencies, statuses = [], {}
+
+        def client_loop():
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    message = pending.pop()
+                request = urllib.request.Request(f'{base_url}{url}', data=json.dumps(payload(message)).encode(),
+                                                 headers={'Content-Type': 'application/json'})
+                start = time.perf_counter()
+                try:
+                    with opener.open(request, timeout=120) as response:
+                        response.read()
+                        status = response.status
+                except urllib.error.HTTPError as e:
+                    status = e.code
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(client_loop) for _ in range(concurrency)]:
+                future.result()
+        return time.perf_counter() - start, latencies, statuses
+
+    def server_stages(self, before, after):
+        """Thời gian trung bình theo stage / LLM trên server, từ chênh lệch của /chat/metrics/."""
+        result = {}
+        for key, (total, count) in after.items():
+            previous_total, previous_count = before.get(key, [0.0, 0])
+            if count > previous_count:
+                name, labels = key
+                result[f'{name}{{{labels}}}'] = {
+                    'count': int(count - previous_count),
+                    'mean_ms': round((total - previous_total) / (count - previous_count) * 1000, 3),
+                }
+        return result
+
+    # --------------------------------------------------------------------------------------
+
+    def setup_llm(self, options):
+        fake = llms_service.get_llm_service('fake', latency=options['llm_latency'],
+                                            error_rate=options['llm_error_rate'], seed=options['seed'])
+        llms_service.llms = llms_service.CachedLLMService(fake) if options['llm_cache'] else fake
+
+    def reset_state(self):
+        """Mỗi endpoint bắt đầu từ trạng thái như nhau: cache intent / LLM rỗng, metrics về 0."""
+        instrumentation.reset()
+        intent_classifier.classifier.clear()
+        if isinstance(llms_service.llms, llms_service.CachedLLMService):
+            llms_service.llms.clear()
+
+    def run_endpoint(self, endpoint, warmup, messages, options):
+        base_url = options['base_url'].rstrip('/')
+        if base_url:
+            self.run_http(base_url, endpoint, warmup, options['concurrency'])
+            before = scrape_metrics(base_url)
+            elapsed, latencies, statuses = self.run_http(base_url, endpoint, messages, options['concurrency'])
+            stages = {'server': self.server_stages(before, scrape_metrics(base_url))}
+        else:
+            asyncio.run(self.run_in_process(endpoint, warmup, options['concurrency']))
+            self.reset_state()
+            elapsed, latencies, statuses = asyncio.run(
+                self.run_in_process(endpoint, messages, options['concurrency']))
+            stages = {
+                'stages': instrumentation.STAGE_SECONDS.summary(),
+                'llm': instrumentation.LLM_SECONDS.summary(),
+                'allocations': instrumentation.allocation_summary() if options['allocations'] else None,
+                'intent_cache': intent_classifier.classifier.stats(),
+                'single_flight': single_flight.coalescer.stats() if single_flight.coalescer else None,
+            }
+
+        return {
+            'requests': len(latencies),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'elapsed_s': round(elapsed, 3),
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'mean_ms': round(float(np.mean(latencies)) * 1000, 2),
+            **percentiles(latencies),
+            **stages,
+        }
+
+    def metadata(self, options):
+        catalog = catalog_index.catalog
+        return {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'catalog_size': len(catalog.rows) if catalog is not None else None,
+            'catalog_checksum': startup_snapshot.catalog_checksum(catalog.rows) if catalog is not None else None,
+            'mode': 'http' if options['base_url'] else 'in_process',
+            'options': {key: options[key] for key in ('messages', 'seed', 'concurrency', 'warmup', 'llm_latency',
+                                                      'llm_error_rate', 'llm_cache', 'allocations', 'base_url')},
+            'settings': {name: getattr(settings, name, None) for name in RECORDED_SETTINGS},
+        }
+
+    def compare(self, previous, current):
+        """Chênh lệch (%) của các chỉ số chính so với lần chạy trước."""
+        def change(old, new):
+            return f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+
+        lines = [f"So với {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')}):"]
+        for endpoint, result in current['endpoints'].items():
+            old = previous['endpoints'].get(endpoint)
+            if old is None:
+                continue
+            lines.append(f'  {endpoint}: ' + ', '.join(
+                f'{key} {old[key]} -> {result[key]} ({change(old[key], result[key])})'
+                for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')))
+            for stage, stats in (result.get('stages') or {}).items():
+                old_stats = (old.get('stages') or {}).get(stage)
+                if old_stats:
+                    lines.append(f"    {stage}: p95 {old_stats['p95_ms']} -> {stats['p95_ms']} ms "
+                                 f"({change(old_stats['p95_ms'], stats['p95_ms'])})")
+        return '\n'.join(lines)
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint.strip() for endpoint in options['endpoints'].split(',') if endpoint.strip()]
+        unknown = [endpoint for endpoint in endpoints if endpoint not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f'Endpoint không hỗ trợ: {unknown}. Các lựa chọn: {list(ENDPOINTS)}')
+
+        messages = self.corpus(options)
+        warmup, messages = messages[:options['warmup']], messages[options['warmup']:]
+
+        original_llms = getattr(llms_service, 'llms', None)
+        if not options['base_url']:
+            self.setup_llm(options)
+        instrumentation.enable_allocation_tracking(options['allocations'])
+        try:
+            results = {endpoint: self.run_endpoint(endpoint, warmup, messages, options) for endpoint in endpoints}
+        finally:
+            instrumentation.enable_allocation_tracking(False)
+            llms_service.llms = original_llms
+
+        report = {'meta': self.metadata(options), 'endpoints': results}
+        output = options['output'] or (settings.BASE_DIR / 'cache' / 'loadtest' /
+                                        f"{report['meta']['commit'] or 'nocommit'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        output = settings.BASE_DIR / output
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+
+        for endpoint, result in results.items():
+            self.stdout.write(f"{endpoint}: {result['requests']} request, {result['throughput_rps']} req/s, "
+                              f"p50 {result['p50_ms']} / p95 {result['p95_ms']} / p99 {result['p99_ms']} ms, "
+                              f"status {result['statuses']}")
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                self.stdout.write(self.compare(json.load(file), report))
+        self.stdout.write(f'Đã ghi kết quả vào {output}')
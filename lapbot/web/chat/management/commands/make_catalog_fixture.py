@@ -0,0 +1,70 @@
+import csv
+import itertools
+import time
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from chat.models import LaptopInfo
+
+DEFAULT_SOURCE = settings.BASE_DIR.parent / 'data' / 'product_data_layer' / 'gold' / 'laptop_gold.csv'
+FIXTURE_ALIAS = 'catalog_fixture'
+
+
+class Command(BaseCommand):
+    help = ('Tạo database SQLite cho load test / benchmark offline: các bảng của Django (migrate) '
+            'và bảng laptop_info (unmanaged) nạp từ file gold CSV hoặc copy từ database hiện tại. '
+            'Dùng bằng cách đặt DB_SQLITE_PATH=<file>.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Đường dẫn file SQLite cần tạo')
+        parser.add_argument('--source', default=str(DEFAULT_SOURCE), help='CSV catalog (cột trùng tên field của LaptopInfo)')
+        parser.add_argument('--from-db', action='store_true', help='Copy laptop_info từ database default thay vì đọc CSV')
+        parser.add_argument('--limit', type=int, default=0, help='Chỉ lấy N laptop đầu tiên (0 = tất cả)')
+        parser.add_argument('--force', action='store_true', help='Ghi đè nếu file đã tồn tại')
+
+    def read_csv(self, path):
+        fields = {field.column: field for field in LaptopInfo._meta.concrete_fields}
+        with open(path, encoding='utf-8-sig') as file:
+            reader = csv.DictReader(file)
+            missing = set(fields) - set(reader.fieldnames)
+            if missing:
+                raise CommandError(f'CSV thiếu cột: {sorted(missing)}')
+            for row in reader:
+                # IntegerField nhận được '1.0' từ CSV, nên đi qua float trước
+                yield LaptopInfo(**{
+                    field.attname: None if row[column] == '' else
+                    field.to_python(float(row[column])) if field.get_internal_type() == 'IntegerField' else
+                    field.to_python(row[column])
+                    for column, field in fields.items()
+                })
+
+    def handle(self, *args, **options):
+        output = settings.BASE_DIR / options['output']
+        if output.exists():
+            if not options['force']:
+                raise CommandError(f'{output} đã tồn tại (dùng --force để ghi đè).')
+            output.unlink()
+        output.parent.mkdir(parents=True, exist_ok=True)
+
+        start = time.perf_counter()
+        connections.settings[FIXTURE_ALIAS] = connections.configure_settings({
+            'default': connections.settings['default'],
+            FIXTURE_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(output)},
+        })[FIXTURE_ALIAS]
+        try:
+            call_command('migrate', database=FIXTURE_ALIAS, verbosity=0)
+            with connections[FIXTURE_ALIAS].schema_editor() as editor:
+                editor.create_model(LaptopInfo)
+
+            laptops = LaptopInfo.objects.all().order_by('pk').iterator() if options['from_db'] \
+                else self.read_csv(options['source'])
+            if options['limit']:
+                laptops = itertools.islice(laptops, options['limit'])
+            created = LaptopInfo.objects.using(FIXTURE_ALIAS).bulk_create(laptops, batch_size=500)
+        finally:
+            connections[FIXTURE_ALIAS].close()
+            del connections.settings[FIXTURE_ALIAS]
+
+        self.stdout.write(f'Đã tạo {output} với {len(created)} laptop trong {time.perf_counter() - start:.1f}s. '
+                          f'Chạy với DB_SQLITE_PATH={output}')
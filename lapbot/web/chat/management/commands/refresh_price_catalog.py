@@ -0,0 +1,25 @@
+import json
+from django.core.management.base import BaseCommand
+from chat import price_catalog
+
+
+class Command(BaseCommand):
+    help = ('Dự đoán giá cho toàn bộ catalog trong một lần gọi model và lưu giá dự đoán + deal score '
+            '(bảng laptop_price_prediction). Bỏ qua nếu model và catalog chưa đổi, trừ khi có --force.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Tính lại kể cả khi bảng đã khớp version')
+        parser.add_argument('--top', type=int, default=5, help='In ra N laptop có deal score cao nhất')
+
+    def handle(self, *args, **options):
+        stats = price_catalog.refresh(force=options['force'])
+        model_version, catalog_version = price_catalog.versions()
+        self.stdout.write(json.dumps({
+            'refreshed': stats is not None,
+            **(stats or {'laptops': len(price_catalog.predictions or ()), 'model_version': model_version,
+                         'catalog_version': catalog_version}),
+            'top_deals': [
+                {field: deal[field] for field in ('product_id', 'name', 'discounted_price', 'predicted_price', 'deal_score')}
+                for deal in price_catalog.find_deals(limit=options['top'])
+            ],
+        }, indent=2, ensure_ascii=False))
@@ -0,0 +1,109 @@
+import re
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+from . import instrumentation
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+class TraceMiddleware:
+    """
+    Gán trace ID cho mỗi request (lấy từ header X-Trace-Id nếu client / proxy gửi kèm),
+    trả lại trong header của response và đo thời gian xử lý theo view (chat_request_seconds).
+    Hỗ trợ cả sync và async để không buộc Django bọc các view async vào thread.
+    Với StreamingHttpResponse, thời gian đo tới lúc trả về response (trước khi stream xong).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token, start = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.trace_id.reset(token)
+        return self.finish(request, response, start)
+
+    async def __acall__(self, request):
+        token, start = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.trace_id.reset(token)
+        return self.finish(request, response, start)
+
+    def start(self, request):
+        request.trace_id = request.headers.get(instrumentation.TRACE_HEADER) or instrumentation.new_trace_id()
+        return instrumentation.trace_id.set(request.trace_id), time.perf_counter()
+
+    def finish(self, request, response, start):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        instrumentation.REQUEST_SECONDS.observe(time.perf_counter() - start, view=view)
+        response[instrumentation.TRACE_HEADER] = request.trace_id
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Nén response JSON lớn (danh sách laptop gợi ý, HTML fragment trong JSON) bằng brotli nếu trình duyệt
+    hỗ trợ và đã cài brotli / brotlicffi, nếu không thì gzip.
+    - Chỉ nén application/json từ CHAT_COMPRESS_MIN_BYTES byte trở lên (response nhỏ không đáng nén).
+    - Không nén StreamingHttpResponse: SSE cần gửi ngay từng sự kiện.
+    - Không nén trang HTML (có CSRF token) để hạn chế tấn công BREACH; gzip thêm byte ngẫu nhiên
+      vào header như GZipMiddleware của Django.
+    """
+
+    max_random_bytes = 100
+
+    def compress(self, request, content):
+        """(nội dung đã nén, encoding) hoặc None nếu client không nhận encoding nào."""
+        accept_encoding = request.headers.get('Accept-Encoding', '')
+        if brotli is not None and ACCEPTS_BROTLI.search(accept_encoding):
+            return brotli.compress(content, quality=settings.CHAT_BROTLI_QUALITY), 'br'
+        if ACCEPTS_GZIP.search(accept_encoding):
+            return compress_string(content, max_random_bytes=self.max_random_bytes), 'gzip'
+        return None
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        if len(response.content) < settings.CHAT_COMPRESS_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        with instrumentation.stage('compress'):
+            compressed = self.compress(request, response.content)
+        if compressed is None or len(compressed[0]) >= len(response.content):
+            return response
+
+        response.content, encoding = compressed
+        response.headers['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 6.1.2 on 2026-10-18 13:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user_message', models.TextField()),
+                ('intent_codes', models.JSONField(default=list)),
+                ('intent_meanings', models.JSONField(default=list)),
+                ('ai_response', models.JSONField(null=True)),
+                ('session', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='sessions.session')),
+            ],
+            options={
+                'db_table': 'chat_message',
+                'indexes': [models.Index(fields=['session', 'id'], name='chat_messag_session_f95c7b_idx')],
+            },
+        ),
+    ]
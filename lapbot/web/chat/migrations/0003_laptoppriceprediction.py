@@ -0,0 +1,29 @@
+# Generated by Django 6.1.2 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chatmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LaptopPricePrediction',
+            fields=[
+                ('product_id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('predicted_price', models.FloatField()),
+                ('residual', models.FloatField(null=True)),
+                ('deal_score', models.FloatField(null=True)),
+                ('model_version', models.CharField(max_length=16)),
+                ('catalog_version', models.CharField(max_length=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'laptop_price_prediction',
+                'indexes': [models.Index(fields=['deal_score'], name='laptop_pric_deal_sc_ac3859_idx')],
+            },
+        ),
+    ]
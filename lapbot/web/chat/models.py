@@ -5,6 +5,7 @@
 #   * Make sure each ForeignKey and OneToOneField has `on_delete` set to the desired behavior
 #   * Remove `managed = False` lines if you wish to allow Django to create, modify, and delete the table
 # Feel free to rename the models, but don't rename db_table values or field names.
+from django.contrib.sessions.models import Session
 from django.db import models
 
 class LaptopInfo(models.Model):
@@ -56,4 +57,41 @@ class LaptopInfo(models.Model):
 
     class Meta:
         managed = False
-        db_table = 'laptop_info'
\ No newline at end of file
+        db_table = 'laptop_info'
+
+
+class ChatMessage(models.Model):
+    """
+    Một lượt hỏi đáp trong lịch sử chat của một session (xem chat.chat_history).
+    Chỉ lưu tham chiếu gọn: laptop gợi ý lưu dạng product_ids, dữ liệu laptop lấy lại từ catalog lúc hiển thị.
+    """
+    # Không tạo foreign key constraint (session có thể được tạo cùng lúc bởi request khác),
+    # nhưng vẫn xóa theo khi session hết hạn bị xóa (clearsessions)
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, db_constraint=False, related_name='chat_messages')
+    created_at = models.DateTimeField(auto_now_add=True)
+    user_message = models.TextField() # câu hỏi gốc (chưa convert Markdown)
+    intent_codes = models.JSONField(default=list)
+    intent_meanings = models.JSONField(default=list)
+    ai_response = models.JSONField(null=True) # ai_response đã thay suggested_laptops bằng product_ids
+
+    class Meta:
+        db_table = 'chat_message'
+        indexes = [models.Index(fields=['session', 'id'])]
+
+
+class LaptopPricePrediction(models.Model):
+    """
+    Giá dự đoán bởi PricePredictor cho từng laptop trong catalog (xem chat.price_catalog).
+    Bảng riêng vì laptop_info không do Django quản lý; tính lại cả bảng khi model hoặc catalog đổi.
+    """
+    product_id = models.CharField(max_length=50, primary_key=True) # LaptopInfo.product_id
+    predicted_price = models.FloatField()
+    residual = models.FloatField(null=True) # discounted_price - predicted_price (âm = rẻ hơn giá trị cấu hình)
+    deal_score = models.FloatField(null=True) # (predicted_price - discounted_price) / predicted_price
+    model_version = models.CharField(max_length=16)
+    catalog_version = models.CharField(max_length=16)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'laptop_price_prediction'
+        indexes = [models.Index(fields=['deal_score'])]
@@ -0,0 +1,232 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+from .text_utils import fold
+
+# ==============================================================================
+# TÌM LAPTOP THEO TÊN (KHÔNG CẦN LLM)
+# Người dùng hay gọi thẳng tên máy ("Dell XPS 13", "Nitro V ANV15", "tuf a15"). Index ngược trong
+# bộ nhớ trên name, cpu_model và vga_type của catalog, dựng một lần lúc khởi động:
+# - Token: văn bản đã bỏ dấu (text_utils.fold), tách theo ký tự chữ / số ("RTX4050/144Hz" -> rtx4050, 144hz).
+# - Ngoài từng token còn index cặp token liền nhau viết liền ("nitro 5" -> nitro5), nên "nitro5" và
+#   "nitro 5" khớp như nhau; token của câu hỏi từ 3 ký tự cũng khớp theo tiền tố ("anv" -> anv15).
+# - Điểm BM25 (k1, b), cộng theo trọng số từng cột (FIELD_WEIGHTS); token có trong hơn MAX_DF_RATIO
+#   catalog (laptop, card...) bị bỏ qua vì không phân biệt được máy nào.
+# Chỉ các laptop khớp một token "neo" mới được tính điểm: hiếm trong catalog, có chữ cái, không phải
+# thông số (16gb, 144hz, rtx4050...), không phải chữ tiếng Việt có dấu ("cần", "Cấn"), và phải có chữ số
+# (anv15, a15) hoặc là tên hãng / dòng máy của catalog (tuf, xps, vivobook), xem match(). Nhờ vậy chữ
+# tiếng Việt gõ không dấu / tên riêng ("chi nhanh Kha Van Can") không bị coi là tên máy.
+# Tin nhắn bình thường không có token neo nào nên dừng ngay sau bước tra từ điển.
+# ==============================================================================
+
+FIELD_WEIGHTS = {'name': 1.0, 'cpu_model': 0.5, 'vga_type': 0.5}
+K1 = 1.2
+B = 0.75
+PREFIX_WEIGHT = 0.6 # Khớp theo tiền tố được tính 60% điểm của khớp nguyên token
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 16
+MAX_DF_RATIO = 0.2 # Token có trong hơn 20% catalog bị bỏ qua
+
+# Token neo: có trong tối đa ANCHOR_MAX_DF_RATIO catalog
+ANCHOR_MAX_DF_RATIO = 0.05
+# Laptop có điểm từ RESULT_MIN_RATIO * điểm cao nhất được trả về cùng
+RESULT_MIN_RATIO = 0.7
+# Số token chữ đầu tiên của tên (sau "laptop" và tên hãng) được coi là tên dòng máy ("TUF Gaming", "Vivobook S")
+SERIES_TOKENS = 2
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# Thông số kỹ thuật hay nằm trong tên (RAM, ổ cứng, màn hình, card, hệ điều hành...): vẫn được index
+# nhưng không làm neo, để "laptop 16gb 144hz" không bị coi là gọi tên máy
+SPEC_PATTERN = re.compile(r'^(?:\d+(?:gb|tb|hz|mhz|w|inch|cpu|gpu|core|mp)|(?:rtx|gtx|rx|mx)\d*|ddr\d*|lpddr\d*|'
+                          r'[ir]\d|core|ultra|cpu|gpu|win\d*|office\w*|ram|ssd|hdd|oled|ips|fhd|qhd|uhd|gen\d*|ai)$')
+MODEL_CODE_PATTERN = re.compile(r'^(?=.*[a-z])(?=.*\d)[a-z0-9]{4,}$')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(fold(text)) if text else []
+
+
+def accented_tokens(text):
+    """Token đến từ các từ có dấu tiếng Việt (vd "Cấn" -> can): là chữ tiếng Việt, không phải tên máy."""
+    if not text:
+        return set()
+    return {token for word in text.split() if not word.isascii() for token in tokenize(word)}
+
+
+def series_tokens(name, brands):
+    """Tên dòng máy trong tên laptop: "Laptop Asus TUF Gaming F15" -> tuf, gaming; "MacBook Air M3" -> macbook, air."""
+    tokens = [token for token in tokenize(name) if token != 'laptop' and token not in brands]
+    return {token for token in tokens[:SERIES_TOKENS] if token.isalpha()}
+
+
+def terms(tokens):
+    """Token đơn + cặp token liền nhau viết liền."""
+    return tokens + [first + second for first, second in zip(tokens, tokens[1:])]
+
+
+class NameIndex:
+    def __init__(self, rows):
+        """:param rows: list dict có product_id, manufacturer và các cột trong FIELD_WEIGHTS (vd CatalogIndex.rows)."""
+        self.product_ids = [row['product_id'] for row in rows]
+        # Tên hãng (bỏ "hãng khác") và tên dòng máy: token neo không có chữ số phải thuộc tập này
+        brands = {token for row in rows if (row.get('manufacturer') or '').isascii()
+                  for token in tokenize(row.get('manufacturer'))}
+        self.known_names = brands.union(*(series_tokens(row.get('name'), brands) for row in rows))
+        postings = defaultdict(dict) # term -> {vị trí dòng: tf đã nhân trọng số cột}
+        lengths = []
+        self.vietnamese = set()
+        for idx, row in enumerate(rows):
+            length = 0.0
+            for field, weight in FIELD_WEIGHTS.items():
+                field_terms = terms(tokenize(row.get(field)))
+                length += weight * len(field_terms)
+                for term in field_terms:
+                    postings[term][idx] = postings[term].get(idx, 0.0) + weight
+                self.vietnamese |= accented_tokens(row.get(field))
+            lengths.append(length)
+
+        count = len(rows)
+        average_length = sum(lengths) / count if count else 0.0
+        self.max_df = MAX_DF_RATIO * count
+        self.anchor_max_df = max(ANCHOR_MAX_DF_RATIO * count, 1)
+        self.df = {term: len(docs) for term, docs in postings.items()}
+        self.vocabulary = sorted(postings)
+
+        # Tính sẵn phần điểm BM25 của từng (term, laptop): lúc tìm chỉ còn cộng
+        self.postings = {}
+        for term, docs in postings.items():
+            df = len(docs)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            self.postings[term] = {
+                idx: idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[idx] / average_length))
+                for idx, tf in docs.items()
+            }
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        rows = catalog.rows if catalog is not None else None
+        if rows is None:
+            from .models import LaptopInfo
+            rows = list(LaptopInfo.objects.values('product_id', 'manufacturer', *FIELD_WEIGHTS))
+        index = cls(rows)
+        print(f"Built name index with {len(index.vocabulary)} terms.")
+        return index
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def expand(self, term, prefix=True):
+        """[(term trong index, hệ số)]: khớp nguyên token, hoặc theo tiền tố nếu không có."""
+        if term in self.postings:
+            return [(term, 1.0)]
+        if not prefix or len(term) < MIN_PREFIX_LENGTH:
+            return []
+        start = bisect.bisect_left(self.vocabulary, term)
+        expanded = []
+        for candidate in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(term):
+                break
+            expanded.append((candidate, PREFIX_WEIGHT))
+        return expanded
+
+    def is_anchor(self, query_term, term):
+        return (self.df[term] <= self.anchor_max_df and len(query_term) >= 2 and not query_term.isdigit()
+                and not SPEC_PATTERN.match(query_term) and term not in self.vietnamese
+                and (term in self.known_names or any(char.isdigit() for char in query_term)))
+
+    def query_terms(self, message):
+        """[(term, các token tạo thành term, có thể làm neo)]: token đơn rồi cặp token liền nhau."""
+        tokens = tokenize(message)
+        vietnamese = accented_tokens(message)
+        query_terms = [(token, (token,), token not in vietnamese) for token in dict.fromkeys(tokens)]
+        # Cặp chỉ làm neo khi cả hai token đều có ý nghĩa ("air m3"), không phải "laptop gaming"
+        query_terms += [(first + second, (first, second), all(self.df.get(token, 0) <= self.max_df and
+                                                              token not in vietnamese for token in (first, second)))
+                        for first, second in dict.fromkeys(zip(tokens, tokens[1:]))]
+        return query_terms
+
+    def search(self, message):
+        """
+        [(vị trí dòng, điểm, các token của câu hỏi đã khớp)] theo điểm giảm dần, chỉ gồm các laptop khớp
+        ít nhất một token neo (các laptop khác không bao giờ được trả về, không cần tính điểm).
+        Cặp token khớp được tính là khớp cả hai token.
+        """
+        expanded = []
+        for query_term, parts, anchor_capable in self.query_terms(message):
+            # Chữ tiếng Việt có dấu không khớp theo tiền tố ("lên" -> lenovo)
+            for term, factor in self.expand(query_term, prefix=anchor_capable):
+                if self.df[term] <= self.max_df:
+                    expanded.append((term, factor, parts, anchor_capable and self.is_anchor(query_term, term)))
+
+        candidates = set()
+        for term, _, _, anchor in expanded:
+            if anchor:
+                candidates.update(self.postings[term])
+        if not candidates:
+            return []
+
+        scores = dict.fromkeys(candidates, 0.0)
+        matched = {idx: set() for idx in candidates}
+        for term, factor, parts, _ in expanded:
+            docs = self.postings[term]
+            # Duyệt phía nhỏ hơn: posting của token phổ biến dài hơn nhiều so với số ứng viên
+            found = [idx for idx in candidates if idx in docs] if len(docs) > len(candidates) else \
+                [idx for idx in docs if idx in candidates]
+            for idx in found:
+                scores[idx] += factor * docs[idx]
+                matched[idx].update(parts)
+
+        ranked = sorted(candidates, key=lambda idx: (-scores[idx], idx))
+        return [(idx, scores[idx], matched[idx]) for idx in ranked]
+
+    def match(self, message, limit=None):
+        """
+        Trả về {'query', 'product_ids', 'total'} nếu tin nhắn gọi tên một (dòng) máy cụ thể, ngược lại None.
+        Laptop tốt nhất phải khớp token neo, và khớp ít nhất 2 token hoặc một mã model (vd anv15, fa507nur).
+        """
+        results = self.search(message)
+        accepted = False
+        if results:
+            _, best_score, best_tokens = results[0]
+            accepted = len(best_tokens) >= 2 or any(MODEL_CODE_PATTERN.match(token) for token in best_tokens)
+        with self._lock:
+            if accepted:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not accepted:
+            return None
+
+        selected = [idx for idx, score, _ in results if score >= RESULT_MIN_RATIO * best_score]
+        # Giữ nguyên cách viết của người dùng cho các từ đã khớp
+        query = ' '.join(word.strip(',.;:?!') for word in message.split() if set(tokenize(word)) & best_tokens)
+        return {
+            'query': query,
+            'product_ids': [self.product_ids[idx] for idx in selected[:limit]],
+            'total': len(selected),
+        }
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'terms': len(self.vocabulary),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Instance dùng chung, được gán trong ChatConfig.ready() (None = không tìm theo tên)
+index = None
+
+
+def refresh(catalog=None):
+    global index
+    index = NameIndex.from_catalog(catalog)
+    return index
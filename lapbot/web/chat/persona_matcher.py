@@ -0,0 +1,122 @@
+import re
+from .budget_parser import BypassMetrics
+from .text_utils import fold
+
+# ==============================================================================
+# GHÉP PERSONA CHO INTENT NHU CẦU SỬ DỤNG (KHÔNG CẦN LLM)
+# Phần lớn câu trả lời của SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE chỉ là một persona
+# + các cột nhu cầu 0/1 (gaming, mong_nhe, ...) + vài ngưỡng (RAM, card rời...).
+# match_persona() dò từ khóa / từ đồng nghĩa trên văn bản đã bỏ dấu và dựng cùng cấu trúc
+# {persona, filters}. Câu không khớp persona nào, hoặc khớp nhiều persona ngang nhau
+# ("học tập và chơi game"), vẫn được chuyển cho LLM.
+# Từ khóa gốc lấy từ src/qa_data/enrich/config.INTENT_DEFINITIONS['recommend_usage']
+# (module đó cần GOOGLE_API_KEY lúc import nên không import trực tiếp được), bổ sung
+# thêm từ đồng nghĩa / cách viết thường gặp.
+# ==============================================================================
+
+# INTENT_DEFINITIONS['recommend_usage']['keywords_vi']
+USAGE_KEYWORDS = ["học tập", "đồ họa", "chơi game", "lập trình", "thiết kế", "chỉnh sửa video", "công nghệ thông tin",
+                  "marketing", "kế toán", "kỹ thuật", "dựng phim", "autocad", "solidworks", "photoshop", "adobe", "canva",
+                  "truyền thông", "văn phòng", "cơ bản", "giải trí"]
+
+# Persona -> từ khóa và filters. Tên persona và cách nhóm từ khóa theo ví dụ trong prompt.
+PERSONAS = {
+    'Học tập - Văn phòng': {
+        'keywords': ["học tập", "văn phòng", "kế toán", "marketing", "cơ bản", "giải trí", "sinh viên", "học sinh",
+                     "đi học", "word", "excel", "powerpoint", "office", "lướt web", "xem phim", "học online",
+                     "nhân viên", "hành chính", "kinh tế", "ngôn ngữ", "luật", "giáo viên", "giảng dạy"],
+        'filters': {'hoc_tap_van_phong': 1},
+    },
+    'Lập trình - Kỹ thuật': {
+        'keywords': ["lập trình", "công nghệ thông tin", "kỹ thuật", "cntt", "ngành it", "học it", "code", "coding",
+                     "developer", "lập trình viên", "khoa học máy tính", "data", "machine learning", "máy ảo",
+                     "docker", "android studio", "visual studio"],
+        'filters': {'cpu_threads__gte': 12, 'ram_storage__gte': 16},
+    },
+    'Đồ họa - Sáng tạo': {
+        'keywords': ["đồ họa", "thiết kế", "chỉnh sửa video", "dựng phim", "photoshop", "adobe", "canva",
+                     "truyền thông", "edit video", "edit ảnh", "chỉnh ảnh", "premiere", "after effects", "illustrator",
+                     "lightroom", "sáng tạo nội dung", "youtube", "tiktok", "render", "3d", "blender", "autocad",
+                     "solidworks", "revit", "sketchup", "3ds max", "kiến trúc"],
+        'filters': {'laptop_sang_tao_noi_dung': 1, 'ram_storage__gte': 16},
+    },
+    'Gaming': {
+        'keywords': ["chơi game", "gaming", "game", "esport", "fps", "liên minh", "lol", "valorant", "genshin", "gta",
+                     "pubg", "fifa", "csgo", "cs2", "dota", "naraka", "game aaa", "stream game"],
+        'filters': {'gaming': 1, 'vga_brand__in': ['nvidia', 'amd'], 'ram_storage__gte': 16},
+    },
+    'Mỏng nhẹ': {
+        'keywords': ["mỏng nhẹ", "nhỏ gọn", "gọn nhẹ", "di chuyển nhiều", "mang đi", "đi lại nhiều", "công tác",
+                     "cầm theo"],
+        'filters': {'mong_nhe': 1},
+    },
+    'Cao cấp - Sang trọng': {
+        'keywords': ["cao cấp", "sang trọng", "doanh nhân", "premium", "đẳng cấp"],
+        'filters': {'cao_cap_sang_trong': 1},
+    },
+}
+
+# Từ phủ định ngay trước từ khóa ("không chơi game") -> bỏ qua từ khóa đó
+NEGATION_PATTERN = re.compile(r'\b(?:khong|ko|k|chua|it khi|hiem khi)(?: \w+)?\s*$')
+NEGATION_WINDOW = 16
+
+# Ngưỡng kỹ thuật người dùng nói rõ, ghi đè ngưỡng mặc định của persona
+THRESHOLD_PATTERNS = [
+    (re.compile(r'\bram\s*(\d{1,2})\s*gb?\b|\b(\d{1,2})\s*gb?\s*ram\b'), 'ram_storage__gte', int),
+    (re.compile(r'\bssd\s*(\d{3,4})\s*gb?\b|\b(\d{3,4})\s*gb?\s*ssd\b'), 'storage_gb__gte', int),
+    (re.compile(r'\bssd\s*(\d)\s*tb\b|\b(\d)\s*tb\s*ssd\b'), 'storage_gb__gte', lambda value: int(value) * 1024),
+    (re.compile(r'\b(\d{2,3})\s*hz\b'), 'refresh_rate__gte', int),
+    (re.compile(r'\b(?:duoi|nhe hon)\s*(\d(?:[.,]\d)?)\s*kg\b'), 'product_weight__lte',
+     lambda value: float(value.replace(',', '.'))),
+]
+DEDICATED_GPU_PATTERN = re.compile(r'\b(?:card roi|vga roi|gpu roi|card do hoa roi|rtx|gtx)\b')
+
+
+def keyword_pattern(keywords):
+    return re.compile(r'\b(?:' + '|'.join(re.escape(fold(keyword)) for keyword in
+                                          sorted(keywords, key=len, reverse=True)) + r')\b')
+
+
+PERSONA_PATTERNS = {persona: keyword_pattern(spec['keywords']) for persona, spec in PERSONAS.items()}
+
+
+def matched_keywords(text, pattern):
+    """Các từ khóa khớp, bỏ những từ bị phủ định ngay phía trước."""
+    return [match.group() for match in pattern.finditer(text)
+            if not NEGATION_PATTERN.search(text[max(0, match.start() - NEGATION_WINDOW):match.start()])]
+
+
+def explicit_thresholds(text):
+    filters = {}
+    for pattern, key, convert in THRESHOLD_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            filters[key] = convert(next(group for group in match.groups() if group))
+    if DEDICATED_GPU_PATTERN.search(text):
+        filters['vga_brand__in'] = ['nvidia', 'amd']
+    return filters
+
+
+def match_persona(message):
+    """
+    Trả về {'persona', 'filters', 'confidence', 'keywords'}; persona là None nếu không khớp.
+    confidence = số từ khóa của persona tốt nhất / (tốt nhất + persona thứ hai).
+    """
+    text = fold(message)
+    scores = {persona: matched_keywords(text, pattern) for persona, pattern in PERSONA_PATTERNS.items()}
+    ranked = sorted(scores.items(), key=lambda item: len(item[1]), reverse=True)
+    (best, best_keywords), (_, second_keywords) = ranked[0], ranked[1]
+
+    if not best_keywords:
+        return {'persona': None, 'filters': {}, 'confidence': 0.0, 'keywords': []}
+
+    filters = {**PERSONAS[best]['filters'], **explicit_thresholds(text)}
+    return {
+        'persona': best,
+        'filters': filters,
+        'confidence': round(len(best_keywords) / (len(best_keywords) + len(second_keywords)), 4),
+        'keywords': best_keywords,
+    }
+
+
+metrics = BypassMetrics()
@@ -1,27 +1,55 @@
+import hashlib
 import joblib
-import pandas as pd
-from django.db.models import Avg, Count
-from .models import LaptopInfo
+import os
+import threading
+from django.conf import settings
+from . import catalog_stats, feature_encoder
 
-def calculate_default_values():
+# Thứ tự các cột mà pipeline của model mong đợi
+PREDICT_FIELDS = ['storage_max_support', 'storage_gb', 'display_width', 'cpu_threads', 'cpu_cores', 
+                  'ram_speed', 'cpu_speed', 'ram_storage', 'ram_slots', 'battery_capacity', 
+                  'display_height', 'laptop_sang_tao_noi_dung', 'do_hoa_ky_thuat', 'cao_cap_sang_trong', 
+                  'material', 'manufacturer', 'ram_type', 'os_version', 'laptop_color', 'vga_brand', 'laptop_camera', 'cpu_brand']
+PREDICT_LABEL_FIELDS = ['laptop_sang_tao_noi_dung', 'do_hoa_ky_thuat', 'cao_cap_sang_trong']
+MODEL_PATH = 'chat/model/best_model_xgb.joblib'
+
+_model_versions = {}
+
+# Giá trị mặc định để impute, gán bởi startup_snapshot.apply() (rỗng với lệnh manage.py không nạp catalog)
+default_imputation_values = {}
+
+
+def model_version(path=MODEL_PATH):
+    """Hash nội dung file model (đổi khi deploy model mới), tính lại khi file đổi mtime / kích thước."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 'missing'
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _model_versions:
+        with open(path, 'rb') as file:
+            _model_versions[key] = hashlib.sha256(file.read()).hexdigest()[:16]
+    return _model_versions[key]
+
+def calculate_default_values(stats=None):
     categorical_features = ['manufacturer', 'cpu_brand', 'material', 'os_version', 'laptop_color', 'vga_brand',
             'laptop_camera', 'ram_type', 'laptop_sang_tao_noi_dung', 'do_hoa_ky_thuat', 'cao_cap_sang_trong']
     numeric_features = ['storage_max_support', 'storage_gb', 'display_width', 'cpu_threads', 'cpu_cores', 
                     'ram_speed', 'cpu_speed', 'ram_storage', 'ram_slots', 'battery_capacity', 'display_height']
     
     """
-    Sử dụng Django ORM để tính toán giá trị mặc định (mean/mode)
-    cho tất cả các feature từ database.
+    Tính giá trị mặc định (mean/mode) cho tất cả các feature từ thống kê catalog
+    (CatalogStats, duyệt database một lần duy nhất và dùng chung với schema generator).
     """
+    if stats is None:
+        stats = catalog_stats.build()
+
     default = {}
-    print("Calculating default imputation values from database...")
+    print("Calculating default imputation values from catalog stats...")
 
-    # 1. Xử lý các trường số (Numeric Features) - Tính Mean (Trung bình)
+    # 1. Xử lý các trường số (Numeric Features) - Tính Mean (Trung bình), bỏ qua giá trị NULL
     for feature in numeric_features:
-        # Sử dụng aggregation của Django để tính trung bình, bỏ qua giá trị NULL
-        # Coalesce(Avg(feature), 0.0) sẽ trả về 0.0 nếu tất cả giá trị đều là NULL
-        result = LaptopInfo.objects.aggregate(avg_value=Avg(feature))
-        mean_value = result.get('avg_value')
+        mean_value = stats.mean(feature)
         # Làm tròn để giá trị đẹp hơn và gán giá trị mặc định nếu là None
         default[feature] = round(mean_value, 2) if mean_value is not None else 0
         print(f"  - Calculated mean for '{feature}': {default[feature]}")
@@ -31,15 +59,11 @@ def calculate_default_values():
         if feature in ['laptop_sang_tao_noi_dung', 'do_hoa_ky_thuat', 'cao_cap_sang_trong']:
             default[feature] = 0
         else:
-            mode_result = LaptopInfo.objects.values(feature)\
-                                            .annotate(count=Count(feature))\
-                                            .order_by('-count')\
-                                            .first() # Lấy phần tử đầu tiên (phổ biến nhất)
-            
-            if mode_result:
-                default[feature] = mode_result[feature]
-
-        print(f"  - Calculated mode for '{feature}': {default[feature]}")
+            mode_value = stats.mode(feature)
+            if mode_value is not None:
+                default[feature] = mode_value
+
+        print(f"  - Calculated mode for '{feature}': {default.get(feature)}")
         
     print("Default values calculation complete.")
     return default
@@ -48,19 +72,52 @@ def calculate_default_values():
 # Lớp này sẽ quản lý việc tải và sử dụng model (Singleton pattern)
 class PricePredictor:
     def __init__(self, default_imputation_values):
-        self.model = None
-        self.load_model()
+        # Model được tải ở lần dùng đầu tiên (xem property `model`), không tải lúc khởi động
+        self._model = None
+        self._model_loaded = False
+        self._model_lock = threading.Lock()
+        self.encoder = None # FeatureEncoder dựng từ pipeline, None thì dùng đường pandas
         self.default_imputation_values = default_imputation_values
         
+    @property
+    def model(self):
+        if not self._model_loaded:
+            with self._model_lock:
+                if not self._model_loaded:
+                    self.load_model()
+                    self._model_loaded = True
+        return self._model
+
     def load_model(self):
         """Tải model từ file .joblib vào bộ nhớ."""
-        model_path = 'chat/model/best_model_xgb.joblib'
+        model_path = MODEL_PATH
         try:
-            self.model = joblib.load(model_path)
+            self._model = joblib.load(model_path)
             print("ML Model loaded successfully!")
         except FileNotFoundError:
             print(f"Error: Model file not found at {model_path}")
-            self.model = None
+            self._model = None
+            return
+
+        if settings.CHAT_COMPILED_ENCODER:
+            try:
+                self.encoder = feature_encoder.FeatureEncoder.from_pipeline(self._model)
+            except feature_encoder.UnsupportedPipeline as e:
+                print(f"Compiled feature encoder unavailable, using pandas: {e}")
+
+    def impute(self, input_data):
+        """
+        Điền giá trị mặc định (mean/mode) cho các feature bị thiếu.
+        Form trả về '' / None cho các trường không được điền, nên coi chúng là thiếu.
+        """
+        data = self.default_imputation_values.copy()
+        data.update({key: value for key, value in input_data.items() if value not in (None, '')})
+
+        # Model được train với các cột nhãn 0 - 1 dạng số, trong khi ChoiceField trả về chuỗi '0' / '1'
+        for feature in PREDICT_LABEL_FIELDS:
+            data[feature] = int(data[feature])
+
+        return data
 
     def predict(self, input_data):
         """
@@ -71,26 +128,44 @@ class PricePredictor:
             return "Model is not loaded."
         if not input_data:
             return "No data to predict"
-        
+
+        result = self.predict_many([input_data])
+        if isinstance(result, str):
+            return result
+
+        return result[0]
+
+    def predict_many(self, profiles):
+        """
+        Dự đoán giá cho nhiều profile trong MỘT lần gọi model.
+        `profiles` là list các dictionary, kết quả trả về theo đúng thứ tự đầu vào.
+        """
+        if self.model is None:
+            return "Model is not loaded."
+        if not profiles:
+            return "No data to predict"
+
         try:
-            data = self.default_imputation_values.copy()
-            data.update(input_data)
-
-            # ----- QUAN TRỌNG NHẤT ------
-            # Dữ liệu đầu vào phải được chuyển đổi thành định dạng mà model mong đợi.
-            # Thường là một Pandas DataFrame với các cột và thứ tự chính xác.
-            fields = ['storage_max_support', 'storage_gb', 'display_width', 'cpu_threads', 'cpu_cores', 
-                    'ram_speed', 'cpu_speed', 'ram_storage', 'ram_slots', 'battery_capacity', 
-                    'display_height', 'laptop_sang_tao_noi_dung', 'do_hoa_ky_thuat', 'cao_cap_sang_trong', 
-                    'material', 'manufacturer', 'ram_type', 'os_version', 'laptop_color', 'vga_brand', 'laptop_camera', 'cpu_brand']
-            
-            input_df = pd.DataFrame([data], columns=fields)
-
-            prediction = self.model.predict(input_df)
-            return {
-                'data': data,
-                'predict_price': prediction[0]
-            }
+            rows = [self.impute(profile) for profile in profiles]
+            predictions = self.encoder.predict(rows) if self.encoder is not None else self.pipeline_predict(rows)
+            return [
+                {
+                    'data': row,
+                    'predict_price': prediction
+                }
+                for row, prediction in zip(rows, predictions)
+            ]
 
         except Exception as e:
-            return f"Error: {e}"
\ No newline at end of file
+            return f"Error: {e}"
+
+    def pipeline_predict(self, rows):
+        """Dự đoán qua pipeline sklearn (DataFrame), dùng khi không có FeatureEncoder."""
+        import pandas as pd # Chỉ cần khi dự đoán, không import lúc khởi động
+
+        # ----- QUAN TRỌNG NHẤT ------
+        # Dữ liệu đầu vào phải được chuyển đổi thành định dạng mà model mong đợi.
+        # Dựng sẵn từng hàng theo đúng thứ tự PREDICT_FIELDS rồi tạo một DataFrame duy nhất.
+        input_df = pd.DataFrame([[row.get(field) for field in PREDICT_FIELDS] for row in rows],
+                                columns=PREDICT_FIELDS)
+        return self.model.predict(input_df)
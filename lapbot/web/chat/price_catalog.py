@@ -0,0 +1,174 @@
+import heapq
+import threading
+import time
+from django.db import DatabaseError, transaction
+from . import catalog_index, filter_compiler, predictor_service, ranking
+from .chat_service import SUGGESTED_LAPTOP_FIELDS
+from .models import LaptopInfo, LaptopPricePrediction
+from .predictor_service import PREDICT_FIELDS
+
+# ==============================================================================
+# GIÁ DỰ ĐOÁN CHO TOÀN CATALOG
+# PricePredictor chạy trên mọi laptop trong MỘT lần gọi model; kết quả lưu ở bảng
+# laptop_price_prediction (LaptopPricePrediction), gắn với version của model (hash file joblib)
+# và của catalog (checksum, xem startup_snapshot). Đổi một trong hai thì tính lại cả bảng.
+# - deal_score = (giá dự đoán - giá bán) / giá dự đoán: > 0 là rẻ hơn giá trị cấu hình.
+# - Mỗi process giữ {product_id: (predicted_price, deal_score)} trong bộ nhớ cho find_deals, và
+#   (version, {product_id: deal_score}) ở ranking.deal_scores để cộng điểm "giá tốt" khi xếp hạng online
+#   (version được ghi vào cursor "Xem thêm", xem ranking.read_cursor).
+# Chỉ lệnh refresh_price_catalog (chạy sau mỗi lần deploy model / cập nhật catalog, hoặc cron) tính lại bảng;
+# worker chỉ đọc lúc khởi động, để nhiều worker / process không cùng xóa và ghi lại bảng một lúc.
+# ==============================================================================
+
+# {product_id: (predicted_price, deal_score)} của version hiện tại, gán bởi publish() (None = chưa có)
+predictions = None
+_refresh_lock = threading.Lock()
+
+
+def publish(current, model_version, catalog_version):
+    global predictions
+    predictions = current or None
+    ranking.deal_scores = (f'{model_version}:{catalog_version}',
+                           {product_id: score for product_id, (_, score) in current.items() if score is not None}) \
+        if current else None
+
+
+def catalog_version():
+    if catalog_index.catalog is not None:
+        return catalog_index.catalog.checksum[:16]
+    from . import startup_snapshot
+    snapshot = startup_snapshot.current or startup_snapshot.load_or_build()
+    return snapshot['checksum'][:16]
+
+
+def versions():
+    """(model_version, catalog_version) hiện tại."""
+    return predictor_service.model_version(), catalog_version()
+
+
+def catalog_rows():
+    """Các dòng cần dự đoán: product_id, discounted_price và PREDICT_FIELDS."""
+    if catalog_index.catalog is not None:
+        return catalog_index.catalog.rows
+    return list(LaptopInfo.objects.values('product_id', 'discounted_price', *PREDICT_FIELDS))
+
+
+def deal_score(predicted_price, price):
+    if price is None or predicted_price <= 0:
+        return None
+    return (predicted_price - price) / predicted_price
+
+
+def compute(rows, model_version, catalog_version):
+    """Dự đoán giá cho tất cả `rows` trong một lần gọi model, trả về list LaptopPricePrediction (chưa lưu)."""
+    results = predictor_service.predictor.predict_many([{field: row[field] for field in PREDICT_FIELDS}
+                                                        for row in rows])
+    if isinstance(results, str):
+        raise RuntimeError(results)
+
+    records = []
+    for row, result in zip(rows, results):
+        predicted_price = float(result['predict_price'])
+        price = row['discounted_price']
+        records.append(LaptopPricePrediction(
+            product_id=row['product_id'],
+            predicted_price=predicted_price,
+            residual=price - predicted_price if price is not None else None,
+            deal_score=deal_score(predicted_price, price),
+            model_version=model_version,
+            catalog_version=catalog_version,
+        ))
+    return records
+
+
+def load():
+    """Đọc giá dự đoán của version hiện tại vào bộ nhớ. Trả về True nếu bảng đã khớp với catalog."""
+    model_version, catalog_version = versions()
+    rows = LaptopPricePrediction.objects.filter(model_version=model_version, catalog_version=catalog_version)\
+                                        .values_list('product_id', 'predicted_price', 'deal_score')
+    current = {product_id: (predicted_price, score) for product_id, predicted_price, score in rows}
+    publish(current, model_version, catalog_version)
+
+    expected = len(catalog_index.catalog) if catalog_index.catalog is not None else LaptopInfo.objects.count()
+    return len(current) == expected and not LaptopPricePrediction.objects.exclude(
+        model_version=model_version, catalog_version=catalog_version).exists()
+
+
+def refresh(force=False):
+    """
+    Tính lại cả bảng nếu model hoặc catalog đã đổi (hoặc force). Trả về thống kê, None nếu không cần tính.
+    """
+    with _refresh_lock:
+        if not force and load():
+            return None
+
+        model_version, catalog_version = versions()
+        start = time.perf_counter()
+        records = compute(catalog_rows(), model_version, catalog_version)
+        predict_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            LaptopPricePrediction.objects.all().delete()
+            LaptopPricePrediction.objects.bulk_create(records, batch_size=500)
+        write_ms = (time.perf_counter() - start) * 1000
+
+        publish({record.product_id: (record.predicted_price, record.deal_score) for record in records},
+                model_version, catalog_version)
+        return {
+            'laptops': len(records),
+            'model_version': model_version,
+            'catalog_version': catalog_version,
+            'predict_ms': round(predict_ms, 1),
+            'write_ms': round(write_ms, 1),
+        }
+
+
+def with_prediction(laptop, current):
+    predicted_price, score = current[laptop['product_id']]
+    return {**laptop, 'predicted_price': predicted_price, 'deal_score': score}
+
+
+def find_deals(filters=None, limit=10, min_score=0.0):
+    """
+    Các laptop rẻ nhất so với giá dự đoán (deal_score giảm dần) trong số laptop thỏa `filters`
+    (dict filter kiểu Django, được kiểm tra bởi filter_compiler).
+    """
+    compiled = filter_compiler.compile_filters(filters or {})
+    current = predictions
+
+    if catalog_index.catalog is not None and current is not None:
+        try:
+            laptops = catalog_index.catalog.select(compiled.mask(catalog_index.catalog), SUGGESTED_LAPTOP_FIELDS)
+        except catalog_index.UnsupportedLookup:
+            laptops = None
+        if laptops is not None:
+            deals = [with_prediction(laptop, current) for laptop in laptops if laptop['product_id'] in current]
+            deals = [deal for deal in deals if deal['deal_score'] is not None and deal['deal_score'] >= min_score]
+            # Cùng điểm thì giữ thứ tự của catalog (giá tăng dần)
+            return heapq.nlargest(limit, deals, key=lambda deal: deal['deal_score'])
+
+    # Không có index / giá dự đoán trong bộ nhớ: một subquery trên database
+    model_version, catalog_version = versions()
+    rows = list(LaptopPricePrediction.objects.filter(
+        product_id__in=LaptopInfo.objects.filter(compiled.q).values('product_id'),
+        model_version=model_version, catalog_version=catalog_version, deal_score__gte=min_score,
+    ).order_by('-deal_score', 'product_id').values_list('product_id', 'predicted_price', 'deal_score')[:limit])
+    laptops = {laptop['product_id']: laptop for laptop in
+               LaptopInfo.objects.filter(pk__in=[row[0] for row in rows]).values(*SUGGESTED_LAPTOP_FIELDS)}
+    return [{**laptops[product_id], 'predicted_price': predicted_price, 'deal_score': score}
+            for product_id, predicted_price, score in rows if product_id in laptops]
+
+
+def load_at_startup():
+    """Gọi trong ChatConfig.ready(): chỉ đọc bảng, không bao giờ tính lại (xem refresh_price_catalog)."""
+    try:
+        current = load()
+    except DatabaseError as e:
+        # Chưa migrate / chưa có catalog
+        print(f"Price catalog unavailable: {e}")
+        return
+    if current:
+        print(f"Loaded price catalog ({len(predictions or ())} laptops).")
+    else:
+        print("Price catalog is stale, run: python manage.py refresh_price_catalog")
@@ -216,4 +216,11 @@ SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE = f'''
             "key_2_trong_schema__gte": "value_2"
         }}
     }}`
-'''
\ No newline at end of file
+'''
+
+# Loại của từng system prompt trích xuất (nhãn metrics, fixture của FakeLLMService)
+PROMPT_TYPES = {
+    SYSTEM_CONTENT_EXTRACT_BUDGET: 'budget',
+    SYSTEM_CONTENT_EXTRACT_RECOMMEND_USAGE: 'usage',
+    SYSTEM_CONTENT_USER_MESS_EXTRACT_AND_GEN_GROUP: 'group',
+}
@@ -0,0 +1,82 @@
+import heapq
+from django.core import signing
+
+# ==============================================================================
+# XẾP HẠNG VÀ PHÂN TRANG LAPTOP GỢI Ý
+# Một khoảng giá rộng có thể khớp hàng trăm laptop. Thay vì trả hết (JSON, HTML và
+# session đều phình theo), mỗi nhóm chỉ giữ top-k laptop có điểm cao nhất, phần còn lại
+# lấy thêm qua cursor ("Xem thêm").
+# Điểm = số cột nhu cầu khớp * USAGE_MATCH_WEIGHT + độ gần với giá mục tiêu (0 -> 1)
+#       + deal_score * DEAL_WEIGHT (rẻ hơn giá dự đoán theo cấu hình, xem chat.price_catalog).
+# Cursor ghi version của bộ deal score đã dùng để xếp hạng: khi price catalog được tính lại,
+# thứ tự thay đổi nên cursor cũ bị từ chối (StaleCursor) thay vì trả trang trùng / sót laptop.
+# ==============================================================================
+
+USAGE_KEYS = ['laptop_sang_tao_noi_dung', 'do_hoa_ky_thuat', 'cao_cap_sang_trong',
+              'hoc_tap_van_phong', 'mong_nhe', 'gaming']
+
+USAGE_MATCH_WEIGHT = 1.0
+PRICE_SCALE = 5000000 # Lệch 5tr so với giá mục tiêu -> điểm giá bằng 0
+DEAL_WEIGHT = 1.0 # Rẻ hơn 20% so với giá dự đoán -> +0.2 điểm (laptop đắt hơn giá dự đoán không bị trừ)
+
+# (version, {product_id: deal_score}), được gán cả cặp bởi price_catalog.publish() (None = không cộng điểm giá tốt)
+deal_scores = None
+
+CURSOR_SALT = 'chat.ranking.cursor'
+
+
+class StaleCursor(signing.BadSignature):
+    """Cursor hợp lệ nhưng được xếp hạng với bộ deal score khác bộ đang dùng."""
+
+
+def current_deals():
+    """(version, {product_id: deal_score}) đang dùng, (None, None) nếu không có."""
+    return deal_scores or (None, None)
+
+
+def wanted_usage(*sources):
+    """Các cột nhu cầu được yêu cầu (= 1) trong filters / prediction_profile."""
+    sources = [source for source in sources if isinstance(source, dict)]
+    return [key for key in USAGE_KEYS if any(source.get(key) in (1, True) for source in sources)]
+
+
+def score(laptop, target_price=None, usage_keys=(), deals=None):
+    matches = sum(1 for key in usage_keys if laptop.get(key) == 1)
+
+    closeness = 0.0
+    price = laptop.get('discounted_price')
+    if target_price is not None and price is not None:
+        closeness = max(0.0, 1 - abs(price - target_price) / PRICE_SCALE)
+
+    deal = 0.0
+    if deals is not None:
+        deal = min(max(deals.get(laptop.get('product_id'), 0.0), 0.0), 1.0)
+
+    return matches * USAGE_MATCH_WEIGHT + closeness + deal * DEAL_WEIGHT
+
+
+def top_k(laptops, k, target_price=None, usage_keys=(), offset=0, deals=None):
+    """
+    Trang laptop [offset, offset + k) theo điểm giảm dần, dùng heap (O(n log(offset + k))).
+    Cùng điểm thì giữ thứ tự ban đầu (giá tăng dần), nên các trang luôn nhất quán
+    (với cùng `deals`, xem current_deals).
+    """
+    ranked = heapq.nlargest(offset + k, laptops, key=lambda laptop: score(laptop, target_price, usage_keys, deals))
+    return ranked[offset:]
+
+
+def make_cursor(filters, target_price, usage_keys, offset, deals_version=None):
+    """Cursor cho trang tiếp theo: ký bằng SECRET_KEY để client không sửa được filters."""
+    return signing.dumps({'f': filters, 't': target_price, 'u': usage_keys, 'o': offset, 'v': deals_version},
+                         salt=CURSOR_SALT, compress=True)
+
+
+def read_cursor(cursor, deals_version=None):
+    """
+    Trả về (filters, target_price, usage_keys, offset). Raise signing.BadSignature nếu cursor sai,
+    StaleCursor nếu cursor được tạo với version deal score khác `deals_version`.
+    """
+    data = signing.loads(cursor, salt=CURSOR_SALT)
+    if data.get('v') != deals_version:
+        raise StaleCursor('Cursor được xếp hạng với bộ deal score cũ')
+    return data['f'], data['t'], data['u'], data['o']
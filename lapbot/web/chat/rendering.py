@@ -0,0 +1,130 @@
+import functools
+import hashlib
+import json
+import threading
+import markdown
+from django.conf import settings
+from django.template import loader
+from django.utils.safestring import mark_safe
+from . import catalog_index, chat_history, instrumentation
+
+# ==============================================================================
+# RENDER HTML CHO TIN NHẮN
+# - Markdown: instance markdown.Markdown giữ state giữa các lần convert nên không dùng chung được
+#   giữa các thread; mỗi thread có một instance riêng (reset trước mỗi lần convert).
+# - Cache HTML (FragmentCache): mỗi lượt hỏi đáp trong lịch sử được render một lần, key gồm id
+#   ChatMessage + hash nội dung. Hash gồm nội dung đã lưu, checksum catalog (laptop được lấy lại từ
+#   catalog lúc hiển thị) và dấu vân tay của thư mục templates, nên HTML không bao giờ cũ hơn dữ liệu.
+#   Lượt đã có trong cache không cần lấy lại laptop lẫn render lại.
+# ==============================================================================
+
+MARKDOWN_EXTENSIONS = ["fenced_code"]
+_local = threading.local()
+
+
+def markdown_to_html(text):
+    converter = getattr(_local, 'markdown', None)
+    if converter is None:
+        converter = _local.markdown = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return converter.reset().convert(text)
+
+
+def render_to_string(template_name, context=None):
+    """render_to_string của Django, kèm đo thời gian (stage render)."""
+    with instrumentation.stage('render'):
+        return loader.render_to_string(template_name, context)
+
+
+@functools.cache
+def template_fingerprint():
+    """Hash nội dung các template của project (đổi khi deploy template mới)."""
+    digest = hashlib.sha256()
+    for path in sorted((settings.BASE_DIR / 'templates').rglob('*.html')):
+        digest.update(path.as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def catalog_version():
+    # Không có catalog index thì laptop được query trực tiếp: chỉ dựa vào TTL của cache
+    return catalog_index.catalog.checksum[:16] if catalog_index.catalog is not None else 'orm'
+
+
+class FragmentCache:
+    """HTML đã render, lưu trong một Django cache (vd LocMemCache của process hoặc Redis dùng chung)."""
+
+    def __init__(self, backend, ttl=3600, prefix='chat-render'):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, kind, identifier, content):
+        raw = json.dumps([template_fingerprint(), catalog_version(), content], sort_keys=True, default=str)
+        return f'{self.prefix}:{kind}:{identifier}:{hashlib.sha256(raw.encode()).hexdigest()[:32]}'
+
+    def get_many(self, keys):
+        found = self.backend.get_many(keys)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, fragments):
+        self.backend.set_many(fragments, timeout=self.ttl)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Instance dùng chung, được gán trong ChatConfig.ready() (None = không cache)
+fragments = None
+
+
+def exchange_content(message):
+    return [message.user_message, message.intent_codes, message.intent_meanings, message.ai_response]
+
+
+def render_exchange(data):
+    return render_to_string('components/message/exchange.html', {
+        'chat': {**data, 'user_message': markdown_to_html(data['user_message'])}
+    })
+
+
+def render_history(messages):
+    """HTML của các lượt hỏi đáp (list ChatMessage, cũ -> mới), chỉ render các lượt chưa có trong cache."""
+    if fragments is None:
+        return [mark_safe(render_exchange(data)) for data in chat_history.expand(messages)]
+
+    keys = {message.id: fragments.make_key('exchange', message.id, exchange_content(message)) for message in messages}
+    found = fragments.get_many(list(keys.values()))
+    missing = [message for message in messages if keys[message.id] not in found]
+    if missing:
+        rendered = {keys[data['id']]: render_exchange(data) for data in chat_history.expand(missing)}
+        fragments.set_many(rendered)
+        found.update(rendered)
+    return [mark_safe(found[keys[message.id]]) for message in messages]
+
+
+def render_user_message(user_message):
+    """Block tin nhắn của người dùng; cùng nội dung thì dùng lại HTML đã render."""
+    def render():
+        return render_to_string('components/message/user_message.html', {
+            'data': {'user_message': markdown_to_html(user_message)}
+        })
+
+    if fragments is None:
+        return render()
+    key = fragments.make_key('user', 0, user_message)
+    html = fragments.get_many([key]).get(key)
+    if html is None:
+        html = render()
+        fragments.set_many({key: html})
+    return html
@@ -0,0 +1,75 @@
+import json
+from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ==============================================================================
+# ENCODE JSON CHO CÁC ENDPOINT CHAT
+# Response gợi ý chứa hàng chục / hàng trăm dict laptop, encode bằng json của Python là phần tốn CPU
+# đáng kể của mỗi request sau khi đã cache LLM / catalog.
+# - Encoder chọn qua CHAT_JSON_ENCODER: 'auto' (orjson nếu đã cài, nếu không thì json), 'orjson',
+#   'json', hoặc dotted path tới một hàm data -> bytes.
+# - json: bỏ khoảng trắng thừa; giữ ensure_ascii vì với json của CPython nhánh này nhanh hơn xuất UTF-8,
+#   còn kích thước gần như không đổi sau khi nén (xem bench_serialization).
+# - Kiểu dữ liệu ngoài JSON (Decimal, datetime, lazy string...) xử lý như DjangoJSONEncoder.
+# ==============================================================================
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def json_dumps(data):
+    return json.dumps(data, separators=(',', ':'), cls=DjangoJSONEncoder).encode()
+
+
+def orjson_default(value):
+    if isinstance(value, Decimal):
+        return str(value) # giống DjangoJSONEncoder
+    return _django_encoder.default(value)
+
+
+def orjson_dumps(data):
+    return orjson.dumps(data, default=orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+ENCODERS = {
+    'json': json_dumps,
+    'orjson': orjson_dumps,
+}
+
+
+def get_encoder(name):
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if '.' in name:
+        return import_string(name)
+    if name not in ENCODERS:
+        raise ValueError(f"JSON encoder '{name}' không được hỗ trợ. Các lựa chọn: auto, {', '.join(ENCODERS)} "
+                         f"hoặc dotted path tới một hàm.")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("CHAT_JSON_ENCODER='orjson' nhưng chưa cài orjson (pip install orjson).")
+    return ENCODERS[name]
+
+
+# Encoder đang dùng, được gán trong ChatConfig.ready() theo CHAT_JSON_ENCODER
+encoder = json_dumps
+
+
+def dumps(data):
+    """data -> bytes JSON."""
+    return encoder(data)
+
+
+class JsonResponse(HttpResponse):
+    """Như django.http.JsonResponse nhưng encode bằng `encoder` đang cấu hình."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,14 @@
+from django.contrib.sessions.backends import db
+from . import instrumentation
+
+
+class SessionStore(db.SessionStore):
+    """Session lưu trong database như mặc định, kèm đo thời gian ghi (stage session_write)."""
+
+    def save(self, must_create=False):
+        with instrumentation.stage('session_write'):
+            return super().save(must_create)
+
+    async def asave(self, must_create=False):
+        with instrumentation.stage('session_write'):
+            return await super().asave(must_create)
@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from .intent_classifier import normalize
+
+# ==============================================================================
+# GOM CÁC REQUEST GIỐNG NHAU ĐANG CHẠY CÙNG LÚC (SINGLE-FLIGHT)
+# Khi có chiến dịch marketing, rất nhiều người gửi cùng một câu mẫu gần như cùng lúc,
+# và mỗi request lại chạy riêng một chuỗi intent -> LLM -> ORM -> dự đoán giá.
+# SingleFlight cho các request có cùng câu hỏi (đã chuẩn hóa) dùng chung MỘT lần tính:
+# - Trong process: request đầu tiên (leader) tính, các request đến sau khi leader chưa xong
+#   (follower) chờ cùng một Future. Dùng concurrent.futures.Future nên view sync (thread)
+#   và view async (event loop) chờ chung được.
+# - Giữa các process (tùy chọn, `backend` là một Django cache): leader giữ một lock qua
+#   cache.add() và ghi kết quả vào cache trong `result_ttl` giây; process khác thấy lock thì
+#   poll kết quả thay vì tự tính. Lock hết hạn / leader lỗi mà chưa có kết quả thì tự tính.
+# `stage` tách các bước khác nhau của cùng một câu hỏi (vd luồng SSE gom riêng bước intent, bước LLM),
+# để kết quả của bước này không bao giờ được trả cho bước khác.
+# Đây không phải cache: kết quả chỉ được chia sẻ giữa các request chồng lên nhau
+# (cộng thêm cửa sổ ngắn `result_ttl` cho process khác kịp đọc).
+# Lỗi của leader được trả cho các follower trong cùng process, không bao giờ ghi vào backend.
+# ==============================================================================
+
+POLL_INTERVAL = 0.05
+
+
+class SingleFlight:
+    def __init__(self, backend=None, wait_timeout=30, result_ttl=5, prefix='chat-flight'):
+        """
+        :param backend: Django cache dùng chung giữa các process (None = chỉ gom trong process).
+        :param wait_timeout: thời gian (giây) tối đa chờ leader ở process khác; cũng là thời hạn của lock.
+        :param result_ttl: thời gian (giây) giữ kết quả trong backend cho các process đang chờ.
+        """
+        self.backend = backend
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.prefix = prefix
+        self._flights = {} # key -> Future của lần tính đang chạy
+        self._tasks = set() # giữ tham chiếu tới task của leader async cho tới khi chạy xong
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.followers = 0
+        self.shared_hits = 0
+        self.shared_timeouts = 0
+
+    def make_key(self, message, stage=None):
+        prefix = f'{self.prefix}:{stage}:' if stage else f'{self.prefix}:'
+        return prefix + hashlib.sha256(normalize(message).encode()).hexdigest()
+
+    def _join(self, key):
+        """(Future, True nếu là leader). Leader phải gọi _finish khi tính xong."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.followers += 1
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # --- Giữa các process ---------------------------------------------------
+
+    def _acquire(self, key):
+        """Token của lock nếu process này được tính, None nếu process khác đang tính."""
+        token = uuid.uuid4().hex
+        return token if self.backend.add(f'{key}:lock', token, timeout=self.wait_timeout) else None
+
+    async def _aacquire(self, key):
+        token = uuid.uuid4().hex
+        return token if await self.backend.aadd(f'{key}:lock', token, timeout=self.wait_timeout) else None
+
+    def _release(self, key, token, result=None, computed=False):
+        if computed:
+            self.backend.set(f'{key}:result', result, timeout=self.result_ttl)
+        if self.backend.get(f'{key}:lock') == token:
+            self.backend.delete(f'{key}:lock')
+
+    async def _arelease(self, key, token, result=None, computed=False):
+        if computed:
+            await self.backend.aset(f'{key}:result', result, timeout=self.result_ttl)
+        if await self.backend.aget(f'{key}:lock') == token:
+            await self.backend.adelete(f'{key}:lock')
+
+    def _poll(self, key):
+        """Chờ kết quả của process khác. (True, kết quả) hoặc (False, None) nếu phải tự tính."""
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            found = self.backend.get_many([f'{key}:result', f'{key}:lock'])
+            if f'{key}:result' in found:
+                self.shared_hits += 1
+                return True, found[f'{key}:result']
+            if f'{key}:lock' not in found:
+                return False, None
+            time.sleep(POLL_INTERVAL)
+        self.shared_timeouts += 1
+        return False, None
+
+    async def _apoll(self, key):
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            found = await self.backend.aget_many([f'{key}:result', f'{key}:lock'])
+            if f'{key}:result' in found:
+                self.shared_hits += 1
+                return True, found[f'{key}:result']
+            if f'{key}:lock' not in found:
+                return False, None
+            await asyncio.sleep(POLL_INTERVAL)
+        self.shared_timeouts += 1
+        return False, None
+
+    def _compute_shared(self, key, func):
+        if self.backend is None:
+            return func()
+        token = self._acquire(key)
+        if token is None:
+            found, result = self._poll(key)
+            if found:
+                return result
+            token = self._acquire(key) # có thể None nếu process khác vừa nhận lock: vẫn tự tính
+        computed = False
+        try:
+            result = func()
+            computed = True
+            return result
+        finally:
+            if token is not None:
+                self._release(key, token, result if computed else None, computed)
+
+    async def _acompute_shared(self, key, func):
+        if self.backend is None:
+            return await func()
+        token = await self._aacquire(key)
+        if token is None:
+            found, result = await self._apoll(key)
+            if found:
+                return result
+            token = await self._aacquire(key)
+        computed = False
+        try:
+            result = await func()
+            computed = True
+            return result
+        finally:
+            if token is not None:
+                await self._arelease(key, token, result if computed else None, computed)
+
+    # --- API -----------------------------------------------------------------
+
+    def do(self, message, func, stage=None):
+        """Gọi func() (không tham số), hoặc dùng chung kết quả của lần gọi đang chạy cho cùng message (và stage)."""
+        key = self.make_key(message, stage)
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = self._compute_shared(key, func)
+        except BaseException as error:
+            self._finish(key, future, error=error)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def ado(self, message, func, stage=None):
+        """
+        Phiên bản async: func là hàm trả về coroutine.
+        Lần tính chạy trong một task riêng, nên request leader bị hủy (client ngắt kết nối)
+        không làm hỏng kết quả của các follower.
+        """
+        key = self.make_key(message, stage)
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(self._acompute_shared(key, func))
+            self._tasks.add(task)
+
+            def done(task):
+                self._tasks.discard(task)
+                if task.cancelled():
+                    self._finish(key, future, error=asyncio.CancelledError())
+                elif task.exception() is not None:
+                    self._finish(key, future, error=task.exception())
+                else:
+                    self._finish(key, future, task.result())
+
+            task.add_done_callback(done)
+        # shield: hủy một request không hủy Future dùng chung
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._flights)
+        requests = self.leaders + self.followers
+        return {
+            'in_flight': in_flight,
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'coalesced_rate': round(self.followers / requests, 4) if requests else 0.0,
+            'shared_hits': self.shared_hits,
+            'shared_timeouts': self.shared_timeouts,
+        }
+
+
+# Gán trong ChatConfig.ready() (None = tắt)
+coalescer = None
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from django.conf import settings
+from django.db import models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Length
+from .models import LaptopInfo
+
+# ==============================================================================
+# SNAPSHOT KHỞI ĐỘNG
+# Giá trị mặc định để impute, schema context cho LLM và choices (dùng cho cả form dự đoán giá)
+# đều được tính từ bảng laptop_info (một lần duyệt, xem catalog_stats). Kết quả được lưu ra file JSON, gắn với:
+# - SNAPSHOT_VERSION: tăng khi định dạng / cách tính thay đổi
+# - version của catalog (catalog_version): đổi khi dữ liệu laptop_info đổi
+# Worker khởi động chỉ cần đọc file nếu cả hai còn khớp, ngược lại tính lại và ghi đè file.
+# Version được tính bằng MỘT query aggregate (số dòng, tổng từng cột số, tổng độ dài từng cột chuỗi),
+# không phải đọc cả bảng. Sửa dữ liệu mà giữ nguyên mọi tổng (rất hiếm) thì build lại thủ công.
+# Build lại thủ công: python manage.py build_startup_snapshot
+# ==============================================================================
+
+SNAPSHOT_VERSION = 2
+
+# Snapshot đang dùng, được gán trong ChatConfig.ready()
+current = None
+
+
+def snapshot_path():
+    path = settings.CHAT_STARTUP_SNAPSHOT
+    return Path(path) if path else None
+
+
+def catalog_version():
+    """Version của catalog từ một query aggregate trên laptop_info (SHA-256 của kết quả)."""
+    aggregates = {'rows': Count('pk'), 'min_pk': Min('pk'), 'max_pk': Max('pk')}
+    for field in LaptopInfo._meta.concrete_fields:
+        if isinstance(field, (models.FloatField, models.IntegerField)):
+            aggregates[field.name] = Sum(field.name)
+        elif not field.primary_key:
+            aggregates[field.name] = Sum(Length(field.name))
+    summary = LaptopInfo.objects.aggregate(**aggregates)
+    # Tổng số thực có thể lệch ở chữ số cuối giữa các lần chạy / database
+    summary = {key: round(value, 6) if isinstance(value, float) else value for key, value in summary.items()}
+    return hashlib.sha256(json.dumps(summary, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def catalog_checksum(rows):
+    """SHA-256 của toàn bộ dữ liệu `rows` (đọc cả bảng, chỉ dùng để ghi lại trong báo cáo), không phụ thuộc thứ tự dòng."""
+    digest = hashlib.sha256()
+    for row in sorted(rows, key=lambda row: row['product_id']):
+        digest.update(json.dumps(row, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def read(path, checksum):
+    """Đọc snapshot, trả về None nếu file không có, hỏng, khác version hoặc khác checksum."""
+    try:
+        with open(path, encoding='utf-8') as file:
+            snapshot = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('checksum') != checksum:
+        return None
+    return snapshot
+
+
+def write(path, snapshot):
+    # Ghi ra file tạm rồi đổi tên, để worker khác không bao giờ đọc phải file ghi dở
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(snapshot, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build(checksum, rows=None):
+    """Tính toàn bộ dữ liệu khởi động từ một lần duyệt catalog (xem catalog_stats)."""
+    from . import catalog_stats, predictor_service, database_schema
+
+    stats = catalog_stats.build(rows)
+    default_imputation_values = predictor_service.calculate_default_values(stats)
+    # Choices dùng chung cho LLM (schema context), filter compiler và form dự đoán giá
+    database_schema.get_database_schema_and_choices(stats)
+
+    return {
+        'version': SNAPSHOT_VERSION,
+        'checksum': checksum,
+        'created_at': time.time(),
+        'default_imputation_values': default_imputation_values,
+        'schema_context': database_schema.DATABASE_SCHEMA_CONTEXT,
+        'categorical_choices': database_schema.CATEGORICAL_CHOICES,
+    }
+
+
+def apply(snapshot):
+    """Gán dữ liệu của snapshot cho các module dùng chung."""
+    from . import predictor_service, database_schema
+
+    predictor_service.default_imputation_values = snapshot['default_imputation_values']
+    database_schema.DATABASE_SCHEMA_CONTEXT = snapshot['schema_context']
+    database_schema.CATEGORICAL_CHOICES = snapshot['categorical_choices']
+
+
+def load_or_build(rows=None, rebuild=False):
+    """
+    Trả về snapshot khớp với catalog hiện tại, build và ghi file nếu cần.
+    :param rows: các dòng của catalog nếu đã có sẵn (vd từ catalog index), tránh đọc lại bảng khi phải build.
+    """
+    global current
+
+    checksum = catalog_version()
+    path = snapshot_path()
+
+    snapshot = None if (rebuild or path is None) else read(path, checksum)
+    if snapshot is not None:
+        print(f"Loaded startup snapshot {path.name} (catalog {checksum[:12]}).")
+    else:
+        snapshot = build(checksum, rows)
+        # Không lưu snapshot khi database lỗi giữa chừng (schema rỗng)
+        if path is not None and snapshot['categorical_choices']:
+            write(path, snapshot)
+            print(f"Built startup snapshot {path} (catalog {checksum[:12]}).")
+
+    apply(snapshot)
+    current = snapshot
+    return snapshot
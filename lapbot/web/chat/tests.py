@@ -1,3 +1,1497 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipUnless
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Avg, Count, Max, Min
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from . import (budget_parser, catalog_index, catalog_stats, chat_service, database_schema, feature_encoder,
+               filter_compiler, intent_classifier, llms_service, middleware, name_index, persona_matcher,
+               predictor_service, price_catalog, ranking, rendering, serialization, single_flight)
+from .chat_service import SUGGESTED_LAPTOP_FIELDS, intent_service
+from .middleware import CompressionMiddleware
+from .models import ChatMessage, LaptopInfo, LaptopPricePrediction
+from .prompts import PROMPT_TYPES
+from .text_utils import fold
 
-# Create your tests here.
\ No newline at end of file
+
+class CatalogFixtureMixin:
+    """
+    laptop_info là bảng unmanaged nên test database không có: tạo bảng rồi nạp fixture nhỏ
+    (laptop_catalog_sample, ~50 laptop thật, thêm vài giá trị NULL và các dòng trùng giá).
+    """
+    fixtures = ['laptop_catalog_sample']
+
+    @classmethod
+    def setUpClass(cls):
+        # Tạo bảng trước transaction của TestCase (schema editor của SQLite không chạy trong atomic)
+        with connection.schema_editor() as editor:
+            editor.create_model(LaptopInfo)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            editor.delete_model(LaptopInfo)
+
+
+# ==============================================================================
+# CATALOG INDEX: KẾT QUẢ PHẢI GIỐNG HỆT ORM
+# ==============================================================================
+def random_clause(rng, index):
+    """Một clause filter ngẫu nhiên kiểu LLM sinh ra, giá trị lấy từ chính catalog."""
+    name = rng.choice(list(index.fields))
+    sample = rng.choice(index.rows)[name]
+
+    if name in index.numeric:
+        column = index.numeric[name]
+        lookup = rng.choice(['exact', 'gt', 'gte', 'lt', 'lte', 'in', 'range', 'isnull', 'threshold'])
+        if lookup == 'threshold':
+            # Ngưỡng không trùng giá trị nào, cả số lẻ trên cột IntegerField
+            known = column[~np.isnan(column)]
+            low, high = float(known.min()), float(known.max())
+            return f'{name}__{rng.choice(["gte", "lt", "gt", "lte"])}', rng.uniform(low - 1, high + 1)
+        if lookup == 'in':
+            return f'{name}__in', [rng.choice(index.rows)[name] for _ in range(rng.randint(0, 4))]
+        if lookup == 'range':
+            bounds = sorted(v for v in (sample, rng.choice(index.rows)[name]) if v is not None)
+            if not bounds:
+                return f'{name}__isnull', True
+            return f'{name}__range', (bounds[0], bounds[-1])
+        if lookup == 'isnull':
+            return f'{name}__isnull', rng.random() < 0.5
+        if sample is None:
+            return name, None
+        return (name if lookup == 'exact' and rng.random() < 0.5 else f'{name}__{lookup}'), sample
+
+    lookup = rng.choice(['exact', 'iexact', 'in', 'icontains', 'istartswith', 'iendswith', 'isnull', 'missing'])
+    if lookup == 'isnull':
+        return f'{name}__isnull', rng.random() < 0.5
+    if lookup == 'missing':
+        return name, 'khong-ton-tai'
+    if lookup == 'in':
+        return f'{name}__in', [rng.choice(index.rows)[name] for _ in range(rng.randint(0, 4))]
+    if sample is None:
+        return name, None
+    if lookup == 'icontains':
+        start = rng.randrange(len(sample) or 1)
+        needle = sample[start:start + rng.randint(1, 6)]
+        # LIKE của SQLite chỉ không phân biệt hoa thường với ASCII, nên chỉ đổi hoa thường khi chuỗi là ASCII
+        return f'{name}__icontains', needle.upper() if needle.isascii() and rng.random() < 0.5 else needle
+    if lookup in ('istartswith', 'iendswith'):
+        size = rng.randint(1, 6)
+        needle = sample[:size] if lookup == 'istartswith' else sample[-size:]
+        return f'{name}__{lookup}', needle.upper() if needle.isascii() and rng.random() < 0.5 else needle
+    if lookup == 'iexact':
+        return f'{name}__iexact', sample.upper() if sample.isascii() else sample
+    return name, sample
+
+
+class CatalogIndexTests(CatalogFixtureMixin, TestCase):
+    CASES = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.index = catalog_index.CatalogIndex.from_database()
+
+    def orm_values(self, filters):
+        return list(LaptopInfo.objects.filter(**filters).values(*SUGGESTED_LAPTOP_FIELDS)
+                    .order_by(*catalog_index.CATALOG_ORDERING))
+
+    def index_values(self, filters):
+        # Lỗi kiểu dữ liệu phải giống ORM: so sánh như một kết quả
+        try:
+            return self.index.values(filters, SUGGESTED_LAPTOP_FIELDS)
+        except catalog_index.UnsupportedLookup:
+            raise
+        except Exception:
+            return Exception
+
+    def test_fixture_loaded(self):
+        self.assertEqual(len(self.index), LaptopInfo.objects.count())
+        self.assertGreater(len(self.index), 0)
+
+    def test_random_filters_match_orm(self):
+        rng = random.Random(0)
+        for _ in range(self.CASES):
+            filters = dict(random_clause(rng, self.index) for _ in range(rng.randint(1, 3)))
+            with self.subTest(filters=filters):
+                try:
+                    expected = self.orm_values(filters)
+                except Exception:
+                    expected = Exception
+                self.assertEqual(self.index_values(filters), expected)
+
+    def test_llm_filters_match_orm(self):
+        for filters in (
+            {'discounted_price__gte': 15000000, 'discounted_price__lte': 20000000},
+            {'gaming': 1, 'vga_brand__in': ['nvidia', 'amd'], 'ram_storage__gte': 16},
+            {'hoc_tap_van_phong': 1, 'product_weight__lte': 1.5},
+            {'manufacturer': 'asus', 'cpu_model__icontains': 'i7'},
+            {'name__istartswith': 'laptop asus', 'cpu_model__iendswith': 'H'},
+            {'discounted_price': None},
+            {'ram_storage__gte': 15.5, 'gaming__lt': 0.5},
+        ):
+            with self.subTest(filters=filters):
+                self.assertEqual(self.index_values(filters), self.orm_values(filters))
+
+    def test_ordering_nulls_last_then_product_id(self):
+        prices = [row['discounted_price'] for row in self.index.rows]
+        known = [price for price in prices if price is not None]
+        self.assertEqual(known, sorted(known))
+        self.assertEqual(prices[len(known):], [None] * (len(prices) - len(known)))
+        self.assertEqual([row['product_id'] for row in self.index.rows],
+                         list(LaptopInfo.objects.order_by(*catalog_index.CATALOG_ORDERING)
+                              .values_list('product_id', flat=True)))
+
+    def test_unsupported_lookups_raise(self):
+        # Field / lookup không xử lý được: index phải báo để nơi gọi quay về ORM
+        for filters in ({'khong_co_field': 1}, {'name__regex': 'Asus'}, {'cpu_cores__icontains': '8'}):
+            with self.subTest(filters=filters), self.assertRaises(catalog_index.UnsupportedLookup):
+                self.index.values(filters, SUGGESTED_LAPTOP_FIELDS)
+
+    def test_lookup_by_product_id(self):
+        product_ids = [row['product_id'] for row in self.index.rows[:3]] + ['khong-ton-tai']
+        laptops = self.index.lookup(product_ids, SUGGESTED_LAPTOP_FIELDS)
+        self.assertEqual(list(laptops), product_ids[:3])
+        self.assertEqual(laptops[product_ids[0]],
+                         LaptopInfo.objects.values(*SUGGESTED_LAPTOP_FIELDS).get(pk=product_ids[0]))
+
+
+# ==============================================================================
+# THỐNG KÊ CATALOG: PHẢI GIỐNG CÁC QUERY TỔNG HỢP CỦA ORM
+# ==============================================================================
+class CatalogStatsTests(CatalogFixtureMixin, TestCase):
+    MUTATIONS = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.stats = catalog_stats.CatalogStats.from_database()
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            catalog_stats.CatalogStats.from_database()
+        self.assertEqual(len(self.stats), LaptopInfo.objects.count())
+
+    def test_mean_and_mode_match_orm(self):
+        for feature in database_schema.ALL_NUMERIC_FEATURES:
+            with self.subTest(feature=feature):
+                expected = LaptopInfo.objects.aggregate(value=Avg(feature))['value']
+                if expected is None:
+                    self.assertIsNone(self.stats.mean(feature))
+                else:
+                    self.assertAlmostEqual(self.stats.mean(feature), expected, places=6)
+
+        for feature in database_schema.PREDICT_CATEGORICAL_FEATURES:
+            with self.subTest(feature=feature):
+                rows = list(LaptopInfo.objects.exclude(**{f'{feature}__isnull': True})
+                            .values(feature).annotate(count=Count(feature)).order_by('-count'))
+                # Mode bằng nhau: lấy giá trị nhỏ nhất
+                expected = min(row[feature] for row in rows if row['count'] == rows[0]['count']) if rows else None
+                self.assertEqual(self.stats.mode(feature), expected)
+
+    def test_distinct_and_range_match_orm(self):
+        for feature in database_schema.ALL_CATEGORICAL_FEATURES:
+            with self.subTest(feature=feature):
+                expected = sorted(LaptopInfo.objects.values_list(feature, flat=True).distinct()
+                                  .exclude(**{f'{feature}__isnull': True}).exclude(**{f'{feature}__exact': ''}))
+                self.assertEqual(self.stats.distinct(feature), expected)
+
+        bounds = LaptopInfo.objects.aggregate(**{
+            f'{feature}__{name}': function(feature)
+            for feature in database_schema.ALL_NUMERIC_FEATURES for name, function in (('min', Min), ('max', Max))
+        })
+        for feature in database_schema.ALL_NUMERIC_FEATURES:
+            with self.subTest(feature=feature):
+                self.assertEqual((self.stats.minimum(feature), self.stats.maximum(feature)),
+                                 (bounds[f'{feature}__min'], bounds[f'{feature}__max']))
+
+    def mutate(self, rows, rng):
+        """Thêm, xóa và sửa ngẫu nhiên vài dòng (chỉ trong bộ nhớ)."""
+        rows = [dict(row) for row in rows]
+        for _ in range(rng.randint(1, 10)):
+            action = rng.choice(['add', 'remove', 'change'])
+            if action == 'remove' and rows:
+                rows.pop(rng.randrange(len(rows)))
+            elif action == 'add' and rows:
+                row = dict(rng.choice(rows))
+                row['product_id'] = f'mutated-{rng.random()}'
+                rows.append(row)
+            elif rows:
+                row = rng.choice(rows)
+                field = rng.choice(catalog_stats.STAT_FIELDS)
+                row[field] = rng.choice([other[field] for other in rows] + [None])
+        return rows
+
+    def test_incremental_refresh_matches_rebuild(self):
+        rng = random.Random(0)
+        rows = list(catalog_stats.stream_rows())
+        incremental = catalog_stats.CatalogStats.from_rows(rows)
+        self.assertEqual(incremental.refresh(rows), 0)
+
+        for _ in range(self.MUTATIONS):
+            rows = self.mutate(rows, rng)
+            incremental.refresh(rows)
+            fresh = catalog_stats.CatalogStats.from_rows(rows)
+            self.assertEqual(len(incremental), len(fresh))
+            self.assertEqual(incremental.counts, fresh.counts)
+
+
+# ==============================================================================
+# FILTER COMPILER
+# ==============================================================================
+# Giá trị dễ gây lỗi cho fuzz test
+GARBAGE_VALUES = [None, '', 'abc', '16GB', '1,5', 'NVIDIA', 'true', [], ['AMD', None], [1, 'x'], {'a': 1}, 1.5, -3, True]
+GARBAGE_LOOKUPS = ['', '__gte', '__lte', '__in', '__icontains', '__contains', '__startswith', '__iendswith', '__range',
+                   '__isnull', '__regex', '__max', '__foo']
+
+
+class FilterCompilerTests(CatalogFixtureMixin, TestCase):
+    FUZZ_CASES = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        # Danh sách giá trị phân loại của catalog trong test (ready() không nạp catalog khi chạy test)
+        stats = catalog_stats.CatalogStats.from_database()
+        cls.choices = {feature: stats.distinct(feature) for feature in database_schema.ALL_CATEGORICAL_FEATURES}
+
+    def setUp(self):
+        patcher = mock.patch.object(database_schema, 'CATEGORICAL_CHOICES', self.choices)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Kết quả biên dịch được cache theo filters, không theo danh sách giá trị
+        filter_compiler._compile_canonical.cache_clear()
+        self.addCleanup(filter_compiler._compile_canonical.cache_clear)
+
+    def compile_one(self, key, value):
+        return filter_compiler.compile_clause(key, value)
+
+    def orm_values(self, compiled):
+        return list(LaptopInfo.objects.filter(compiled.q).values(*SUGGESTED_LAPTOP_FIELDS)
+                    .order_by(*catalog_index.CATALOG_ORDERING))
+
+    def test_startswith_endswith_keep_their_meaning(self):
+        self.assertEqual(self.compile_one('name__startswith', 'Laptop Asus'), ('name__istartswith', 'Laptop Asus'))
+        self.assertEqual(self.compile_one('name__istartswith', 'Laptop'), ('name__istartswith', 'Laptop'))
+        self.assertEqual(self.compile_one('cpu_model__endswith', 'H'), ('cpu_model__iendswith', 'H'))
+        self.assertEqual(self.compile_one('cpu_model__contains', 'i7'), ('cpu_model__icontains', 'i7'))
+
+    def test_text_lookups_reject_non_string_values(self):
+        for value in (True, False, 1, 1.5):
+            with self.subTest(value=value):
+                key, reason = self.compile_one('cpu_model__icontains', value)
+                self.assertIsNone(key)
+                self.assertIn('cần giá trị chuỗi', reason)
+        self.assertEqual(self.compile_one('name__iendswith', '  '), (None, 'chuỗi rỗng'))
+
+    def test_messages_report_the_lookup_sent(self):
+        key, reason = self.compile_one('ram_storage__startswith', '16')
+        self.assertIsNone(key)
+        self.assertIn('`startswith`', reason)
+        key, reason = self.compile_one('name__max', 'x')
+        self.assertIn('`max`', reason)
+
+    def test_compiled_filters(self):
+        for raw, expected in (
+            ({'ram_storage__ge': '16GB', 'discounted_price__max': '25 triệu'},
+             {'ram_storage__gte': 16, 'discounted_price__lte': 25000000}),
+            ({'cpu_cores__icontains': 8, 'cpu_model__contains': 'i7', 'gaming__icontains': True},
+             {'cpu_model__icontains': 'i7'}),
+            ({'mong_nhe': 'true', 'product_weight__between': [1.6, 1.0], 'vga_brand__in': 'nvidia'},
+             {'mong_nhe': 1, 'product_weight__range': [1.0, 1.6], 'vga_brand__in': ['nvidia']}),
+            ({'gaming': 1, 'vga_brand__in': ['NVIDIA', 'AMD'], 'ram_storage__gte': 16},
+             {'gaming': 1, 'vga_brand__in': ['nvidia', 'amd'], 'ram_storage__gte': 16}),
+            ({'os_version': 'Windows 11', 'cpu_threads__gte': '12'},
+             {'os_version': 'windows 11', 'cpu_threads__gte': 12}),
+            ({'gpu_brand': 'nvidia', 'ramstorage__gte': 16, 'vga_brand': ['nvidia', 'amd']},
+             {'ram_storage__gte': 16, 'vga_brand__in': ['nvidia', 'amd']}),
+            ({'vga_brand__gte': 'a', 'cpu_model__contains': 'i7'},
+             {'cpu_model__icontains': 'i7'}),
+            ({'manufacturer__in': [], 'display_size__isnull': 'false', 'refresh_rate': None},
+             {'display_size__isnull': False}),
+        ):
+            with self.subTest(raw=raw):
+                self.assertEqual(filter_compiler.compile_filters(raw).filters, expected)
+
+    def test_unknown_choice_matches_nothing(self):
+        # Giá trị hợp lệ nhưng không có trong catalog: không có kết quả, chứ không phải mọi laptop
+        index = catalog_index.CatalogIndex.from_database()
+        for raw in ({'manufacturer': 'xiaomi'}, {'manufacturer__in': ['Xiaomi', 'Huawei']},
+                    {'os_version': 'Linux', 'ram_storage__gte': 16}):
+            with self.subTest(raw=raw):
+                compiled = filter_compiler.compile_filters(raw)
+                self.assertEqual(len(compiled.filters), len(raw))
+                self.assertFalse(LaptopInfo.objects.filter(compiled.q).exists())
+                self.assertFalse(compiled.mask(index).any())
+
+    def test_compiled_garbage_never_breaks_queries(self):
+        # Filters đã biên dịch không được làm ORM lỗi, và index phải cho cùng kết quả
+        index = catalog_index.CatalogIndex.from_database()
+        rng = random.Random(0)
+        names = list(filter_compiler.MODEL_FIELDS) + ['gpu_brand', 'ramstorage', 'khong_co']
+        for _ in range(self.FUZZ_CASES):
+            raw = {rng.choice(names) + rng.choice(GARBAGE_LOOKUPS): rng.choice(GARBAGE_VALUES)
+                   for _ in range(rng.randint(1, 4))}
+            compiled = filter_compiler.compile_filters(raw)
+            with self.subTest(raw=raw):
+                self.assertEqual(index.select(compiled.mask(index), SUGGESTED_LAPTOP_FIELDS), self.orm_values(compiled))
+
+    def test_cache_ignores_key_order(self):
+        first = filter_compiler.compile_filters({'gaming': 1, 'ram_storage__gte': 16})
+        self.assertIs(filter_compiler.compile_filters({'ram_storage__gte': 16, 'gaming': 1}), first)
+        self.assertIs(filter_compiler.compile_filters(first), first)
+        with self.assertRaises(TypeError):
+            filter_compiler.compile_filters([('gaming', 1)])
+
+
+# ==============================================================================
+# FEATURE ENCODER: KẾT QUẢ PHẢI GIỐNG PIPELINE SKLEARN
+# ==============================================================================
+class FeatureEncoderTests(CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Không gán trong setUpTestData: Django deepcopy dữ liệu đó cho mỗi test (model có lock)
+        cls.predictor = predictor_service.PricePredictor(cls.defaults)
+        if cls.predictor.model is None:
+            raise AssertionError(f'Không tải được model {predictor_service.MODEL_PATH}')
+        cls.encoder = feature_encoder.FeatureEncoder.from_pipeline(cls.predictor.model)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.defaults = predictor_service.calculate_default_values(catalog_stats.CatalogStats.from_database())
+
+        # Laptop thật (fixture có sẵn vài NULL) và bản thiếu cột kiểu form gửi lên ('' / None, nhãn dạng chuỗi)
+        catalog = list(LaptopInfo.objects.order_by('pk').values(*predictor_service.PREDICT_FIELDS))
+        rng = random.Random(0)
+        cls.profiles = list(catalog)
+        for _ in range(200):
+            profile = dict(rng.choice(catalog))
+            for field in rng.sample(predictor_service.PREDICT_FIELDS, rng.randint(1, 8)):
+                if field in predictor_service.PREDICT_LABEL_FIELDS:
+                    profile[field] = rng.choice(['0', '1', '', None])
+                else:
+                    profile[field] = rng.choice(['', None])
+            cls.profiles.append(profile)
+
+    def test_encoder_matches_pipeline(self):
+        rows = [self.predictor.impute(profile) for profile in self.profiles]
+        np.testing.assert_allclose(np.asarray(self.encoder.predict(rows), dtype=np.float64),
+                                   np.asarray(self.predictor.pipeline_predict(rows), dtype=np.float64), rtol=1e-6)
+
+    def test_single_row_matches_batch(self):
+        # Buffer của encoder được dùng lại giữa các lần gọi
+        rows = [self.predictor.impute(profile) for profile in self.profiles[-20:]]
+        batch = self.encoder.predict(rows)
+        for row, expected in zip(rows, batch):
+            self.assertAlmostEqual(float(self.encoder.predict([row])[0]), float(expected), delta=abs(expected) * 1e-6)
+
+    def test_imputes_missing_values(self):
+        row = self.predictor.impute({'manufacturer': '', 'ram_storage': None, 'do_hoa_ky_thuat': '1'})
+        self.assertEqual(row['manufacturer'], self.predictor.default_imputation_values['manufacturer'])
+        self.assertEqual(row['ram_storage'], self.predictor.default_imputation_values['ram_storage'])
+        self.assertEqual(row['do_hoa_ky_thuat'], 1)
+        np.testing.assert_allclose(self.encoder.predict([row]), self.predictor.pipeline_predict([row]), rtol=1e-6)
+
+
+# ==============================================================================
+# GIÁ DỰ ĐOÁN CHO TOÀN CATALOG
+# ==============================================================================
+class PriceCatalogTests(CatalogFixtureMixin, TestCase):
+    DEAL_FILTERS = [
+        {},
+        {'discounted_price__gte': 15000000, 'discounted_price__lte': 25000000},
+        {'gaming': 1, 'ram_storage__gte': 16},
+        {'hoc_tap_van_phong': 1, 'product_weight__lte': 1.6},
+        {'manufacturer__in': ['asus', 'lenovo']},
+    ]
+
+    def setUp(self):
+        # refresh() / publish() gán biến module: trả lại như cũ sau mỗi test
+        for patcher in (mock.patch.object(catalog_index, 'catalog', catalog_index.CatalogIndex.from_database()),
+                        mock.patch.object(price_catalog, 'predictions', None),
+                        mock.patch.object(ranking, 'deal_scores', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.stats = price_catalog.refresh(force=True)
+
+    def test_batch_matches_single_predictions(self):
+        self.assertEqual(self.stats['laptops'], LaptopInfo.objects.count())
+        stored = LaptopPricePrediction.objects.in_bulk()
+        for row in price_catalog.catalog_rows():
+            with self.subTest(product_id=row['product_id']):
+                single = predictor_service.predictor.predict({field: row[field] for field in predictor_service.PREDICT_FIELDS})
+                record = stored[row['product_id']]
+                self.assertAlmostEqual(record.predicted_price, float(single['predict_price']), delta=1)
+                self.assertEqual(record.deal_score, price_catalog.deal_score(record.predicted_price, row['discounted_price']))
+                self.assertEqual(price_catalog.predictions[row['product_id']], (record.predicted_price, record.deal_score))
+
+    def test_refresh_only_when_versions_change(self):
+        self.assertIsNone(price_catalog.refresh())
+        with mock.patch.object(predictor_service, 'model_version', return_value='model-changed'):
+            self.assertIsNotNone(price_catalog.refresh())
+            self.assertIsNone(price_catalog.refresh())
+        with mock.patch.object(price_catalog, 'catalog_version', return_value='catalog-changed'):
+            self.assertIsNotNone(price_catalog.refresh())
+        # Quay về version ban đầu: bảng đang chứa version khác nên tính lại
+        self.assertIsNotNone(price_catalog.refresh())
+        self.assertIsNone(price_catalog.refresh())
+        self.assertEqual(set(LaptopPricePrediction.objects.values_list('model_version', 'catalog_version')),
+                         {price_catalog.versions()})
+
+    def test_find_deals_index_matches_database(self):
+        for filters in self.DEAL_FILTERS:
+            for min_score in (0.0, -1.0):
+                with self.subTest(filters=filters, min_score=min_score):
+                    indexed = price_catalog.find_deals(filters, limit=20, min_score=min_score)
+                    # Không có giá dự đoán trong bộ nhớ: subquery trên database
+                    with mock.patch.object(price_catalog, 'predictions', None):
+                        database = price_catalog.find_deals(filters, limit=20, min_score=min_score)
+                    self.assertTrue(database or not filters)
+                    self.assertEqual([deal['deal_score'] for deal in indexed], [deal['deal_score'] for deal in database])
+                    self.assertEqual({deal['product_id'] for deal in indexed}, {deal['product_id'] for deal in database})
+
+
+# ==============================================================================
+# INTENT SERVICE
+# ==============================================================================
+class IntentServiceTests(TestCase):
+    EMPTY_MESSAGES = ('', '   ', '\n\t ', None)
+    CORPUS = settings.BASE_DIR.parent / 'data' / 'qa_data' / 'laptop_qa.csv'
+    QUESTIONS = 300
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(cls.CORPUS, encoding='utf-8-sig') as file:
+            cls.questions = [row['question'] for row in csv.DictReader(file) if row['question'].strip()][:cls.QUESTIONS]
+        cls.direct = intent_classifier.IntentClassifier(cache_size=0, batch_window=0)
+        if cls.direct.model is None:
+            raise AssertionError('Không tải được model phân loại intent')
+        cls.expected = cls.direct.model.predict(cls.questions).tolist()
+
+    def test_batched_labels_match_model_predict(self):
+        results = self.direct.classify_many(self.questions)
+        for question, labels, result in zip(self.questions, self.expected, results):
+            with self.subTest(question=question):
+                self.assertEqual(result['labels'], labels)
+                # Xác suất > 0.5 tương ứng nhãn 1
+                self.assertEqual([int(p > 0.5) for p in result['probabilities']], result['labels'])
+
+    def test_micro_batches_match_direct_calls(self):
+        batcher = intent_classifier.IntentClassifier(cache_size=0, batch_window=0.005)
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda question: batcher.classify_many([question])[0], self.questions))
+        self.assertEqual([result['labels'] for result in results], self.expected)
+        self.assertLess(batcher.stats()['batches'], len(self.questions))
+
+        async def classify_all():
+            return await asyncio.gather(*(batcher.aclassify_many([question]) for question in self.questions[:50]))
+        self.assertEqual([result[0]['labels'] for result in async_to_sync(classify_all)()], self.expected[:50])
+
+    def test_cached_results_match_model(self):
+        cached = intent_classifier.IntentClassifier(cache_size=1024, batch_window=0)
+        cached.classify_many(self.questions)
+        # Khác hoa thường / khoảng trắng vẫn là cùng một câu hỏi
+        repeated = [question.upper() if idx % 2 else f'  {question} ' for idx, question in enumerate(self.questions)]
+        results = cached.classify_many(repeated)
+        self.assertEqual([result['labels'] for result in results], self.expected)
+        self.assertEqual(cached.stats()['hits'], len(set(map(intent_classifier.normalize, self.questions))))
+
+    def test_empty_message_has_no_intent(self):
+        # Không được đưa tin nhắn rỗng vào model / thread gom batch
+        with mock.patch.object(intent_classifier.classifier, 'classify_many', side_effect=AssertionError), \
+             mock.patch.object(intent_classifier.classifier, 'aclassify_many', side_effect=AssertionError):
+            for message in self.EMPTY_MESSAGES:
+                with self.subTest(message=message):
+                    self.assertEqual(intent_service.detect(message), [])
+                    self.assertEqual(async_to_sync(intent_service.adetect)(message), [])
+
+    def test_intent_detect_view_accepts_empty_message(self):
+        for body in ({'user_message': '  '}, {}):
+            with self.subTest(body=body):
+                response = self.client.post(reverse('chat:intent_detect'), json.dumps(body), content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), {'data': []})
+
+
+# ==============================================================================
+# ĐỊNH TUYẾN GIỮA NHIỀU PROVIDER LLM
+# ==============================================================================
+def fake_provider(alias, latency='fixed:0', error_rate=0.0, seed=0):
+    service = llms_service.FakeLLMService(model_name='fake', latency=latency, error_rate=error_rate, seed=seed)
+    service.model_alias = alias
+    return service
+
+
+class RouterLLMServiceTests(TestCase):
+    BUDGET_PROMPT = next(prompt for prompt, kind in PROMPT_TYPES.items() if kind == 'budget')
+
+    def router(self, services, **options):
+        options.setdefault('routes', {'*': [service.model_alias for service in services]})
+        return llms_service.RouterLLMService(services, **options)
+
+    def test_breaker_opens_after_failure_threshold(self):
+        stats = llms_service.ProviderStats(failure_threshold=3, cooldown=30)
+        for _ in range(2):
+            stats.record(0.1, failed=True)
+        self.assertEqual(stats.state(), 'closed')
+        stats.record(0.1, failed=True)
+        self.assertEqual((stats.state(), stats.trips), ('open', 1))
+        self.assertFalse(stats.acquire())
+
+        # Qua router: provider chính bị bỏ qua khi breaker mở, mọi request vẫn có kết quả
+        primary = fake_provider('primary', error_rate=1)
+        router = self.router([primary, fake_provider('secondary')], failure_threshold=3, cooldown=30)
+        for idx in range(6):
+            self.assertTrue(llms_service.CachedLLMService.is_cacheable(router.invoke(self.BUDGET_PROMPT, f'câu {idx}')))
+        self.assertEqual(primary.calls, 3)
+        self.assertEqual(router.stats()['providers']['primary']['state'], 'open')
+
+    def test_half_open_allows_one_probe(self):
+        stats = llms_service.ProviderStats(failure_threshold=1, cooldown=0)
+        stats.record(0.1, failed=True)
+        self.assertEqual(stats.state(), 'half_open')
+        self.assertTrue(stats.acquire())
+        self.assertFalse(stats.acquire())
+        self.assertEqual(stats.state(), 'open')
+        # Request thử lỗi: mở lại; thành công: đóng
+        stats.record(0.1, failed=True)
+        self.assertEqual(stats.trips, 2)
+        self.assertTrue(stats.acquire())
+        stats.record(0.1, failed=False)
+        self.assertEqual((stats.state(), stats.consecutive_failures), ('closed', 0))
+
+    def test_cancelled_probe_releases_half_open(self):
+        stats = llms_service.ProviderStats(failure_threshold=1, cooldown=0)
+        stats.record(0.1, failed=True)
+        self.assertTrue(stats.acquire())
+        stats.cancelled(0.2)
+        self.assertFalse(stats.probing)
+        self.assertTrue(stats.acquire())
+
+        # Qua router: request thử của provider chính thua hedge và bị hủy
+        primary = fake_provider('primary', latency='fixed:1')
+        router = self.router([primary, fake_provider('secondary')], failure_threshold=1, cooldown=0, hedge_delay=0.02)
+        router.provider_stats['primary'].record(0.1, failed=True)
+        async_to_sync(router.ainvoke)(self.BUDGET_PROMPT, 'laptop gaming')
+        self.assertFalse(router.provider_stats['primary'].probing)
+        self.assertEqual(router.provider_stats['primary'].state(), 'half_open')
+
+    def test_hedge_fires_after_hedge_delay(self):
+        slow, fast = fake_provider('slow', latency='fixed:0.5'), fake_provider('fast', latency='fixed:0.01')
+        router = self.router([slow, fast], hedge_delay=0.05)
+        start = time.monotonic()
+        response = router.invoke(self.BUDGET_PROMPT, 'laptop gaming')
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(response, fast.invoke(self.BUDGET_PROMPT, 'laptop gaming'))
+        self.assertEqual((router.hedged_requests, router.provider_stats['fast'].hedges,
+                          router.provider_stats['fast'].wins), (1, 1, 1))
+
+        # Provider chính trả lời trước hedge_delay: không gửi thêm
+        primary, secondary = fake_provider('primary', latency='fixed:0.01'), fake_provider('secondary')
+        router = self.router([primary, secondary], hedge_delay=0.5)
+        router.invoke(self.BUDGET_PROMPT, 'laptop gaming')
+        self.assertEqual((secondary.calls, router.hedged_requests), (0, 0))
+
+    def test_hedge_after_uses_quantile_once_enough_samples(self):
+        router = self.router([fake_provider('primary'), fake_provider('secondary')], hedge_delay=2, min_samples=10,
+                             hedge_quantile=0.9)
+        stats = router.provider_stats['primary']
+        for idx in range(9):
+            stats.record(0.1 * (idx + 1), failed=False)
+        self.assertEqual(router.hedge_after('primary'), 2)
+        stats.record(1.0, failed=False)
+        self.assertAlmostEqual(router.hedge_after('primary'), 1.0)
+
+    def test_failover_to_next_provider(self):
+        failing, backup = fake_provider('failing', error_rate=1), fake_provider('backup')
+        router = self.router([failing, backup])
+        self.assertEqual(router.invoke(self.BUDGET_PROMPT, 'tầm 15 triệu'), backup.invoke(self.BUDGET_PROMPT, 'tầm 15 triệu'))
+        self.assertEqual(router.provider_stats['failing'].failures, 1)
+
+        # Provider raise exception cũng được chuyển tiếp
+        raising = fake_provider('raising')
+        router = self.router([raising, fake_provider('backup')])
+        with mock.patch.object(raising, 'invoke', side_effect=RuntimeError('timeout')):
+            self.assertTrue(llms_service.CachedLLMService.is_cacheable(router.invoke(self.BUDGET_PROMPT, 'tầm 15tr')))
+
+        # Mọi provider lỗi: trả về thông báo lỗi như provider thật
+        router = self.router([fake_provider('a', error_rate=1), fake_provider('b', error_rate=1)])
+        self.assertEqual(router.invoke(self.BUDGET_PROMPT, 'tầm 15tr'), llms_service.FakeLLMService.ERROR_MESSAGE)
+        self.assertEqual(async_to_sync(router.ainvoke)(self.BUDGET_PROMPT, 'tầm 15tr'),
+                         llms_service.FakeLLMService.ERROR_MESSAGE)
+        self.assertEqual(router.stats()['unavailable'], 2)
+
+    def test_async_cancels_losing_request(self):
+        slow, fast = fake_provider('slow', latency='fixed:5'), fake_provider('fast', latency='fixed:0.01')
+        router = self.router([slow, fast], hedge_delay=0.05)
+
+        async def run():
+            start = time.monotonic()
+            response = await router.ainvoke(self.BUDGET_PROMPT, 'laptop gaming')
+            await asyncio.sleep(0)
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            return response, time.monotonic() - start, pending
+
+        response, elapsed, pending = async_to_sync(run)()
+        self.assertEqual(response, fast.invoke(self.BUDGET_PROMPT, 'laptop gaming'))
+        self.assertLess(elapsed, 1)
+        self.assertEqual(pending, [])
+        # Request bị hủy: không tính là lỗi, nhưng độ trễ (ít nhất) vẫn được ghi lại
+        stats = router.provider_stats['slow']
+        self.assertEqual((stats.calls, stats.failures, len(stats.latencies)), (0, 0, 1))
+
+    def test_routes_follow_parse_routes(self):
+        routes = llms_service.parse_routes(' budget = secondary, primary ; *=primary,secondary;group=')
+        self.assertEqual(routes, {'budget': ['secondary', 'primary'], '*': ['primary', 'secondary']})
+        primary, secondary = fake_provider('primary'), fake_provider('secondary', seed=1)
+        router = self.router([primary, secondary], routes=routes)
+        for prompt, kind in PROMPT_TYPES.items():
+            for idx in range(5):
+                router.invoke(prompt, f'{kind} {idx}')
+        self.assertEqual((primary.calls, secondary.calls), (10, 5))
+
+        with self.assertRaises(ValueError):
+            self.router([fake_provider('primary')], routes={'*': ['primary', 'khong-co']})
+        with self.assertRaises(ValueError):
+            self.router([fake_provider('primary'), fake_provider('primary')])
+
+    def test_order_by_stats_without_routes(self):
+        router = self.router([fake_provider('a'), fake_provider('b'), fake_provider('c')], routes={})
+        self.assertEqual(router.order(self.BUDGET_PROMPT), ['a', 'b', 'c'])
+        router.provider_stats['a'].record(0.1, failed=True)
+        router.provider_stats['b'].record(0.5, failed=False)
+        router.provider_stats['c'].record(0.2, failed=False)
+        # Tỉ lệ lỗi >= 50% xuống cuối, còn lại theo p50
+        self.assertEqual(router.order(self.BUDGET_PROMPT), ['c', 'b', 'a'])
+
+
+# ==============================================================================
+# TRÍCH XUẤT NGÂN SÁCH BẰNG LUẬT
+# ==============================================================================
+TR = 1_000_000
+
+
+class BudgetParserTests(TestCase):
+    # (tin nhắn, (budget_min, budget_max)) - None: parser phải nhường cho LLM
+    CASES = [
+        ('tầm 15tr', (15 * TR, 15 * TR)),
+        ('Chào bạn, mình đang muốn tìm một chiếc laptop tầm 15 triệu.', (15 * TR, 15 * TR)),
+        ('Ngân sách của mình dao động từ 20 đến 25 củ nhé shop.', (20 * TR, 25 * TR)),
+        ('Mình là sinh viên, chỉ cần máy nào dưới 18tr thôi.', (None, 18 * TR)),
+        ('dưới 20 triệu', (None, 20 * TR)),
+        ('từ 10 đến 15 củ', (10 * TR, 15 * TR)),
+        ('10-15tr', (10 * TR, 15 * TR)),
+        ('tầm giá 20 - 25 triệu', (20 * TR, 25 * TR)),
+        ('trên 30tr', (30 * TR, None)),
+        ('tầm 15 triệu trở lên', (15 * TR, None)),
+        ('20tr đổ lại', (None, 20 * TR)),
+        ('ngân sách 18 triệu đổ lại', (None, 18 * TR)),
+        ('không quá 30 củ', (None, 30 * TR)),
+        ('max 25tr', (None, 25 * TR)),
+        ('khoảng 12.000.000đ', (12 * TR, 12 * TR)),
+        ('giá 12.000.000', (12 * TR, 12 * TR)),
+        ('15tr5', (15_500_000, 15_500_000)),
+        ('tầm 15.5 triệu', (15_500_000, 15_500_000)),
+        ('tầm 15', (15 * TR, 15 * TR)),
+        ('duoi 20 trieu', (None, 20 * TR)),
+        ('tam 17tr', (17 * TR, 17 * TR)),
+        ('trên 15 triệu dưới 20 triệu', (15 * TR, 20 * TR)),
+        ('tối thiểu 10tr, tối đa 15tr', (10 * TR, 15 * TR)),
+        ('rtx 4060 tầm 25tr', (25 * TR, 25 * TR)),
+        ('i7 13700h dưới 30tr', (None, 30 * TR)),
+        ('laptop ram 16gb giá 20 triệu', (20 * TR, 20 * TR)),
+        ('nhỏ hơn 20tr', (None, 20 * TR)),
+        ('laptop gaming 14 inch tầm 22 củ', (22 * TR, 22 * TR)),
+        # Phần lẻ sau "triệu"
+        ('15 triệu rưỡi', (15_500_000, 15_500_000)),
+        ('tầm 15tr rưỡi', (15_500_000, 15_500_000)),
+        ('dưới 20 triệu 5', (None, 20_500_000)),
+        ('tầm 15 triệu 5 trăm', (15_500_000, 15_500_000)),
+        ('khoảng 15 triệu 500 nghìn', (15_500_000, 15_500_000)),
+        ('15tr 500k', (15_500_000, 15_500_000)),
+        ('từ 10 đến 12 củ rưỡi', (10 * TR, 12_500_000)),
+        ('dưới 20 triệu 16gb ram', (None, 20 * TR)),
+        ('tầm 20 triệu 2 năm bảo hành', (20 * TR, 20 * TR)),
+        ('giá bao nhiêu', None),
+        ('tầm 14 inch', None),
+        ('15tr hay 20tr', None),
+        ('trả góp 2tr mỗi tháng', None),
+        ('lên đời máy này bù thêm 5tr được không', None),
+        ('tối đa 500k', None),
+        ('laptop dưới 2kg', None),
+        # Phần lẻ không đọc được: số tiền có thể sai
+        ('tầm 15 triệu 1234', None),
+    ]
+
+    def test_cases(self):
+        threshold = settings.CHAT_BUDGET_PARSER_MIN_CONFIDENCE
+        for message, expected in self.CASES:
+            with self.subTest(message=message):
+                parsed = budget_parser.parse_budget(message)
+                if expected is None:
+                    self.assertLess(parsed['confidence'], threshold, parsed)
+                else:
+                    self.assertGreaterEqual(parsed['confidence'], threshold, parsed)
+                    self.assertEqual((parsed['budget_min'], parsed['budget_max']), expected)
+
+    def test_leftover_after_million_is_not_confident(self):
+        # Trước đây "15 triệu rưỡi" đọc thành 15 triệu với độ tự tin 0.85 và bỏ qua LLM
+        for message in ('15 triệu 1234', '15 triệu rưỡi rưỡi'):
+            with self.subTest(message=message):
+                self.assertLess(budget_parser.parse_budget(message)['confidence'],
+                                settings.CHAT_BUDGET_PARSER_MIN_CONFIDENCE)
+
+
+# ==============================================================================
+# GHÉP PERSONA BẰNG TỪ KHÓA
+# ==============================================================================
+class PersonaMatcherTests(TestCase):
+    # (tin nhắn, persona mong đợi) - None: matcher phải nhường cho LLM
+    CASES = [
+        ('Laptop chơi game tốt', 'Gaming'),
+        ('laptop choi game valorant muot', 'Gaming'),
+        ('Mình cần máy để học tập và làm văn phòng', 'Học tập - Văn phòng'),
+        ('máy cho sinh viên kế toán, dùng excel nhiều', 'Học tập - Văn phòng'),
+        ('Laptop cho lập trình viên, hay chạy docker', 'Lập trình - Kỹ thuật'),
+        ('học ngành công nghệ thông tin nên mua máy nào', 'Lập trình - Kỹ thuật'),
+        ('Máy để thiết kế đồ họa, dùng photoshop và premiere', 'Đồ họa - Sáng tạo'),
+        ('dựng phim, edit video 4k', 'Đồ họa - Sáng tạo'),
+        ('chạy autocad, solidworks', 'Đồ họa - Sáng tạo'),
+        ('Laptop mỏng nhẹ để mang đi công tác', 'Mỏng nhẹ'),
+        ('máy cao cấp sang trọng cho doanh nhân', 'Cao cấp - Sang trọng'),
+        ('laptop gaming ram 32gb 165hz card rời', 'Gaming'),
+        ('văn phòng, không chơi game', 'Học tập - Văn phòng'),
+        ('học tập và chơi game', None),
+        ('sinh viên IT chơi game', None),
+        ('laptop nào tốt', None),
+        ('máy đẹp', None),
+    ]
+
+    def test_cases(self):
+        threshold = settings.CHAT_PERSONA_MATCHER_MIN_CONFIDENCE
+        for message, expected in self.CASES:
+            with self.subTest(message=message):
+                matched = persona_matcher.match_persona(message)
+                self.assertEqual(matched['persona'] if matched['confidence'] >= threshold else None, expected, matched)
+
+    def test_every_usage_keyword_belongs_to_a_persona(self):
+        covered = {fold(keyword) for spec in persona_matcher.PERSONAS.values() for keyword in spec['keywords']}
+        self.assertEqual([keyword for keyword in persona_matcher.USAGE_KEYWORDS if fold(keyword) not in covered], [])
+
+    def test_persona_filters_compile_unchanged(self):
+        for persona, spec in persona_matcher.PERSONAS.items():
+            with self.subTest(persona=persona):
+                self.assertEqual(filter_compiler.compile_filters(spec['filters']).issues, [])
+
+    def test_negated_keywords_are_ignored(self):
+        for message in ('không chơi game', 'ko chơi game đâu', 'ít khi chơi game'):
+            with self.subTest(message=message):
+                self.assertEqual(persona_matcher.match_persona(message)['persona'], None)
+        self.assertEqual(persona_matcher.match_persona('không chơi game, chủ yếu lập trình')['keywords'], ['lap trinh'])
+
+    def test_explicit_thresholds_override_persona_defaults(self):
+        matched = persona_matcher.match_persona('laptop gaming ram 32gb 165hz card rời')
+        self.assertEqual(matched['filters'], {'gaming': 1, 'vga_brand__in': ['nvidia', 'amd'],
+                                              'ram_storage__gte': 32, 'refresh_rate__gte': 165})
+        matched = persona_matcher.match_persona('mỏng nhẹ dưới 1,5kg ssd 1tb')
+        self.assertEqual(matched['filters'], {'mong_nhe': 1, 'storage_gb__gte': 1024, 'product_weight__lte': 1.5})
+
+    def test_confidence_is_share_of_best_persona(self):
+        self.assertEqual(persona_matcher.match_persona('học tập và chơi game')['confidence'], 0.5)
+        self.assertEqual(persona_matcher.match_persona('chơi game, lập trình, chạy docker')['confidence'],
+                         round(2 / 3, 4))
+        self.assertEqual(persona_matcher.match_persona('máy đẹp'),
+                         {'persona': None, 'filters': {}, 'confidence': 0.0, 'keywords': []})
+
+
+# ==============================================================================
+# CACHE HTML ĐÃ RENDER
+# ==============================================================================
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        self.cache = rendering.FragmentCache(LocMemCache('chat-tests-render', {}))
+        patcher = mock.patch.object(catalog_index, 'catalog', mock.Mock(checksum='a' * 64))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_key_changes_with_content_catalog_and_templates(self):
+        key = self.cache.make_key('exchange', 7, ['laptop gaming', [0], ['Ngân sách'], '{}'])
+        self.assertEqual(self.cache.make_key('exchange', 7, ['laptop gaming', [0], ['Ngân sách'], '{}']), key)
+        self.assertNotEqual(self.cache.make_key('exchange', 7, ['laptop gaming', [1], ['Nhu cầu'], '{}']), key)
+        self.assertNotEqual(self.cache.make_key('exchange', 8, ['laptop gaming', [0], ['Ngân sách'], '{}']), key)
+        self.assertNotEqual(self.cache.make_key('user', 7, ['laptop gaming', [0], ['Ngân sách'], '{}']), key)
+        # Catalog đổi: laptop hiển thị trong HTML có thể đã đổi giá
+        with mock.patch.object(catalog_index, 'catalog', mock.Mock(checksum='b' * 64)):
+            self.assertNotEqual(self.cache.make_key('exchange', 7, ['laptop gaming', [0], ['Ngân sách'], '{}']), key)
+        with mock.patch.object(catalog_index, 'catalog', None):
+            self.assertNotEqual(self.cache.make_key('exchange', 7, ['laptop gaming', [0], ['Ngân sách'], '{}']), key)
+        # Deploy template mới
+        with mock.patch.object(rendering, 'template_fingerprint', return_value='template-moi'):
+            self.assertNotEqual(self.cache.make_key('exchange', 7, ['laptop gaming', [0], ['Ngân sách'], '{}']), key)
+
+    def test_rendered_once_until_catalog_changes(self):
+        with mock.patch.object(rendering, 'fragments', self.cache), \
+             mock.patch.object(rendering, 'render_to_string', return_value='<div>html</div>') as render:
+            self.assertEqual(rendering.render_user_message('laptop **gaming**'), '<div>html</div>')
+            self.assertEqual(rendering.render_user_message('laptop **gaming**'), '<div>html</div>')
+            self.assertEqual(render.call_count, 1)
+            rendering.render_user_message('laptop văn phòng')
+            self.assertEqual(render.call_count, 2)
+            with mock.patch.object(catalog_index, 'catalog', mock.Mock(checksum='b' * 64)):
+                rendering.render_user_message('laptop **gaming**')
+            self.assertEqual(render.call_count, 3)
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 3, 'hit_rate': 0.25})
+
+    def test_history_renders_only_changed_exchanges(self):
+        messages = [ChatMessage(id=idx, user_message=f'câu hỏi {idx}', intent_codes=[0], intent_meanings=['Ngân sách'],
+                                ai_response=f'trả lời {idx}') for idx in range(3)]
+        with mock.patch.object(rendering, 'fragments', self.cache), \
+             mock.patch.object(rendering, 'render_exchange', side_effect=lambda data: data['ai_response']) as render:
+            self.assertEqual(rendering.render_history(messages), ['trả lời 0', 'trả lời 1', 'trả lời 2'])
+            self.assertEqual(rendering.render_history(messages), ['trả lời 0', 'trả lời 1', 'trả lời 2'])
+            self.assertEqual(render.call_count, 3)
+            # Nội dung một lượt đổi: chỉ lượt đó được render lại
+            messages[1].ai_response = 'trả lời mới'
+            self.assertEqual(rendering.render_history(messages), ['trả lời 0', 'trả lời mới', 'trả lời 2'])
+            self.assertEqual(render.call_count, 4)
+
+
+# ==============================================================================
+# SINGLE-FLIGHT
+# ==============================================================================
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Hết thời gian chờ')
+        time.sleep(0.005)
+
+
+class SingleFlightTests(TestCase):
+    CONCURRENT = 4
+
+    def run_threads(self, func, count):
+        """Gọi func(idx) trên `count` thread; trả về kết quả hoặc exception của từng lần gọi."""
+        def one(idx):
+            try:
+                return func(idx)
+            except Exception as error:
+                return error
+
+        with ThreadPoolExecutor(count) as executor:
+            return list(executor.map(one, range(count)))
+
+    def test_followers_share_leader_result(self):
+        flight = single_flight.SingleFlight()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            # Chờ mọi request còn lại nhập vào làm follower
+            wait_until(lambda: flight.followers == self.CONCURRENT - 1)
+            return {'ai_response': []}
+
+        messages = ['Laptop  gaming', 'laptop gaming', 'LAPTOP GAMING ', 'laptop gaming']
+        results = self.run_threads(lambda idx: flight.do(messages[idx], compute), self.CONCURRENT)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual({key: flight.stats()[key] for key in ('in_flight', 'leaders', 'followers')},
+                         {'in_flight': 0, 'leaders': 1, 'followers': self.CONCURRENT - 1})
+
+    def test_leader_error_reaches_followers(self):
+        flight = single_flight.SingleFlight()
+
+        def compute():
+            wait_until(lambda: flight.followers == self.CONCURRENT - 1)
+            raise ValueError('LLM lỗi')
+
+        results = self.run_threads(lambda idx: flight.do('laptop gaming', compute), self.CONCURRENT)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        # Lỗi không được giữ lại: request sau tự tính
+        self.assertEqual(flight.do('laptop gaming', lambda: 'ok'), 'ok')
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        flight = single_flight.SingleFlight()
+        calls = []
+
+        async def run():
+            started, release = asyncio.Event(), asyncio.Event()
+
+            async def compute():
+                calls.append(1)
+                started.set()
+                await release.wait()
+                return 'kết quả'
+
+            leader = asyncio.ensure_future(flight.ado('laptop gaming', compute))
+            await started.wait()
+            follower = asyncio.ensure_future(flight.ado('Laptop Gaming', compute))
+            await asyncio.sleep(0)
+            # Client của leader ngắt kết nối
+            leader.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            return leader, await follower
+
+        leader, result = async_to_sync(run)()
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(result, 'kết quả')
+        self.assertEqual(len(calls), 1)
+
+    def test_async_leader_error_reaches_followers(self):
+        flight = single_flight.SingleFlight()
+
+        async def run():
+            async def compute():
+                await asyncio.sleep(0.01)
+                raise ValueError('LLM lỗi')
+            return await asyncio.gather(*(flight.ado('laptop gaming', compute) for _ in range(self.CONCURRENT)),
+                                        return_exceptions=True)
+
+        results = async_to_sync(run)()
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flight.stats()['followers'], self.CONCURRENT - 1)
+
+    def test_stages_are_isolated(self):
+        flight = single_flight.SingleFlight()
+
+        async def run():
+            def compute(result):
+                async def inner():
+                    await asyncio.sleep(0.01)
+                    return result
+                return inner
+            return await asyncio.gather(flight.ado('laptop gaming', compute('intent'), stage='intent'),
+                                        flight.ado('laptop gaming', compute('personas'), stage='personas'),
+                                        flight.ado('laptop gaming', compute('message')))
+
+        self.assertEqual(async_to_sync(run)(), ['intent', 'personas', 'message'])
+        self.assertEqual(flight.stats()['followers'], 0)
+
+    def test_process_message_keeps_each_user_message(self):
+        flight = single_flight.SingleFlight()
+        messages = ['Laptop cho sinh viên', 'laptop cho sinh viên', '  LAPTOP cho sinh viên']
+
+        def compute_message(user_message):
+            wait_until(lambda: flight.followers == len(messages) - 1)
+            return {'user_message': user_message, 'ai_response': [{'persona': 'Sinh viên'}]}
+
+        with mock.patch.object(single_flight, 'coalescer', flight), \
+             mock.patch.object(chat_service, 'compute_message', compute_message):
+            results = self.run_threads(lambda idx: chat_service.process_message(messages[idx]), len(messages))
+        self.assertEqual([result['user_message'] for result in results], messages)
+        self.assertTrue(all(result['ai_response'] is results[0]['ai_response'] for result in results))
+
+    def test_shared_backend_between_workers(self):
+        backend = LocMemCache('chat-tests-single-flight', {})
+        workers = [single_flight.SingleFlight(backend=backend, wait_timeout=5) for _ in range(2)]
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'kết quả'
+
+        with ThreadPoolExecutor(2) as executor:
+            first = executor.submit(workers[0].do, 'laptop gaming', compute)
+            started.wait(5)
+            # Worker thứ hai thấy lock của worker đầu: chờ kết quả thay vì tự tính
+            second = executor.submit(workers[1].do, 'laptop gaming', compute)
+            time.sleep(2 * single_flight.POLL_INTERVAL)
+            release.set()
+            self.assertEqual((first.result(), second.result()), ('kết quả', 'kết quả'))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(workers[1].stats()['shared_hits'], 1)
+
+    def test_errors_are_not_shared_between_workers(self):
+        backend = LocMemCache('chat-tests-single-flight-errors', {})
+        workers = [single_flight.SingleFlight(backend=backend, wait_timeout=5) for _ in range(2)]
+        with self.assertRaises(ValueError):
+            workers[0].do('laptop gaming', mock.Mock(side_effect=ValueError('LLM lỗi')))
+        self.assertEqual(workers[1].do('laptop gaming', lambda: 'ok'), 'ok')
+        self.assertEqual(workers[1].stats()['shared_hits'], 0)
+
+
+# ==============================================================================
+# SINGLE-FLIGHT TRÊN LUỒNG SSE
+# ==============================================================================
+class StreamSingleFlightTests(TestCase):
+    CONCURRENT = 5
+
+    def stream_all(self, messages):
+        async def consume(message):
+            return [event async for event in chat_service.astream_message(message)]
+
+        async def run():
+            return await asyncio.gather(*(consume(message) for message in messages))
+        return async_to_sync(run)()
+
+    def test_concurrent_streams_share_intent_and_llm_stages(self):
+        calls = {'intent': 0, 'personas': 0}
+
+        async def adetect(user_message):
+            calls['intent'] += 1
+            await asyncio.sleep(0.05)
+            return [{'intent_code': 0, 'intent_meaning': 'Ngân sách'}, {'intent_code': 1, 'intent_meaning': 'Nhu cầu'}]
+
+        async def aprepare_personas(user_message):
+            calls['personas'] += 1
+            await asyncio.sleep(0.05)
+            return [], []
+
+        with mock.patch.object(single_flight, 'coalescer', single_flight.SingleFlight()), \
+             mock.patch.object(chat_service.intent_service, 'adetect', adetect), \
+             mock.patch.object(chat_service.recommendation_service, 'aprepare_personas', aprepare_personas), \
+             mock.patch.object(chat_service.recommendation_service, 'arecommend_by_name', mock.AsyncMock(return_value=None)):
+            # Khác hoa thường / khoảng trắng vẫn là cùng một câu hỏi
+            results = self.stream_all(['Laptop cho sinh viên  IT'] + ['laptop cho sinh viên it'] * (self.CONCURRENT - 1))
+
+        self.assertEqual(calls, {'intent': 1, 'personas': 1})
+        for events in results:
+            self.assertEqual([event for event, _ in events], ['intent', 'personas'])
+        # Mỗi luồng giữ nguyên câu chữ người dùng gõ
+        self.assertEqual(results[0][0][1]['user_message'], 'Laptop cho sinh viên  IT')
+
+    def test_stages_do_not_share_results(self):
+        flight = single_flight.SingleFlight()
+        self.assertNotEqual(flight.make_key('laptop gaming', 'intent'), flight.make_key('laptop gaming', 'personas'))
+        self.assertNotEqual(flight.make_key('laptop gaming', 'intent'), flight.make_key('laptop gaming'))
+
+    def test_persona_request_does_not_modify_shared_item(self):
+        # Item persona từ LLM được chia sẻ giữa các luồng đi chung stage 'personas'
+        item = {'persona': 'Sinh viên', 'filters': {'ram_amount__gte': 8}}
+        filters, _ = chat_service.persona_request(item, 20_000_000)
+        self.assertEqual(item['filters'], {'ram_amount__gte': 8})
+        self.assertEqual(filters['discounted_price__lte'], 20_000_000 + chat_service.PERSONA_PRICE_RANGE)
+        self.assertEqual(chat_service.persona_request({'persona': 'Sinh viên', 'filters': None}, None)[0], {})
+
+
+# ==============================================================================
+# CURSOR "XEM THÊM" GẮN VỚI VERSION CỦA DEAL SCORE
+# ==============================================================================
+class RankingCursorTests(CatalogFixtureMixin, TestCase):
+    def first_page(self):
+        page = chat_service.recommendation_service.suggest_laptops({'discounted_price__gte': 0}, 'test', 20000000)
+        self.assertIsNotNone(page['next_cursor'])
+        return page
+
+    def load_more(self, cursor):
+        return self.client.get(reverse('chat:load_more'), {'cursor': cursor})
+
+    def test_cursor_pins_deal_scores_version(self):
+        with mock.patch.object(ranking, 'deal_scores', ('model-a:catalog-a', {})):
+            cursor = self.first_page()['next_cursor']
+            self.assertEqual(self.load_more(cursor).status_code, 200)
+
+        for deal_scores in (('model-b:catalog-a', {}), None):
+            with self.subTest(deal_scores=deal_scores), mock.patch.object(ranking, 'deal_scores', deal_scores):
+                with self.assertRaises(ranking.StaleCursor):
+                    chat_service.recommendation_service.load_more(cursor)
+                self.assertEqual(self.load_more(cursor).status_code, 409)
+
+    def test_pages_follow_pinned_scores(self):
+        # Laptop được cộng điểm giá tốt lên trang đầu; trang sau không lặp lại laptop đó
+        product_id = LaptopInfo.objects.order_by('-discounted_price').values_list('pk', flat=True)[0]
+        with mock.patch.object(ranking, 'deal_scores', ('v1', {product_id: 1.0})):
+            page = self.first_page()
+            self.assertEqual(page['suggested_laptops'][0]['product_id'], product_id)
+            seen = [laptop['product_id'] for laptop in page['suggested_laptops']]
+            cursor = page['next_cursor']
+            while cursor:
+                page = chat_service.recommendation_service.load_more(cursor)
+                seen += [laptop['product_id'] for laptop in page['suggested_laptops']]
+                cursor = page['next_cursor']
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), LaptopInfo.objects.filter(discounted_price__gte=0).count())
+
+    def test_tampered_cursor_is_rejected(self):
+        self.assertEqual(self.load_more('khong-hop-le').status_code, 400)
+
+
+# ==============================================================================
+# TÌM THEO TÊN MÁY
+# ==============================================================================
+class NameLookupTests(CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = name_index.NameIndex.from_catalog(None)
+
+    def setUp(self):
+        # Không có catalog index (CHAT_CATALOG_INDEX=False): laptop được lấy bằng ORM
+        for patcher in (mock.patch.object(name_index, 'index', self.index),
+                        mock.patch.object(catalog_index, 'catalog', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.laptop = LaptopInfo.objects.order_by('pk').values('product_id', 'name').first()
+
+    # (tin nhắn, chuỗi phải có trong tên laptop đứng đầu) - None: không phải gọi tên máy, phải nhường cho pipeline
+    CASES = [
+        ('Dell XPS 14', 'XPS 14'),
+        ('nitro5', 'Nitro 5'),
+        ('tuf a16', 'A16'),
+        ('macbook pro 16 nano', 'MacBook Pro 16'),
+        ('laptop lenovo loq', 'LOQ'),
+        ('MSI Cyborg', 'Cyborg'),
+        ('latitude 5480', 'Latitude 5480'),
+        ('legion slim 5', 'Legion Slim 5'),
+        ('laptop 16gb 144hz', None),
+        ('laptop gaming rtx 4060 dưới 30 triệu', None),
+        ('laptop dell dưới 20 triệu', None),
+        ('tôi cần laptop cho sinh viên IT', None),
+        ('GPU của máy này là 8 hay 10 nhân?', None),
+        ('máy này RAM DDR4 bao nhiêu MHz?', None),
+        ('Giá nâng cấp từ i5 lên i7 bao nhiêu?', None),
+        ('Mình ở Thủ Đức, chi nhánh Thủ Đức Kha Vạn Cân còn hàng không?', None),
+        ('chi nhanh kha van can con hang khong', None),
+        ('Laptop RAM 16GB, SSD 512GB, card rời để lập trình và chơi game', None),
+    ]
+
+    def test_named_and_unnamed_messages(self):
+        names = dict(LaptopInfo.objects.values_list('product_id', 'name'))
+        for message, expected in self.CASES:
+            with self.subTest(message=message):
+                matched = self.index.match(message)
+                if expected is None:
+                    self.assertIsNone(matched)
+                else:
+                    self.assertIsNotNone(matched)
+                    self.assertIn(expected.lower(), names[matched['product_ids'][0]].lower())
+
+    def test_usage_messages_are_not_names(self):
+        # Câu nhu cầu mà persona matcher trả lời được không được khớp tên máy
+        for message, _ in PersonaMatcherTests.CASES:
+            with self.subTest(message=message):
+                self.assertIsNone(self.index.match(message))
+
+    def test_named_query_skips_llm(self):
+        fake = llms_service.FakeLLMService(model_name='fake', latency='fixed:0', error_rate=0)
+        with mock.patch.object(llms_service, 'llms', fake):
+            response = async_to_sync(chat_service.acompute_message)('Dell XPS 14 giá bao nhiêu?')
+        self.assertEqual(fake.calls, 0)
+        self.assertIn('named_query', response['ai_response'])
+        self.assertIn('XPS 14', response['ai_response']['suggested_laptops'][0]['name'])
+
+    def test_async_lookup_uses_async_orm(self):
+        named = async_to_sync(chat_service.recommendation_service.arecommend_by_name)(self.laptop['name'])
+        self.assertIsNotNone(named)
+        self.assertIn(self.laptop['product_id'], [laptop['product_id'] for laptop in named['suggested_laptops']])
+        self.assertEqual(named, chat_service.recommendation_service.recommend_by_name(self.laptop['name']))
+
+    def test_async_paths_answer_named_queries(self):
+        # arecommend / astream_message chạy trong event loop: ORM sync ở đây sẽ raise SynchronousOnlyOperation
+        named = async_to_sync(chat_service.recommendation_service.arecommend)(self.laptop['name'], [0])
+        self.assertIn('named_query', named)
+
+        async def stream():
+            return [event async for event in chat_service.astream_message(self.laptop['name'])]
+        with mock.patch.object(chat_service.intent_service, 'adetect', mock.AsyncMock(return_value=[])):
+            events = async_to_sync(stream)()
+        self.assertEqual([event for event, _ in events], ['intent', 'response'])
+        self.assertEqual(events[1][1], named)
+
+    def test_budget_in_named_query_filters_results(self):
+        # Fixture có 2 máy MacBook Air 13 (21,09tr và 36,99tr)
+        message = 'MacBook Air 13 dưới 30 triệu'
+        expected = set(LaptopInfo.objects.filter(name__icontains='MacBook Air 13', discounted_price__lt=30000000)
+                       .values_list('pk', flat=True))
+        self.assertEqual(len(expected), 1)
+        self.assertEqual(chat_service.recommendation_service.recommend_by_name('MacBook Air 13')['total_laptops'], 2)
+
+        sync_result = chat_service.recommendation_service.recommend_by_name(message)
+        self.assertEqual({laptop['product_id'] for laptop in sync_result['suggested_laptops']}, expected)
+        self.assertEqual(async_to_sync(chat_service.recommendation_service.arecommend_by_name)(message), sync_result)
+        # Cùng kết quả khi lọc trên catalog index
+        with mock.patch.object(catalog_index, 'catalog', catalog_index.CatalogIndex.from_database()):
+            self.assertEqual(chat_service.recommendation_service.recommend_by_name(message), sync_result)
+
+    def test_no_laptop_within_budget_falls_back_to_intents(self):
+        self.assertIsNone(chat_service.recommendation_service.recommend_by_name('MacBook Air 13 dưới 10 triệu'))
+
+    def test_plain_words_are_not_anchors(self):
+        # Tên đường / địa danh không dấu không phải tên máy: cần chữ số hoặc tên hãng / dòng máy
+        for message in ('chi nhánh Thủ Đức Kha Vạn Cân còn hàng không?', 'chi nhanh kha van can con hang khong'):
+            with self.subTest(message=message):
+                self.assertIsNone(self.index.match(message))
+        self.assertIn('tuf', self.index.known_names)
+
+
+# ==============================================================================
+# LLM GIẢ LẬP
+# ==============================================================================
+class FakeLLMServiceTests(TestCase):
+    def prompt(self, kind):
+        return next(prompt for prompt, prompt_type in PROMPT_TYPES.items() if prompt_type == kind)
+
+    def test_canned_responses_pass_the_pipeline(self):
+        fake = llms_service.get_llm_service('fake', latency='fixed:0', error_rate=0)
+        for response in fake.responses['budget']:
+            with self.subTest(response=response):
+                chat_service.build_budget_filters(response)
+        for response in fake.responses['usage']:
+            with self.subTest(response=response):
+                _, filters = chat_service.parse_usage_response(response)
+                self.assertEqual(filter_compiler.compile_filters(filters).issues, [])
+        for response in fake.responses['group']:
+            with self.subTest(response=response):
+                items = chat_service.valid_persona_items(response)
+                self.assertEqual(len(items), len(response))
+                for item in items:
+                    chat_service.pricing_service.clean(item['prediction_profile'])
+                    self.assertEqual(filter_compiler.compile_filters(item['filters']).issues, [])
+
+    def test_same_message_same_response(self):
+        fake = llms_service.get_llm_service('fake', latency='fixed:0', error_rate=0)
+        other = llms_service.FakeLLMService(model_name='fake', latency='fixed:0', error_rate=0)
+        for kind in PROMPT_TYPES.values():
+            with self.subTest(kind=kind):
+                response = fake.invoke(self.prompt(kind), 'Laptop cho sinh viên IT')
+                json.loads(response)
+                self.assertEqual(fake.invoke(self.prompt(kind), '  LAPTOP cho sinh viên  it'), response)
+                self.assertEqual(async_to_sync(other.ainvoke)(self.prompt(kind), 'laptop cho sinh viên it'), response)
+
+    def test_errors_like_a_real_provider(self):
+        failing = llms_service.FakeLLMService(model_name='fake', latency='fixed:0', error_rate=1)
+        self.assertEqual(failing.invoke(self.prompt('budget'), 'tầm 15 triệu'), failing.ERROR_MESSAGE)
+        self.assertEqual((failing.calls, failing.errors), (1, 1))
+        # Cùng seed -> cùng chuỗi lỗi
+        outcomes = [[fake.invoke(self.prompt('budget'), f'câu {idx}') == fake.ERROR_MESSAGE for idx in range(50)]
+                    for fake in (llms_service.FakeLLMService(model_name='fake', error_rate=0.3, seed=1) for _ in range(2))]
+        self.assertEqual(outcomes[0], outcomes[1])
+        self.assertTrue(any(outcomes[0]) and not all(outcomes[0]))
+
+    def test_parse_latency(self):
+        rng = random.Random(0)
+        self.assertEqual(llms_service.parse_latency('fixed:0.8')(rng), 0.8)
+        self.assertTrue(all(0.3 <= llms_service.parse_latency('uniform:0.3:1.2')(rng) <= 1.2 for _ in range(200)))
+        # Phân phối chuẩn bị cắt ở 0: độ trễ không bao giờ âm
+        self.assertTrue(all(llms_service.parse_latency('normal:0:1')(rng) >= 0 for _ in range(200)))
+        samples = sorted(llms_service.parse_latency(' lognormal:0.8:0.4 ')(rng) for _ in range(2001))
+        self.assertTrue(all(sample > 0 for sample in samples))
+        self.assertAlmostEqual(samples[1000], 0.8, delta=0.05)
+
+    def test_parse_latency_rejects_bad_specs(self):
+        for spec in ('', 'fixed', 'fixed:0.1:0.2', 'uniform:1', 'normal:a:b', 'gamma:1:2', 'lognormal'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                llms_service.parse_latency(spec)
+
+    def test_parse_latencies(self):
+        rng = random.Random(0)
+        latencies = llms_service.parse_latencies('fixed:0.5')
+        self.assertEqual(list(latencies), ['*'])
+        self.assertEqual(latencies['*'](rng), 0.5)
+
+        latencies = llms_service.parse_latencies('budget=fixed:0.3, group=uniform:2:3,*=fixed:0.8')
+        self.assertEqual(set(latencies), {'budget', 'group', '*'})
+        self.assertEqual(latencies['budget'](rng), 0.3)
+        self.assertTrue(2 <= latencies['group'](rng) <= 3)
+        self.assertEqual(latencies['*'](rng), 0.8)
+        # Không khai báo '*' thì mặc định không có độ trễ
+        self.assertEqual(llms_service.parse_latencies('budget=fixed:0.3')['*'](rng), 0)
+        for spec in ('budget=fixed', 'budget=fixed:0.3,usage=', 'budget=fixed:0.3;usage=fixed:1'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                llms_service.parse_latencies(spec)
+
+
+# ==============================================================================
+# CACHE PHẢN HỒI LLM
+# ==============================================================================
+class CachedLLMServiceTests(TestCase):
+    SYSTEM_PROMPT = 'Trích xuất thông tin laptop'
+
+    def fake_llm(self, model_name='fake', error_rate=0):
+        return llms_service.FakeLLMService(model_name=model_name, error_rate=error_rate,
+                                           responses={'other': [{'budget_min': None, 'budget_max': 15000000}]})
+
+    def test_normalized_messages_share_one_entry(self):
+        fake = self.fake_llm()
+        cached = llms_service.CachedLLMService(fake)
+        first = cached.invoke(self.SYSTEM_PROMPT, 'Laptop 15 triệu chơi game')
+        self.assertEqual(cached.invoke(self.SYSTEM_PROMPT, '  laptop 15 TRIỆU   chơi game '), first)
+        # Bản async dùng chung cache với bản sync
+        self.assertEqual(async_to_sync(cached.ainvoke)(self.SYSTEM_PROMPT, 'LAPTOP 15 triệu chơi game'), first)
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual((cached.stats()['hits'], cached.stats()['misses']), (2, 1))
+
+    def test_error_responses_are_not_cached(self):
+        fake = self.fake_llm(error_rate=1)
+        cached = llms_service.CachedLLMService(fake)
+        for _ in range(2):
+            self.assertEqual(cached.invoke(self.SYSTEM_PROMPT, 'laptop gaming'), fake.ERROR_MESSAGE)
+        self.assertEqual(fake.calls, 2)
+        self.assertEqual((cached.stats()['hits'], cached.stats()['uncacheable'], cached.stats()['size']), (0, 2, 0))
+        self.assertFalse(llms_service.CachedLLMService.is_cacheable('Xin lỗi, đã có lỗi xảy ra'))
+        self.assertFalse(llms_service.CachedLLMService.is_cacheable(None))
+        self.assertTrue(llms_service.CachedLLMService.is_cacheable('```json\n{"a": 1}\n```'))
+
+    def test_entries_expire_after_ttl(self):
+        fake = self.fake_llm()
+        cached = llms_service.CachedLLMService(fake, ttl=60)
+        with mock.patch.object(llms_service.time, 'monotonic', return_value=1000.0):
+            cached.invoke(self.SYSTEM_PROMPT, 'laptop gaming')
+        with mock.patch.object(llms_service.time, 'monotonic', return_value=1059.0):
+            cached.invoke(self.SYSTEM_PROMPT, 'laptop gaming')
+        self.assertEqual(fake.calls, 1)
+        with mock.patch.object(llms_service.time, 'monotonic', return_value=1061.0):
+            cached.invoke(self.SYSTEM_PROMPT, 'laptop gaming')
+        self.assertEqual(fake.calls, 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        fake = self.fake_llm()
+        cached = llms_service.CachedLLMService(fake, max_size=2)
+        for message in ['laptop a', 'laptop b', 'laptop a', 'laptop c']:
+            cached.invoke(self.SYSTEM_PROMPT, message)
+        self.assertEqual(cached.stats()['size'], 2)
+        cached.invoke(self.SYSTEM_PROMPT, 'laptop a')
+        self.assertEqual(fake.calls, 3)
+        cached.invoke(self.SYSTEM_PROMPT, 'laptop b')
+        self.assertEqual(fake.calls, 4)
+
+    def test_shared_backend_serves_other_workers(self):
+        backend = LocMemCache('chat-tests-llm', {})
+        fake = self.fake_llm()
+        first = llms_service.CachedLLMService(fake, backend=backend)
+        response = first.invoke(self.SYSTEM_PROMPT, 'laptop gaming')
+        # Worker khác: cache trong process rỗng, đọc được từ backend dùng chung
+        other_worker = llms_service.CachedLLMService(fake, backend=backend)
+        self.assertEqual(other_worker.invoke(self.SYSTEM_PROMPT, 'Laptop  gaming'), response)
+        self.assertEqual(async_to_sync(llms_service.CachedLLMService(fake, backend=backend).ainvoke)(
+            self.SYSTEM_PROMPT, 'laptop gaming'), response)
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(other_worker.stats()['shared_hits'], 1)
+        # Lần sau trong cùng worker là hit trong process
+        other_worker.invoke(self.SYSTEM_PROMPT, 'laptop gaming')
+        self.assertEqual(other_worker.stats()['hits'], 1)
+
+    def test_key_depends_on_system_prompt_and_model(self):
+        cached = llms_service.CachedLLMService(self.fake_llm())
+        key = cached.make_key(self.SYSTEM_PROMPT, 'laptop gaming')
+        self.assertEqual(cached.make_key(self.SYSTEM_PROMPT, 'Laptop  Gaming'), key)
+        self.assertNotEqual(cached.make_key(self.SYSTEM_PROMPT + ' ', 'laptop gaming'), key)
+        other_model = llms_service.CachedLLMService(self.fake_llm(model_name='fake-2'))
+        self.assertNotEqual(other_model.make_key(self.SYSTEM_PROMPT, 'laptop gaming'), key)
+
+
+# ==============================================================================
+# ENCODE JSON VÀ NÉN RESPONSE
+# ==============================================================================
+def sample_payload():
+    """Payload kiểu response gợi ý: tiếng Việt, số thực, Decimal, datetime, lazy string."""
+    return {
+        'persona': 'Sinh viên - Văn phòng',
+        'general_price': 15_990_000,
+        'suggested_laptops': [
+            {'product_id': f'sp-{idx}', 'name': f'Laptop Asus Vivobook {idx} “OLED”', 'discounted_price': 15_990_000.5,
+             'product_weight': Decimal('1.45'), 'cpu_model': None, 'usage': ['Học tập', 'Văn phòng']}
+            for idx in range(60)
+        ],
+        'updated_at': datetime.datetime(2025, 1, 2, 3, 4, 5),
+        'message': gettext_lazy('Xem thêm'),
+    }
+
+
+class SerializationTests(TestCase):
+    def test_json_encoder_matches_django(self):
+        payload = sample_payload()
+        self.assertEqual(json.loads(serialization.json_dumps(payload)),
+                         json.loads(json.dumps(payload, cls=DjangoJSONEncoder)))
+
+    @skipUnless(serialization.orjson is not None, 'chưa cài orjson')
+    def test_orjson_matches_json(self):
+        payload = sample_payload()
+        self.assertEqual(json.loads(serialization.orjson_dumps(payload)), json.loads(serialization.json_dumps(payload)))
+
+    def test_get_encoder(self):
+        self.assertIs(serialization.get_encoder('json'), serialization.json_dumps)
+        self.assertIs(serialization.get_encoder('chat.serialization.json_dumps'), serialization.json_dumps)
+        self.assertIs(serialization.get_encoder('auto'),
+                      serialization.orjson_dumps if serialization.orjson is not None else serialization.json_dumps)
+        with self.assertRaises(ValueError):
+            serialization.get_encoder('ujson')
+
+    def test_json_response(self):
+        response = serialization.JsonResponse({'data': []})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), {'data': []})
+        with self.assertRaises(TypeError):
+            serialization.JsonResponse([])
+
+
+@override_settings(CHAT_COMPRESS_MIN_BYTES=1024)
+class CompressionMiddlewareTests(TestCase):
+    def setUp(self):
+        self.middleware = CompressionMiddleware(lambda request: None)
+        self.factory = RequestFactory()
+
+    def compress(self, response, accept_encoding='gzip'):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return self.middleware.process_response(request, response)
+
+    def large_response(self):
+        return serialization.JsonResponse(sample_payload())
+
+    def test_large_json_is_compressed(self):
+        original = self.large_response().content
+        response = self.compress(self.large_response(), 'gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), original)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    @skipUnless(middleware.brotli is not None, 'chưa cài brotli / brotlicffi')
+    def test_brotli_preferred(self):
+        original = self.large_response().content
+        response = self.compress(self.large_response(), 'gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content), original)
+
+    def test_client_without_compression_still_varies(self):
+        original = self.large_response().content
+        response = self.compress(self.large_response(), 'identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, original)
+        # Cache trung gian không được trả bản chưa nén cho client nhận gzip và ngược lại
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.compress(serialization.JsonResponse({'data': []}))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(json.loads(response.content), {'data': []})
+
+    def test_streaming_and_html_are_not_compressed(self):
+        # SSE phải gửi ngay từng sự kiện; trang HTML có CSRF token (BREACH)
+        streaming = StreamingHttpResponse(iter([b'{}'] * 2000), content_type='application/json')
+        self.assertFalse(self.compress(streaming).has_header('Content-Encoding'))
+        html = HttpResponse('<p>laptop</p>' * 500, content_type='text/html')
+        self.assertFalse(self.compress(html).has_header('Content-Encoding'))
+        encoded = self.large_response()
+        encoded['Content-Encoding'] = 'identity'
+        self.assertEqual(self.compress(encoded)['Content-Encoding'], 'identity')
+
+    def test_strong_etag_becomes_weak(self):
+        response = self.large_response()
+        response['ETag'] = '"abc123"'
+        self.assertEqual(self.compress(response)['ETag'], 'W/"abc123"')
+        response = self.large_response()
+        response['ETag'] = 'W/"abc123"'
+        self.assertEqual(self.compress(response)['ETag'], 'W/"abc123"')
@@ -0,0 +1,14 @@
+import unicodedata
+
+# ==============================================================================
+# CHUẨN HÓA VĂN BẢN TIẾNG VIỆT
+# Người dùng gõ có dấu, không dấu hoặc lẫn lộn ("dưới 20 trieu"). Các bộ đọc bằng luật
+# (budget_parser, persona_matcher) so khớp trên văn bản đã bỏ dấu để xử lý như nhau.
+# ==============================================================================
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt (đ -> d), gộp khoảng trắng."""
+    text = unicodedata.normalize('NFD', str(text).lower().replace('đ', 'd'))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.split())
@@ -9,6 +9,12 @@ urlpatterns = [
     path('intent_detect/', views.intent_detect, name='intent_detect'),
     path('user_message_html/', views.user_message_html, name='user_message_html'),
     path('ai_message_html/', views.ai_message_html, name='ai_message_html'),
+    path('ai_message_stream/', views.ai_message_stream, name='ai_message_stream'),
+    path('load_more/', views.load_more, name='load_more'),
+    path('history/', views.history, name='history'),
     path('delete_all_message/', views.delete_all_message, name='delete_all_message'),
-    path('predict_price/', views.predict_price, name='predict_price')
+    path('predict_price/', views.predict_price, name='predict_price'),
+    path('predict_price_batch/', views.predict_price_batch, name='predict_price_batch'),
+    path('deals/', views.deals, name='deals'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Các view chat (send_message, ai_message_html) là view async, nên production
+chạy qua ASGI để một process giữ được nhiều cuộc chat đang chờ LLM cùng lúc:
+    gunicorn chatbot.asgi:application -k uvicorn_worker.UvicornWorker
 """
 
 import os
@@ -69,7 +69,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', # Đặt ngay sau SecurityMiddleware
+    'core.middleware.AsyncWhiteNoiseMiddleware', # WhiteNoise hỗ trợ async, đặt ngay sau SecurityMiddleware
+    'chat.middleware.TraceMiddleware', # Trace ID (header X-Trace-Id) + thời gian xử lý mỗi request
+    'chat.middleware.CompressionMiddleware', # Nén brotli / gzip các response JSON lớn của chat
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', # Đặt trước CommonMiddleware
     'django.middleware.common.CommonMiddleware',
@@ -89,8 +91,17 @@ TEMPLATES = [
         'DIRS': [
             BASE_DIR / 'templates'
         ],
-        'APP_DIRS': True, # Cho phép Django tìm template trong thư mục 'templates' của mỗi app
         'OPTIONS': {
+            # Template đã compile được giữ trong bộ nhớ (cached loader, kể cả khi DEBUG: Django tự
+            # bỏ cache khi file đổi). Khai báo tường minh thay vì dựa vào cấu hình tự động của django-cotton;
+            # app_directories thay cho APP_DIRS (tìm template trong thư mục 'templates' của mỗi app)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django_cotton.cotton_loader.Loader',
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -127,6 +138,10 @@ DATABASES = {
     }
 }
 
+# Chạy trên một catalog SQLite (vd fixture cho load test / benchmark offline, xem make_catalog_fixture)
+if os.getenv('DB_SQLITE_PATH'):
+    DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.getenv('DB_SQLITE_PATH')}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -213,5 +228,116 @@ DJANGO_VITE = {
     }
 }
 
-# Cung cấp một giá trị mặc định cho môi trường development.
-INTERNAL_API_BASE_URL = os.getenv('INTERNAL_API_BASE_URL', 'http://localhost:8000')
\ No newline at end of file
+# Xử lý song song các persona trong chat (số thread tối đa và deadline theo giây cho từng bước)
+CHAT_PERSONA_MAX_WORKERS = int(os.getenv('CHAT_PERSONA_MAX_WORKERS', '4'))
+# Thread dự phòng cho các task đã quá deadline nhưng chưa dừng (một lần gọi model / query đang chạy dở)
+CHAT_PERSONA_SPARE_WORKERS = int(os.getenv('CHAT_PERSONA_SPARE_WORKERS', '4'))
+CHAT_PRICING_DEADLINE = float(os.getenv('CHAT_PRICING_DEADLINE', '2'))
+CHAT_FILTER_DEADLINE = float(os.getenv('CHAT_FILTER_DEADLINE', '3'))
+
+# Lọc gợi ý laptop trên snapshot catalog trong bộ nhớ thay vì query database mỗi lần
+CHAT_CATALOG_INDEX = os.getenv('CHAT_CATALOG_INDEX', 'True').lower() == 'true'
+
+# Snapshot dữ liệu khởi động (giá trị mặc định, schema, choices) theo checksum catalog ('' = tắt)
+CHAT_STARTUP_SNAPSHOT = os.getenv('CHAT_STARTUP_SNAPSHOT', str(BASE_DIR / 'cache' / 'startup_snapshot.json'))
+# Tải model ML ở thread nền ngay khi khởi động thay vì đợi request đầu tiên
+CHAT_PRELOAD_MODELS = os.getenv('CHAT_PRELOAD_MODELS', 'False').lower() == 'true'
+
+# Dự đoán giá bằng FeatureEncoder (buffer float32 + inplace_predict) thay vì DataFrame + pipeline sklearn
+CHAT_COMPILED_ENCODER = os.getenv('CHAT_COMPILED_ENCODER', 'True').lower() == 'true'
+
+# Phân loại intent: cache LRU theo câu hỏi đã chuẩn hóa, gom các câu hỏi đến trong cùng
+# một cửa sổ (ms) vào một lần gọi model (0 = không gom batch)
+CHAT_INTENT_CACHE_SIZE = int(os.getenv('CHAT_INTENT_CACHE_SIZE', '1024'))
+CHAT_INTENT_BATCH_WINDOW_MS = float(os.getenv('CHAT_INTENT_BATCH_WINDOW_MS', '2'))
+CHAT_INTENT_BATCH_MAX = int(os.getenv('CHAT_INTENT_BATCH_MAX', '32'))
+
+# Nhánh ngân sách: dùng kết quả của budget_parser thay vì gọi LLM khi độ tự tin >= ngưỡng (> 1 = luôn gọi LLM)
+CHAT_BUDGET_PARSER_MIN_CONFIDENCE = float(os.getenv('CHAT_BUDGET_PARSER_MIN_CONFIDENCE', '0.8'))
+# Nhánh nhu cầu sử dụng: dùng persona_matcher thay vì gọi LLM khi độ tự tin >= ngưỡng
+# (1 = chỉ khi khớp đúng một persona, > 1 = luôn gọi LLM)
+CHAT_PERSONA_MATCHER_MIN_CONFIDENCE = float(os.getenv('CHAT_PERSONA_MATCHER_MIN_CONFIDENCE', '1'))
+
+# Gom các request cùng câu hỏi đang chạy đồng thời vào một lần tính (single-flight).
+# Alias trong CACHES để gom cả giữa các worker ('' = chỉ trong process); thời gian tối đa chờ
+# worker khác (giây) và thời gian giữ kết quả cho các worker đang chờ (giây)
+CHAT_SINGLE_FLIGHT = os.getenv('CHAT_SINGLE_FLIGHT', 'True').lower() == 'true'
+CHAT_SINGLE_FLIGHT_ALIAS = os.getenv('CHAT_SINGLE_FLIGHT_ALIAS', '')
+CHAT_SINGLE_FLIGHT_WAIT = float(os.getenv('CHAT_SINGLE_FLIGHT_WAIT', '30'))
+CHAT_SINGLE_FLIGHT_RESULT_TTL = float(os.getenv('CHAT_SINGLE_FLIGHT_RESULT_TTL', '5'))
+
+# Session lưu trong database như mặc định, kèm đo thời gian ghi session
+SESSION_ENGINE = 'chat.session_store'
+
+# Các IP được xem /chat/metrics/ (định dạng Prometheus), phân tách bằng dấu phẩy ('*' = mọi IP)
+CHAT_METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('CHAT_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# Index tên laptop trong bộ nhớ (xem chat.name_index): tin nhắn gọi tên máy cụ thể ("Dell XPS 13")
+# được trả lời thẳng từ catalog, không gọi LLM
+CHAT_NAME_INDEX = os.getenv('CHAT_NAME_INDEX', 'True').lower() == 'true'
+
+# Số laptop gợi ý mỗi trang cho từng nhóm (phần còn lại lấy qua nút "Xem thêm")
+CHAT_SUGGESTION_PAGE_SIZE = int(os.getenv('CHAT_SUGGESTION_PAGE_SIZE', '12'))
+
+# Giá dự đoán + deal score cho toàn catalog (bảng laptop_price_prediction, xem chat.price_catalog):
+# dùng khi xếp hạng gợi ý và cho endpoint deals/. Worker chỉ đọc bảng; tính lại sau khi đổi model hoặc catalog:
+# python manage.py refresh_price_catalog
+CHAT_PRICE_CATALOG = os.getenv('CHAT_PRICE_CATALOG', 'True').lower() == 'true'
+
+# Lịch sử chat (model ChatMessage): số lượt giữ lại tối đa mỗi session (0 = không giới hạn)
+# và số lượt hiển thị mỗi trang (trang chat chỉ render trang cuối, phần cũ hơn tải khi bấm "Xem tin nhắn cũ hơn")
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv('CHAT_HISTORY_MAX_MESSAGES', '50'))
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', '10'))
+
+# Cache HTML đã render của từng lượt chat trong lịch sử (xem chat.rendering): alias trong CACHES
+# ('' = tắt), thời gian giữ (giây) và số fragment tối đa của cache 'render' trong mỗi process
+CHAT_RENDER_CACHE_ALIAS = os.getenv('CHAT_RENDER_CACHE_ALIAS', 'render')
+CHAT_RENDER_CACHE_TTL = float(os.getenv('CHAT_RENDER_CACHE_TTL', '3600'))
+CHAT_RENDER_CACHE_ENTRIES = int(os.getenv('CHAT_RENDER_CACHE_ENTRIES', '500'))
+
+# Encoder JSON của các endpoint chat (xem chat.serialization): 'auto' (orjson nếu đã cài), 'orjson', 'json'
+# hoặc dotted path tới hàm data -> bytes
+CHAT_JSON_ENCODER = os.getenv('CHAT_JSON_ENCODER', 'auto')
+
+# Nén response JSON từ CHAT_COMPRESS_MIN_BYTES byte trở lên (rất lớn = tắt); mức nén brotli (0-11)
+CHAT_COMPRESS_MIN_BYTES = int(os.getenv('CHAT_COMPRESS_MIN_BYTES', '1024'))
+CHAT_BROTLI_QUALITY = int(os.getenv('CHAT_BROTLI_QUALITY', '5'))
+
+# Alias model LLM (xem llms_service._llm_models). 'fake' = FakeLLMService: phản hồi mẫu, không cần mạng,
+# cấu hình qua FAKE_LLM_LATENCY (vd 'lognormal:0.8:0.4' hoặc 'budget=fixed:0.3,*=lognormal:1.5:0.5'),
+# FAKE_LLM_ERROR_RATE, FAKE_LLM_SEED, FAKE_LLM_RESPONSES.
+# Nhiều alias phân tách bằng dấu phẩy (vd 'gemini-2.5-flash,llama3-70b-instruct') = RouterLLMService:
+# hedging, circuit breaker và thứ tự provider theo loại prompt
+CHAT_LLM_MODEL = os.getenv('CHAT_LLM_MODEL', 'gemini-2.5-flash')
+
+# Router: thứ tự provider theo loại prompt (vd 'budget=llama3-70b-instruct,gemini-2.5-flash;*=gemini-2.5-flash,
+# llama3-70b-instruct', '' = xếp theo tỉ lệ lỗi / p50), quantile độ trễ để gửi hedge, thời gian chờ (giây)
+# trước khi hedge khi chưa đủ số liệu, số mẫu thống kê cuộn, số lần lỗi liên tiếp để mở breaker và cooldown (giây)
+CHAT_LLM_ROUTES = os.getenv('CHAT_LLM_ROUTES', '')
+CHAT_LLM_HEDGE_QUANTILE = float(os.getenv('CHAT_LLM_HEDGE_QUANTILE', '0.9'))
+CHAT_LLM_HEDGE_DELAY = float(os.getenv('CHAT_LLM_HEDGE_DELAY', '2.0'))
+CHAT_LLM_STATS_WINDOW = int(os.getenv('CHAT_LLM_STATS_WINDOW', '100'))
+CHAT_LLM_BREAKER_FAILURES = int(os.getenv('CHAT_LLM_BREAKER_FAILURES', '5'))
+CHAT_LLM_BREAKER_COOLDOWN = float(os.getenv('CHAT_LLM_BREAKER_COOLDOWN', '30'))
+
+# Cache phản hồi LLM: số phần tử tối đa trong mỗi process (0 = tắt), TTL theo giây,
+# và alias trong CACHES để chia sẻ giữa các worker ('' = chỉ cache trong process)
+CHAT_LLM_CACHE_SIZE = int(os.getenv('CHAT_LLM_CACHE_SIZE', '1024'))
+CHAT_LLM_CACHE_TTL = float(os.getenv('CHAT_LLM_CACHE_TTL', '3600'))
+CHAT_LLM_CACHE_ALIAS = os.getenv('CHAT_LLM_CACHE_ALIAS', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'llm': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CHAT_LLM_CACHE_DIR', str(BASE_DIR / 'cache' / 'llm')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'render': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chat-render',
+        'OPTIONS': {'MAX_ENTRIES': CHAT_RENDER_CACHE_ENTRIES},
+    },
+}
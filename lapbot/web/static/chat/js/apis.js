@@ -56,6 +56,85 @@ async function postUserMessage(message, role='user') {
     }
 }
 
+// Đọc Server-Sent Events từ /chat/ai_message_stream/ (POST nên không dùng được EventSource)
+// handlers: { intent, shell, persona, message, done, error } -> mỗi hàm nhận data đã parse JSON
+async function streamAiMessage(message, handlers = {}) {
+    const endpoint = '/chat/ai_message_stream/'
+
+    try {
+        const response = await fetch(endpoint, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                data: {
+                    user_message: message
+                }
+            }),
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            // Mỗi sự kiện kết thúc bằng một dòng trống
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    if (line.startsWith('data: ')) data += line.slice(6);
+                });
+
+                if (handlers[event]) {
+                    handlers[event](JSON.parse(data));
+                }
+            }
+        }
+
+    } catch (error) {
+        console.error('Error streaming chat block:', error);
+        if (handlers.error) {
+            handlers.error({ error: error.message });
+        }
+    }
+}
+
+// Lấy trang laptop gợi ý tiếp theo của một nhóm (nút "Xem thêm")
+async function getMoreLaptops(cursor) {
+    try {
+        return await customFetch(`/chat/load_more/?cursor=${encodeURIComponent(cursor)}`)
+    } catch (error) {
+        console.error('Error loading more laptops:', error);
+        return null
+    }
+}
+
+// Lấy các lượt chat cũ hơn lượt có id `before`
+async function getHistory(before) {
+    try {
+        return await customFetch(`/chat/history/?before=${encodeURIComponent(before)}`)
+    } catch (error) {
+        console.error('Error loading chat history:', error);
+        return null
+    }
+}
+
 async function postDataToPredictPrice() {
     let endpoint = '/chat/predict_price/'
     try {
@@ -94,4 +173,4 @@ async function deleteAllMessages() {
 }
 
 
-export { postUserMessage, deleteAllMessages, postDataToPredictPrice }
\ No newline at end of file
+export { postUserMessage, streamAiMessage, getMoreLaptops, getHistory, deleteAllMessages, postDataToPredictPrice }
\ No newline at end of file
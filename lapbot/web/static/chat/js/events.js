@@ -1,4 +1,4 @@
-import { postUserMessage, deleteAllMessages, postDataToPredictPrice } from "./apis";
+import { postUserMessage, streamAiMessage, getMoreLaptops, getHistory, deleteAllMessages, postDataToPredictPrice } from "./apis";
 import { formatCurrency } from '../../global/js/utils'
 
 // import Swiper bundle with all modules installed
@@ -124,6 +124,88 @@ async function appendMessageBlock(message, role='user') {
     }
 }
 
+// Block AI được stream: khung hiện ra trước, từng persona được điền vào khi server xử lý xong
+async function appendAiMessageStream(message) {
+    const parentContainer = document.getElementById('chat-container_response--body')
+    const container = document.createElement('div');
+    parentContainer.appendChild(container);
+
+    const renderInto = (element, html) => {
+        element.innerHTML = html;
+        initSwiper()
+        changeStyleCurrency(element)
+    }
+
+    await streamAiMessage(message, {
+        shell: (data) => {
+            container.innerHTML = data.html;
+        },
+        persona: (data) => {
+            const slot = container.querySelector(`[data-persona-slot="${data.index}"]`)
+            if (slot) {
+                renderInto(slot, data.html)
+            }
+        },
+        message: (data) => {
+            renderInto(container, data.html)
+        },
+        error: (data) => {
+            console.error('Error loading chat block:', data.error);
+        },
+    });
+}
+
+// Thêm trang laptop tiếp theo vào carousel của nhóm tương ứng
+async function loadMoreLaptops(button) {
+    button.disabled = true
+    const data = await getMoreLaptops(button.dataset.loadMore)
+    if (!data) {
+        button.disabled = false
+        return
+    }
+
+    const swiperElement = button.closest('.relative').querySelector('.swiper')
+    // Format giá trên phần tử tạm, tránh format lại các giá đã hiển thị
+    const temp = document.createElement('div')
+    temp.innerHTML = data.html
+    changeStyleCurrency(temp)
+    swiperElement.querySelector('.swiper-wrapper').append(...temp.children)
+
+    if (swiperElement.swiper) {
+        swiperElement.swiper.update()
+        updateNavButtons(swiperElement.swiper)
+    }
+
+    if (data.next_cursor) {
+        button.dataset.loadMore = data.next_cursor
+        button.disabled = false
+    } else {
+        button.remove()
+    }
+}
+
+// Chèn các lượt chat cũ hơn vào đầu khung chat, giữ nguyên vị trí đang xem
+async function loadEarlierMessages(button) {
+    button.disabled = true
+    const data = await getHistory(button.dataset.historyBefore)
+    if (!data) {
+        button.disabled = false
+        return
+    }
+
+    const scrollContainer = document.getElementById('chat-container_response')
+    const previousHeight = scrollContainer.scrollHeight
+
+    const temp = document.createElement('div')
+    temp.innerHTML = data.html
+    changeStyleCurrency(temp)
+    // Trang mới có nút "Xem tin nhắn cũ hơn" riêng (nếu còn), thay cho nút hiện tại
+    button.closest('[data-history-slot]').replaceWith(...temp.children)
+
+    initSwiper()
+    scrollContainer.scrollTop += scrollContainer.scrollHeight - previousHeight
+}
+
 // Run 1 lần duy nhất
 window.addEventListener('DOMContentLoaded', () => {
     // Resize chat input
@@ -159,8 +241,8 @@ window.addEventListener('DOMContentLoaded', () => {
             // Xử lí block user
             appendMessageBlock(currentValue, 'user')
             textarea.value = ''
-            // Xử lí block AI
-            appendMessageBlock(currentValue, 'ai')
+            // Xử lí block AI (stream từng phần)
+            appendAiMessageStream(currentValue)
         }) 
     
     // Dynamic DOM (sử dụng Event Delegation)
@@ -169,6 +251,20 @@ window.addEventListener('DOMContentLoaded', () => {
             // Nếu click để confirm delete -> Call API delete
             const confirmResetChatButton = event.target.closest('#reset-chat_confirm');
 
+            // Nếu click "Xem thêm" -> lấy thêm laptop cho nhóm đó
+            const loadMoreButton = event.target.closest('[data-load-more]');
+
+            if (loadMoreButton) {
+                await loadMoreLaptops(loadMoreButton)
+            }
+
+            // Nếu click "Xem tin nhắn cũ hơn" -> tải trang lịch sử trước đó
+            const historyButton = event.target.closest('[data-history-before]');
+
+            if (historyButton) {
+                await loadEarlierMessages(historyButton)
+            }
+
             if (confirmResetChatButton) {
                 console.log('Click reset chat confirm !! (via delegation)');
                 // Xóa session data BE